@@ -64,6 +64,8 @@ class Object(DefaultObject):
                        object (including exits)
      exits (list of Objects, read-only) - returns all exits from this
                        object, if any
+     characters (list of Objects, read-only) - returns all characters inside
+                       this object, if any
      destination (Object) - only set if this object is an exit.
      is_superuser (bool, read-only) - True/False if this user is a superuser
 
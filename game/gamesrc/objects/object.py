@@ -71,6 +71,8 @@ class Object(DefaultObject):
                        object (including exits)
      exits (list of Objects, read-only) - returns all exits from this
                        object, if any
+     characters (list of Objects, read-only) - returns all characters inside
+                       this object, if any
      destination (Object) - only set if this object is an exit.
      is_superuser (bool, read-only) - True/False if this user is a superuser
 
@@ -926,8 +928,7 @@ class Spider(Mob):
 
         # in this mode, the mob is healed.
         self.db.health = self.db.full_health
-        players = [obj for obj in self.location.contents
-                   if utils.inherits_from(obj, BASE_CHARACTER_TYPECLASS) and not obj.is_superuser]
+        players = [obj for obj in self.location.characters if not obj.is_superuser]
         if players:
             # we found players in the room. Attack.
             self.db.roam_mode = False
@@ -958,8 +959,7 @@ class Spider(Mob):
         to the defeat location.
         """
         last_attacker = self.db.last_attacker
-        players = [obj for obj in self.location.contents
-                   if utils.inherits_from(obj, BASE_CHARACTER_TYPECLASS) and not obj.is_superuser]
+        players = [obj for obj in self.location.characters if not obj.is_superuser]
         if players:
 
             # find a target
@@ -1023,7 +1023,7 @@ class Spider(Mob):
         those that previously attacked it.
         """
         last_attacker = self.db.last_attacker
-        players = [obj for obj in self.location.contents if utils.inherits_from(obj, BASE_CHARACTER_TYPECLASS) and not obj.is_superuser]
+        players = [obj for obj in self.location.characters if not obj.is_superuser]
         if players:
             # we found players in the room. Maybe we caught up with some,
             # or some walked in on us before we had time to pursue them.
@@ -1041,8 +1041,7 @@ class Spider(Mob):
             # to teleport out of bounds.
             players = {}
             for dest in destinations:
-                for obj in [o for o in dest.contents
-                           if utils.inherits_from(o, BASE_CHARACTER_TYPECLASS)]:
+                for obj in dest.characters:
                     players[obj] = dest
             if players:
                 # we found targets. Move to intercept.
@@ -1179,7 +1178,7 @@ class WhompingWillow(DefaultObject):
         the location. If players are defeated, it will whisp them off
         to the defeat location.
         """
-        players = [obj for obj in self.location.contents if utils.inherits_from(obj, BASE_CHARACTER_TYPECLASS) and not obj.is_superuser]
+        players = [obj for obj in self.location.characters if not obj.is_superuser]
         if players:
             for target in players:
                 if target.db.health > 0:
@@ -1273,8 +1272,7 @@ class CannibulusRodent(Mob):
 
         # in this mode, the mob is healed.
         self.db.health = self.db.full_health
-        players = [obj for obj in self.location.contents
-                   if utils.inherits_from(obj, BASE_CHARACTER_TYPECLASS) and not obj.is_superuser]
+        players = [obj for obj in self.location.characters if not obj.is_superuser]
 
         if players:
             # we found players in the room. Attack.
@@ -1309,8 +1307,7 @@ class CannibulusRodent(Mob):
         to the defeat location.
         """
         last_attacker = self.db.last_attacker
-        players = [obj for obj in self.location.contents
-                   if utils.inherits_from(obj, BASE_CHARACTER_TYPECLASS) and not obj.is_superuser]
+        players = [obj for obj in self.location.characters if not obj.is_superuser]
         if players:
             # find a target
             if last_attacker in players: 
@@ -1363,7 +1360,7 @@ class CannibulusRodent(Mob):
         those that previously attacked it.
         """
         last_attacker = self.db.last_attacker
-        players = [obj for obj in self.location.contents if utils.inherits_from(obj, BASE_CHARACTER_TYPECLASS) and not obj.is_superuser]
+        players = [obj for obj in self.location.characters if not obj.is_superuser]
         if players:
             # we found players in the room. Maybe we caught up with some,
             # or some walked in on us before we had time to pursue them.
@@ -1381,8 +1378,7 @@ class CannibulusRodent(Mob):
             # to teleport out of bounds.
             players = {}
             for dest in destinations:
-                for obj in [o for o in dest.contents
-                           if utils.inherits_from(o, BASE_CHARACTER_TYPECLASS)]:
+                for obj in dest.characters:
                     players[obj] = dest
             if players:
                 # we found targets. Move to intercept.
@@ -1520,7 +1516,7 @@ class Dementor(DefaultObject):
         the location. If players are defeated, it will whisp them off
         to the defeat location.
         """
-        players = [obj for obj in self.location.contents if utils.inherits_from(obj, BASE_CHARACTER_TYPECLASS) and not obj.is_superuser]
+        players = [obj for obj in self.location.characters if not obj.is_superuser]
         if players:
             for target in players:
                 if target.db.health > 0:
@@ -1604,7 +1600,7 @@ class Parallax(DefaultObject):
         the location. If players are defeated, it will whisp them off
         to the defeat location.
         """
-        players = [obj for obj in self.location.contents if utils.inherits_from(obj, BASE_CHARACTER_TYPECLASS) and not obj.is_superuser]
+        players = [obj for obj in self.location.characters if not obj.is_superuser]
         if players:
             for target in players:
                 if target.db.will > 0:
@@ -1723,7 +1719,7 @@ class Boggart(DefaultObject):
         the location. If players are defeated, it will whisp them off
         to the defeat location.
         """
-        players = [obj for obj in self.location.contents if utils.inherits_from(obj, BASE_CHARACTER_TYPECLASS) and not obj.is_superuser]
+        players = [obj for obj in self.location.characters if not obj.is_superuser]
         if players:
             for target in players:
                 if target.db.health > 0:
@@ -1788,7 +1784,7 @@ class Medusa(DefaultObject):
         the location. If players are defeated, it will whisp them off
         to the defeat location.
         """
-        players = [obj for obj in self.location.contents if utils.inherits_from(obj, BASE_CHARACTER_TYPECLASS) and not obj.is_superuser]
+        players = [obj for obj in self.location.characters if not obj.is_superuser]
         if players:
             for target in players:
                 if target.db.health > 0:
@@ -2163,7 +2159,7 @@ class Dragon(DefaultObject):
         the location. If players are defeated, it will whisp them off
         to the defeat location.
         """
-        players = [obj for obj in self.location.contents if utils.inherits_from(obj, BASE_CHARACTER_TYPECLASS) and not obj.is_superuser]
+        players = [obj for obj in self.location.characters if not obj.is_superuser]
         damage = 40
         if players:
             for target in players:
@@ -35,21 +35,22 @@ command line. The process is as follows:
 
 """
 
-from weakref import WeakValueDictionary
 from copy import copy
 from traceback import format_exc
 from twisted.internet.defer import inlineCallbacks, returnValue
 from django.conf import settings
 from src.comms.channelhandler import CHANNELHANDLER
+from src.server.caches import get_cmdset_merge_cache, set_cmdset_merge_cache
 from src.utils import logger, utils
 from src.commands.cmdparser import at_multimatch_cmd
 from src.utils.utils import string_suggestions, to_unicode
+from src.utils.dbserialize import flush as flush_attribute_changes
+from src.utils.idmapper.base import flush_write_queue
 
 from django.utils.translation import ugettext as _
 
 __all__ = ("cmdhandler",)
 _GA = object.__getattribute__
-_CMDSET_MERGE_CACHE = WeakValueDictionary()
 
 # This decides which command parser is to be used.
 # You have to restart the server for changes to take effect.
@@ -129,9 +130,12 @@ def get_and_merge_cmdsets(caller, session, player, obj,
             location = None
         if location and not obj_cmdset.no_objs:
             # Gather all cmdsets stored on objects in the room and
-            # also in the caller's inventory and the location itself
-            local_objlist = yield (location.contents_get(exclude=obj.dbobj) +
-                                   obj.contents +
+            # also in the caller's inventory and the location itself.
+            # The locations only return the objects they know to have
+            # cmdsets, so we don't have to check every object present.
+            local_objlist = yield ([lobj for lobj in location.get_cmdset_providers()
+                                    if lobj != obj] +
+                                   obj.get_cmdset_providers() +
                                    [location])
             for lobj in local_objlist:
                 try:
@@ -208,11 +212,9 @@ def get_and_merge_cmdsets(caller, session, player, obj,
 
     if cmdsets:
         # faster to do tuple on list than to build tuple directly
-        mergehash = tuple([id(cmdset) for cmdset in cmdsets])
-        if mergehash in _CMDSET_MERGE_CACHE:
-            # cached merge exist; use that
-            cmdset = _CMDSET_MERGE_CACHE[mergehash]
-        else:
+        mergehash = tuple([cmdset.get_cache_key() for cmdset in cmdsets])
+        cmdset = get_cmdset_merge_cache(mergehash)
+        if cmdset is None:
             # we group and merge all same-prio cmdsets separately (this avoids
             # order-dependent clashes in certain cases, such as
             # when duplicates=True)
@@ -237,8 +239,11 @@ def get_and_merge_cmdsets(caller, session, player, obj,
                 cmdset = yield merging_cmdset + cmdset
             # store the full sets for diagnosis
             cmdset.merged_from = cmdsets
+            # pre-build the command-name trie used by the parser so
+            # it is cached along with the merged set
+            cmdset.get_cmdname_trie()
             # cache
-            _CMDSET_MERGE_CACHE[mergehash] = cmdset
+            set_cmdset_merge_cache(mergehash, cmdset)
     else:
         cmdset = None
 
@@ -403,6 +408,11 @@ def cmdhandler(called_by, raw_string, testing=False, callertype="session", sessi
             # post-command hook
             yield cmd.at_post_cmd()
 
+            # save the changes made to nested Attribute values
+            # and any other queued database writes
+            flush_attribute_changes()
+            flush_write_queue()
+
             if cmd.save_for_next:
                 # store a reference to this command, possibly
                 # accessible by the next command.
@@ -6,6 +6,7 @@ return a CommandCandidates object.
 """
 
 from src.utils.logger import log_trace
+from src.commands.cmdset import _TRIE_END
 from django.utils.translation import ugettext as _
 
 def cmdparser(raw_string, cmdset, caller, match_index=None):
@@ -46,15 +47,26 @@ def cmdparser(raw_string, cmdset, caller, match_index=None):
 
     matches = []
 
-    # match everything that begins with a matching cmdname.
+    # match everything that begins with a matching cmdname. We walk
+    # the cmdset's prefix trie of command names along the input, picking
+    # up all names ending on the way.
     l_raw_string = raw_string.lower()
-    for cmd in cmdset:
+    candidates = []
+    node = cmdset.get_cmdname_trie()
+    for char in l_raw_string:
+        node = node.get(char)
+        if node is None:
+            break
+        if _TRIE_END in node:
+            candidates.extend(node[_TRIE_END])
+    # restore the order of a normal loop over the cmdset, the sorting
+    # below (and thus match_index) depends on it.
+    candidates.sort(key=lambda cand: cand[0])
+    for _prio, cmdname, cmd in candidates:
         try:
-            matches.extend([create_match(cmdname, raw_string, cmd)
-                      for cmdname in [cmd.key] + cmd.aliases
-                        if cmdname and l_raw_string.startswith(cmdname.lower())
-                           and (not cmd.arg_regex or
-                             cmd.arg_regex.match(l_raw_string[len(cmdname):]))])
+            if (not cmd.arg_regex or
+                    cmd.arg_regex.match(l_raw_string[len(cmdname):])):
+                matches.append(create_match(cmdname, raw_string, cmd))
         except Exception:
             log_trace("cmdhandler error. raw_input:%s" % raw_string)
 
@@ -14,11 +14,21 @@ See CmdHandler for practical examples on how to apply cmdsets
 together to create interesting in-game effects.
 """
 
+from itertools import count
 from weakref import WeakKeyDictionary
 from django.utils.translation import ugettext as _
 from src.utils.utils import inherits_from, is_iter
 __all__ = ("CmdSet",)
 
+# key used to store the command matches ending at a given trie node.
+# A command name can never contain the empty string as a character so
+# this cannot clash with the character keys of the trie.
+_TRIE_END = ""
+
+# source of unique ids for cmdset instances. Unlike id() these
+# are never re-used, so they are safe to use in cache keys.
+_CMDSET_UIDS = count(1)
+
 
 class _CmdSetMeta(type):
     """
@@ -135,6 +145,10 @@ class CmdSet(object):
     no_channels = False
     permanent = False
     errmessage = ""
+    # lazily built prefix trie of command names, used by the cmdparser
+    _cmdname_trie = None
+    # bumped every time the commands in this set change
+    _version = 0
     # pre-store properties to duplicate straight off
     to_duplicate = ("key", "cmdsetobj", "no_exits", "no_objs",
                     "no_channels", "permanent", "mergetype",
@@ -161,6 +175,7 @@ class CmdSet(object):
         # initialize system
         self.at_cmdset_creation()
         self._contains_cache = WeakKeyDictionary()#{}
+        self._cmdname_trie = None
 
     # Priority-sensitive merge operations for cmdsets
 
@@ -385,6 +400,7 @@ class CmdSet(object):
                     system_commands[ic] = cmd  # replace
                 except ValueError:
                     system_commands.append(cmd)
+        self._changed()
 
     def remove(self, cmd):
         """
@@ -393,6 +409,7 @@ class CmdSet(object):
         """
         cmd = self._instantiate(cmd)
         self.commands = [oldcmd for oldcmd in self.commands if oldcmd != cmd]
+        self._changed()
 
     def get(self, cmd):
         """
@@ -437,6 +454,57 @@ class CmdSet(object):
             else:
                 unique[cmd.key] = cmd
         self.commands = unique.values()
+        self._changed()
+
+    def _changed(self):
+        """
+        Called whenever the commands of this set change. This resets
+        the cached command-name trie and bumps the version used by the
+        cmdhandler's merge cache.
+        """
+        self._cmdname_trie = None
+        self._version += 1
+
+    def get_cache_key(self):
+        """
+        Returns a key identifying this cmdset in its current state. This
+        changes whenever commands are added to or removed from the set.
+        """
+        try:
+            uid = self._uid
+        except AttributeError:
+            uid = self._uid = _CMDSET_UIDS.next()
+        return (uid, self._version)
+
+    def get_cmdname_trie(self):
+        """
+        Returns a prefix trie of the lower-case keys and aliases of all
+        commands in this cmdset. The trie is built on first call and
+        is then cached on the cmdset until its commands change.
+
+        The trie is a nested dict mapping one character to the next
+        node. Nodes where a command name ends store a list of tuples
+        (order, cmdname, cmd) under the empty-string key, where
+        order is the position the name would have when looping over
+        the cmdset's commands and their key + aliases. This allows
+        the cmdparser to find all command names that the input
+        starts with by walking the input string only once.
+        """
+        trie = self._cmdname_trie
+        if trie is None:
+            trie = {}
+            order = 0
+            for cmd in self.commands:
+                for cmdname in [cmd.key] + cmd.aliases:
+                    if not cmdname:
+                        continue
+                    node = trie
+                    for char in cmdname.lower():
+                        node = node.setdefault(char, {})
+                    node.setdefault(_TRIE_END, []).append((order, cmdname, cmd))
+                    order += 1
+            self._cmdname_trie = trie
+        return trie
 
     def get_all_cmd_keys_and_aliases(self, caller=None):
         """
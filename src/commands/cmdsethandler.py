@@ -274,6 +274,19 @@ class CmdSetHandler(object):
             self.mergetype_stack.append(new_current.actual_mergetype)
         self.current = new_current
 
+        # the location caches which of its contents offer cmdsets,
+        # so it needs to know that ours changed. If the location is
+        # not in the idmapper cache it has no such cache either.
+        try:
+            location_id = self.obj.db_location_id
+        except AttributeError:
+            # players, sessions etc have no location
+            location_id = None
+        if location_id:
+            location = self.obj.get_cached_instance(location_id)
+            if location:
+                location.clear_cmdset_providers()
+
     def add(self, cmdset, emit_to_obj=None, permanent=False):
         """
         Add a cmdset to the handler, on top of the old ones.
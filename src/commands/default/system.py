@@ -14,6 +14,8 @@ from time import time as timemeasure
 
 from django.conf import settings
 #from src.server.caches import get_cache_sizes
+from src.server.caches import get_cmdset_merge_cache_stats, flush_cmdset_merge_cache
+from src.server.amp import AMP_STATS
 from src.server.sessionhandler import SESSIONS
 from src.scripts.models import ScriptDB
 from src.objects.models import ObjectDB
@@ -643,7 +645,30 @@ class CmdServerLoad(MuxCommand):
     loaded by use of the idmapper functionality. This allows Evennia
     to maintain the same instances of an entity and allowing
     non-persistent storage schemes. The total amount of cached objects
-    are displayed plus a breakdown of database object types.
+    are displayed plus a breakdown of database object types. If
+    settings.IDMAPPER_CACHE_MAXNUM is set, each type is cached up to
+    that many entities; the least recently used ones are evicted
+    beyond that.
+
+    The {wmerged cmdset cache{n holds the result of merging the
+    cmdsets available to a caller. A high hit rate means merges are
+    re-used between commands rather than being recalculated.
+
+    {wServer->Portal messages{n are sent to the Portal in batches,
+    the more messages per AMP frame the less overhead.
+
+    {wMCCP compression{n shows how many bytes of telnet output the
+    Portal compressed and what it compressed them to, for all clients
+    supporting MCCP. The {wPortal ANSI render cache{n holds texts
+    already converted to ANSI for the clients; a high hit rate means
+    texts sent to many clients (or many times) are only converted once.
+    {wPortal output queues{n show how often clients lagged behind reading
+    their output, how much output had to be dropped or merged because of
+    it and how many bytes are currently queued for lagging sessions.
+
+    If settings.DATABASE_WRITE_BEHIND is active, the {wdatabase
+    write-behind queue{n shows how many single-field saves were
+    queued and how many of those could be combined with another save.
 
     The {wflushmem{n switch allows to flush the object cache. Please
     note that due to how Python's memory management works, releasing
@@ -688,6 +713,7 @@ class CmdServerLoad(MuxCommand):
             return
 
         if "flushmem" in self.switches:
+            flush_cmdset_merge_cache()
             caller.msg("Flushed object idmapper cache. Python garbage collector recovered memory from %i objects." %  _idmapper.flush_cache())
             return
 
@@ -708,25 +734,96 @@ class CmdServerLoad(MuxCommand):
 
         string = "{wServer CPU and Memory load:{n\n%s" % loadtable
 
+        # merged cmdset cache
+        stats = get_cmdset_merge_cache_stats()
+        lookups = stats["hits"] + stats["misses"]
+        cmdsettable = prettytable.PrettyTable(["property", "statistic"])
+        cmdsettable.align = 'l'
+        cmdsettable.add_row(["Cached merges", "%i" % stats["size"]])
+        cmdsettable.add_row(["Hits / misses", "%i / %i (%.2f%% hits)" % (stats["hits"], stats["misses"],
+                                         float(stats["hits"]) / lookups * 100 if lookups else 0.0)])
+        string += "\n{w Merged cmdset cache:{n\n%s" % cmdsettable
+
+        # database write-behind queue
+        stats = _idmapper.write_queue_stats()
+        if stats["enabled"]:
+            writetable = prettytable.PrettyTable(["property", "statistic"])
+            writetable.align = 'l'
+            writetable.add_row(["Pending saves", "%i" % stats["pending"]])
+            writetable.add_row(["Queued / coalesced", "%i / %i" % (stats["queued"], stats["coalesced"])])
+            writetable.add_row(["Written (flushes)", "%i (%i)" % (stats["written"], stats["flushes"])])
+            string += "\n{w Database write-behind queue:{n\n%s" % writetable
+
+        # Server->Portal message batching
+        amptable = prettytable.PrettyTable(["property", "statistic"])
+        amptable.align = 'l'
+        amptable.add_row(["AMP frames sent", "%i" % AMP_STATS["frames"]])
+        amptable.add_row(["Messages carried", "%i (%.2f per frame)" % (AMP_STATS["messages"],
+                         float(AMP_STATS["messages"]) / AMP_STATS["frames"] if AMP_STATS["frames"] else 0.0)])
+        string += "\n{w Server->Portal messages:{n\n%s" % amptable
+
         if not is_pypy:
             # Cache size measurements are not available on PyPy
             # because it lacks sys.getsizeof
 
             # object cache size
             total_num, cachedict = _idmapper.cache_size()
+            cachestats = _idmapper.cache_stats()
             sorted_cache = sorted([(key, num) for key, num in cachedict.items() if num > 0],
                                     key=lambda tup: tup[1], reverse=True)
             memtable = prettytable.PrettyTable(["entity name",
                                                 "number",
-                                                "idmapper %%"])
+                                                "idmapper %%",
+                                                "hits / misses",
+                                                "evicted"])
             memtable.align = 'l'
             for tup in sorted_cache:
+                stats = cachestats[tup[0]]
                 memtable.add_row([tup[0],
                                  "%i" % tup[1],
-                                 "%.2f" % (float(tup[1]) / total_num * 100)])
+                                 "%.2f" % (float(tup[1]) / total_num * 100),
+                                 "%i / %i" % (stats["hits"], stats["misses"]),
+                                 "%i" % stats["evictions"]])
 
             # get sizes of other caches
             string += "\n{w Entity idmapper cache:{n %i items\n%s" % (total_num, memtable)
 
         caller.msg(string)
 
+        # MCCP compression is done by the Portal, so we need to ask it
+        def _show_mccp(stats):
+            "Show the Portal's MCCP statistics"
+            mccptable = prettytable.PrettyTable(["property", "statistic"])
+            mccptable.align = 'l'
+            mccptable.add_row(["Bytes in / out", "%i / %i" % (stats["bytes_in"], stats["bytes_out"])])
+            mccptable.add_row(["Bandwidth saved", "%.2f%%" % (100 - float(stats["bytes_out"]) / stats["bytes_in"] * 100
+                                                           if stats["bytes_in"] else 0.0)])
+            caller.msg("{w MCCP compression:{n\n%s" % mccptable)
+        SESSIONS.server.amp_protocol.call_remote_FunctionCall("src.server.portal.mccp",
+                                                              "mccp_stats").addCallback(_show_mccp)
+
+        def _show_ansi_cache(stats):
+            "Show the Portal's ANSI render cache statistics"
+            lookups = stats["hits"] + stats["misses"]
+            ansitable = prettytable.PrettyTable(["property", "statistic"])
+            ansitable.align = 'l'
+            ansitable.add_row(["Cached renders", "%i (max %s)" % (stats["size"], stats["maxsize"])])
+            ansitable.add_row(["Hits / misses", "%i / %i (%.2f%% hits)" % (stats["hits"], stats["misses"],
+                                         float(stats["hits"]) / lookups * 100 if lookups else 0.0)])
+            caller.msg("{w Portal ANSI render cache:{n\n%s" % ansitable)
+        SESSIONS.server.amp_protocol.call_remote_FunctionCall("src.utils.ansi",
+                                                              "parse_cache_stats").addCallback(_show_ansi_cache)
+
+        def _show_output_queues(stats):
+            "Show the Portal's output queue statistics"
+            queuetable = prettytable.PrettyTable(["property", "statistic"])
+            queuetable.align = 'l'
+            queuetable.add_row(["Client lag pauses", "%i" % stats["pauses"]])
+            queuetable.add_row(["Lines dropped / merged", "%i / %i" % (stats["dropped"], stats["merged"])])
+            queuetable.add_row(["Bytes queued", "%i" % sum(stats["queued"].values())])
+            for sessid, nbytes in sorted(stats["queued"].items(), key=lambda tup: -tup[1])[:10]:
+                queuetable.add_row(["  session %s" % sessid, "%i" % nbytes])
+            caller.msg("{w Portal output queues:{n\n%s" % queuetable)
+        SESSIONS.server.amp_protocol.call_remote_FunctionCall("src.server.portal.outputqueue",
+                                                              "output_stats").addCallback(_show_output_queues)
+
@@ -6,7 +6,10 @@ See objects.objects for more information on Typeclassing.
 from src.comms import Msg, TempMsg
 from src.typeclasses.typeclass import TypeClass
 from src.utils import logger
-from src.utils.utils import make_iter
+from src.utils.utils import make_iter, to_str
+
+_SESSIONS = None
+_DEFAULT_MSG = None
 
 
 class Channel(TypeClass):
@@ -164,16 +167,35 @@ class Channel(TypeClass):
         """
         Method for grabbing all listeners that a message should be sent to on
         this channel, and sending them a message.
-        """
+
+        The message is sent to the sessions of all listeners in one go
+        (see ServerSessionHandler.data_out_multicast), except to players
+        with a custom msg() method, which is called as normal.
+        """
+        global _SESSIONS, _DEFAULT_MSG
+        if not _SESSIONS:
+            from src.server.sessionhandler import SESSIONS as _SESSIONS
+        if not _DEFAULT_MSG:
+            from src.players.player import Player
+            from src.players.models import PlayerDB
+            _DEFAULT_MSG = (Player.msg.im_func, PlayerDB.msg.im_func)
+
+        text = to_str(msg.message, force_string=True) if msg.message else ""
+        sessions = []
         # get all players connected to this channel and send to them
         for player in self.dbobj.db_subscriptions.all():
             player = player.typeclass
             try:
                 # note our addition of the from_channel keyword here. This could be checked
                 # by a custom player.msg() to treat channel-receives differently.
-                player.msg(msg.message, from_obj=msg.senders, from_channel=self.id)
+                if getattr(player.__class__.msg, "im_func", None) in _DEFAULT_MSG:
+                    sessions.extend(player.dbobj._msg_sessions(text, from_obj=msg.senders,
+                                                               from_channel=self.id))
+                else:
+                    player.msg(msg.message, from_obj=msg.senders, from_channel=self.id)
             except AttributeError, e:
                 logger.log_trace("%s\nCannot send msg to player '%s'." % (e, player))
+        _SESSIONS.data_out_multicast(sessions, text=text, from_channel=self.id)
 
     def msg(self, msgobj, header=None, senders=None, sender_strings=None,
             persistent=False, online=False, emit=False, external=False):
@@ -107,6 +107,7 @@ to any other identifier you can use.
 
 import re
 import inspect
+from collections import OrderedDict
 from django.conf import settings
 from src.utils import logger, utils
 from django.utils.translation import ugettext as _
@@ -134,6 +135,9 @@ def _cache_lockfuncs():
     "Updates the cache."
     global _LOCKFUNCS
     _LOCKFUNCS = {}
+    # compiled and parsed locks refer to the old lock functions
+    _COMPILED_LOCKS.clear()
+    _PARSED_LOCKSTRINGS.clear()
     for modulepath in settings.LOCK_FUNC_MODULES:
         modulepath = utils.pypath_to_realpath(modulepath)
         mod = utils.mod_import(modulepath)
@@ -152,6 +156,124 @@ _RE_SEPS = re.compile(r"(?<=[ )])AND(?=\s)|(?<=[ )])OR(?=\s)|(?<=[ )])NOT(?=\s)"
 _RE_OK = re.compile(r"%s|and|or|not")
 
 
+#
+# Lock compilation
+#
+# A lock definition is compiled into a nested set of closures that
+# evaluates the lock functions with the normal Python precedence
+# (not > and > or) and short-circuits, so 'A or B' never calls B
+# if A passes. Compiled locks only depend on the lock definition,
+# so they are cached here and shared between all lockhandlers with
+# the same lock definition.
+#
+
+_COMPILED_LOCKS = {}
+_COMPILED_LOCKS_MAXSIZE = 10000
+
+# Parsed lock storage strings, shared by all lockhandlers. Most
+# objects of the same kind have identical lockstrings, so this means
+# every distinct lockstring is only parsed once. The least recently
+# used lockstrings are thrown out when the cache is full.
+_PARSED_LOCKSTRINGS = OrderedDict()
+_PARSED_LOCKSTRINGS_MAXSIZE = 5000
+
+
+def _compile_lockfunc(func, args, kwargs):
+    "Compile a single lock function call"
+    def _lockfunc(accessing_obj, accessed_obj):
+        return bool(func(accessing_obj, accessed_obj, *args, **kwargs))
+    return _lockfunc
+
+
+def _compile_not(operand):
+    "Compile a negation"
+    def _not(accessing_obj, accessed_obj):
+        return not operand(accessing_obj, accessed_obj)
+    return _not
+
+
+def _compile_and(operands):
+    "Compile a short-circuiting AND"
+    def _and(accessing_obj, accessed_obj):
+        for operand in operands:
+            if not operand(accessing_obj, accessed_obj):
+                return False
+        return True
+    return _and
+
+
+def _compile_or(operands):
+    "Compile a short-circuiting OR"
+    def _or(accessing_obj, accessed_obj):
+        for operand in operands:
+            if operand(accessing_obj, accessed_obj):
+                return True
+        return False
+    return _or
+
+
+def _compile_lock(evalstring, lock_funcs):
+    """
+    Compile a lock into a callable taking (accessing_obj, accessed_obj)
+    and returning True/False.
+
+    evalstring - the purged evalstring of a lock, a space-separated
+                 sequence of 'and', 'or', 'not' and '%s' (one %s per
+                 lock function, in order).
+    lock_funcs - tuple of (func, args, kwargs) for every lock function.
+
+    Raises ValueError if the evalstring is not a valid expression.
+    """
+    try:
+        key = (evalstring, tuple((func, args, tuple(sorted(kwargs.items())))
+                                 for func, args, kwargs in lock_funcs))
+        return _COMPILED_LOCKS[key]
+    except KeyError:
+        pass
+    except TypeError:
+        # unhashable args/kwargs; compile without caching
+        key = None
+
+    tokens = evalstring.split()
+    funcs = list(lock_funcs)
+    pos = [0]
+
+    def _peek():
+        return tokens[pos[0]] if pos[0] < len(tokens) else None
+
+    def _parse_not():
+        token = _peek()
+        pos[0] += 1
+        if token == "not":
+            return _compile_not(_parse_not())
+        elif token == "%s" and funcs:
+            return _compile_lockfunc(*funcs.pop(0))
+        raise ValueError("Unexpected '%s' in lock." % token)
+
+    def _parse_and():
+        operands = [_parse_not()]
+        while _peek() == "and":
+            pos[0] += 1
+            operands.append(_parse_not())
+        return operands[0] if len(operands) == 1 else _compile_and(tuple(operands))
+
+    def _parse_or():
+        operands = [_parse_and()]
+        while _peek() == "or":
+            pos[0] += 1
+            operands.append(_parse_and())
+        return operands[0] if len(operands) == 1 else _compile_or(tuple(operands))
+
+    compiled = _parse_or()
+    if pos[0] != len(tokens) or funcs:
+        raise ValueError("Lock '%s' could not be fully parsed." % evalstring)
+    if key:
+        if len(_COMPILED_LOCKS) >= _COMPILED_LOCKS_MAXSIZE:
+            _COMPILED_LOCKS.clear()
+        _COMPILED_LOCKS[key] = compiled
+    return compiled
+
+
 #
 #
 # Lock handler
@@ -164,17 +286,41 @@ class LockHandler(object):
     permission checks, under the property 'lockhandler'.
     """
 
-    def __init__(self, obj):
+    def __init__(self, obj, lazy=False):
         """
         Loads and pre-caches all relevant locks and their
         functions.
+
+        lazy - if set, the locks are not parsed until they are
+               first used, which speeds up loading many objects
+               at once. Only use this where no LockException is
+               expected on loading; errors in the lock definitions
+               are then logged when the locks are first used and
+               the object is treated as having no locks.
         """
         if not _LOCKFUNCS:
             _cache_lockfuncs()
         self.obj = obj
-        self.locks = {}
+        self.lazy = lazy
+        self._locks = {}
         self.reset()
 
+    # locks property, parsing the lockstring on first access
+    def __locks_get(self):
+        "Getter. Parses the locks if not done yet."
+        if self._locks is None:
+            try:
+                self._cache_locks(self.obj.lock_storage)
+            except LockException:
+                # don't raise at whatever check happens to come first
+                logger.log_trace("LockHandler on %s: could not parse locks." % self.obj)
+                self._locks = {}
+        return self._locks
+    def __locks_set(self, value):
+        "Setter."
+        self._locks = value
+    locks = property(__locks_get, __locks_set)
+
     def __str__(self):
         return ";".join(self.locks[key][2] for key in sorted(self.locks))
 
@@ -193,6 +339,13 @@ class LockHandler(object):
         locks = {}
         if not storage_lockstring:
             return locks
+        try:
+            # re-use an earlier parse of this lockstring
+            locks = _PARSED_LOCKSTRINGS.pop(storage_lockstring)
+            _PARSED_LOCKSTRINGS[storage_lockstring] = locks
+            return locks
+        except KeyError:
+            pass
         duplicates = 0
         elist = []  # errors
         wlist = []  # warnings
@@ -218,16 +371,17 @@ class LockHandler(object):
                 if not callable(func):
                     elist.append(_("Lock: function '%s' is not available.") % funcstring)
                     continue
-                args = list(arg.strip() for arg in rest.split(',') if arg and not '=' in arg)
-                kwargs = dict([arg.split('=', 1) for arg in rest.split(',') if arg and '=' in arg])
-                lock_funcs.append((func, args, kwargs))
+                args = tuple(arg.strip() for arg in rest.split(',') if arg and not '=' in arg)
+                kwargs = tuple(arg.split('=', 1) for arg in rest.split(',') if arg and '=' in arg)
+                lock_funcs.append((func, args, dict(kwargs)))
                 evalstring = evalstring.replace(funcstring, '%s')
             if len(lock_funcs) < nfuncs:
                 continue
             try:
-                # purge the eval string of any superfluous items, then test it
+                # purge the eval string of any superfluous items, then compile it
                 evalstring = " ".join(_RE_OK.findall(evalstring))
-                eval(evalstring % tuple(True for func in funclist), {}, {})
+                lock_funcs = tuple(lock_funcs)
+                checkfunc = _compile_lock(evalstring, lock_funcs)
             except Exception:
                 elist.append(_("Lock: definition '%s' has syntax errors.") % raw_lockstring)
                 continue
@@ -235,13 +389,18 @@ class LockHandler(object):
                 duplicates += 1
                 wlist.append(_("LockHandler on %(obj)s: access type '%(access_type)s' changed from '%(source)s' to '%(goal)s' " % \
                         {"obj":self.obj, "access_type":access_type, "source":locks[access_type][2], "goal":raw_lockstring}))
-            locks[access_type] = (evalstring, tuple(lock_funcs), raw_lockstring)
+            locks[access_type] = (evalstring, lock_funcs, raw_lockstring, checkfunc)
         if wlist:
             # a warning text was set, it's not an error, so only report
             logger.log_file("\n".join(wlist), WARNING_LOG)
         if elist:
             # an error text was set, raise exception.
             raise LockException("\n".join(elist))
+        # cache the parse; the lock dict is shared between handlers
+        # so it must never be modified in-place.
+        _PARSED_LOCKSTRINGS[storage_lockstring] = locks
+        while len(_PARSED_LOCKSTRINGS) > _PARSED_LOCKSTRINGS_MAXSIZE:
+            _PARSED_LOCKSTRINGS.popitem(last=False)
         # return the gathered locks in an easily executable form
         return locks
 
@@ -309,13 +468,16 @@ class LockHandler(object):
     def get(self, access_type=None):
         "get the full lockstring or the lockstring of a particular access type."
         if access_type:
-            return self.locks.get(access_type, ["", "", ""])[2]
+            return self.locks.get(access_type, ["", "", "", None])[2]
         return str(self)
 
     def delete(self, access_type):
         "Remove a lock from the handler"
         if access_type in self.locks:
-            del self.locks[access_type]
+            # the lock dict may be shared, so we make a copy
+            locks = dict(self.locks)
+            del locks[access_type]
+            self.locks = locks
             self._save_locks()
             return True
         return False
@@ -331,7 +493,11 @@ class LockHandler(object):
         Set the reset flag, so the the lock will be re-cached at next checking.
         This is usually set by @reload.
         """
-        self._cache_locks(self.obj.lock_storage)
+        if self.lazy:
+            # parse on next access
+            self._locks = None
+        else:
+            self._cache_locks(self.obj.lock_storage)
         self.cache_lock_bypass(self.obj)
 
     def check(self, accessing_obj, access_type, default=False, no_superuser_bypass=False):
@@ -349,12 +515,12 @@ class LockHandler(object):
 
         Parsing the lockstring, we (during cache) extract the valid
         lock functions and store their function objects in the right
-        order along with their args/kwargs. These are now executed in
-        sequence, creating a list of True/False values. This is put
-        into the evalstring, which is a string of AND/OR/NOT entries
-        separated by placeholders where each function result should
-        go. We just put those results in and evaluate the string to
-        get a final, combined True/False value for the lockstring.
+        order along with their args/kwargs. The AND/OR/NOT structure
+        of the lock is then compiled into a callable that calls the
+        lock functions as needed, stopping as soon as the outcome is
+        known (so in 'A OR B', B is never called if A passes).
+        Compiled locks are shared by all lockhandlers with the same
+        lock definition.
 
         The important bit with this solution is that the full
         lockstring is never blindly evaluated, and thus there (should
@@ -374,14 +540,10 @@ class LockHandler(object):
                 return True
 
         # no superuser or bypass -> normal lock operation
-        if access_type in self.locks:
+        locks = self.locks
+        if access_type in locks:
             # we have a lock, test it.
-            evalstring, func_tup, raw_string = self.locks[access_type]
-            # execute all lock funcs in the correct order, producing a tuple of True/False results.
-            true_false = tuple(bool(tup[0](accessing_obj, self.obj, *tup[1], **tup[2])) for tup in func_tup)
-            # the True/False tuple goes into evalstring, which combines them
-            # with AND/OR/NOT in order to get the final result.
-            return eval(evalstring % true_false)
+            return locks[access_type][3](accessing_obj, self.obj)
         else:
             return default
 
@@ -403,10 +565,7 @@ class LockHandler(object):
 
         locks = self._parse_lockstring(lockstring)
         for access_type in locks:
-            evalstring, func_tup, raw_string = locks[access_type]
-            true_false = tuple(tup[0](accessing_obj, self.obj, *tup[1],**tup[2])
-                                      for tup in func_tup)
-            return eval(evalstring % true_false)
+            return locks[access_type][3](accessing_obj, self.obj)
 
 
 def _test():
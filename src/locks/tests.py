@@ -15,7 +15,7 @@ except ImportError:
     from django.test import TestCase
 
 from django.conf import settings
-from src.locks import lockfuncs
+from src.locks import lockfuncs, lockhandler
 from src.utils import create
 
 #------------------------------------------------------------
@@ -45,6 +45,46 @@ class TestLockCheck(LockTest):
         self.obj1.locks.add("get:false()")
         self.assertEquals(False, self.obj1.locks.check(self.obj2, 'get'))
         self.assertEquals(True, self.obj1.locks.check(self.obj2, 'not_exist', default=True))
+class TestLockCompile(LockTest):
+    def testrun(self):
+        calls = []
+        def counter(accessing_obj, accessed_obj, *args, **kwargs):
+            calls.append(args[0])
+            return args[0] != "fail"
+        lockhandler._LOCKFUNCS["counter"] = counter
+        try:
+            self.obj1.locks.add("test1:counter(a) or counter(b);test2:counter(fail) and counter(c);"
+                                "test3:not counter(fail) and counter(d) or counter(e)")
+            self.assertEquals(True, self.obj1.locks.check(self.obj2, 'test1', no_superuser_bypass=True))
+            self.assertEquals(["a"], calls)
+            self.assertEquals(False, self.obj1.locks.check(self.obj2, 'test2', no_superuser_bypass=True))
+            self.assertEquals(["a", "fail"], calls)
+            self.assertEquals(True, self.obj1.locks.check(self.obj2, 'test3', no_superuser_bypass=True))
+            self.assertEquals(["a", "fail", "fail", "d"], calls)
+        finally:
+            del lockhandler._LOCKFUNCS["counter"]
+
+class TestLockSharedParse(LockTest):
+    def testrun(self):
+        self.obj1.locks.replace("get:false();view:all()")
+        self.obj2.locks.replace("get:false();view:all()")
+        self.assertTrue(self.obj1.locks.locks is self.obj2.locks.locks)
+        # modifying one handler must not affect the other
+        self.obj1.locks.delete("get")
+        self.assertEquals("", self.obj1.locks.get("get"))
+        self.assertEquals("get:false()", self.obj2.locks.get("get"))
+
+class TestLockLazyParse(LockTest):
+    def testrun(self):
+        class _Obj(object):
+            lock_storage = "get:no_such_lockfunc()"
+        # eager parsing reports bad locks on loading
+        self.assertRaises(lockhandler.LockException, lockhandler.LockHandler, _Obj())
+        # lazy parsing logs them on first use instead
+        handler = lockhandler.LockHandler(_Obj(), lazy=True)
+        self.assertEquals({}, handler.locks)
+        self.assertEquals(False, handler.check(self.obj2, 'get', no_superuser_bypass=True))
+
 class TestLockfuncs(LockTest):
     def testrun(self):
         self.obj2.permissions.add('Wizards')
@@ -37,11 +37,155 @@ from django.utils.translation import ugettext as _
 _ScriptDB = None
 _AT_SEARCH_RESULT = variable_from_module(*settings.SEARCH_AT_RESULT.rsplit('.', 1))
 _SESSIONS = None
+_DEFAULT_MSG = None
 
 _GA = object.__getattribute__
 _SA = object.__setattr__
 _DA = object.__delattr__
 
+_BASE_CHARACTER_TYPECLASS = settings.BASE_CHARACTER_TYPECLASS
+
+
+#------------------------------------------------------------
+#
+# Contents index
+#
+#------------------------------------------------------------
+
+class ContentsIndex(object):
+    """
+    In-memory index of what objects are inside which location,
+    keyed by the id of the location. The contents of a location are
+    loaded from the database the first time they are asked for and
+    are after that kept up to date whenever an object changes its
+    location (see ObjectDB._at_db_location_postsave) or is deleted,
+    so looking up contents or exits doesn't need any queries.
+
+    Locations are indexed lazily; moving an object to a location
+    whose contents were never asked for doesn't index anything.
+    Locations whose objects leave the idmapper cache are dropped
+    from the index again (see prune).
+    """
+    def __init__(self):
+        # location id: {object id: dbobj}
+        self.contents = {}
+        # object id: id of the indexed location it is in
+        self.locations = {}
+        # location id: (contents, exits, characters), dbobjs sorted by id.
+        # A missing entry means they must be rebuilt.
+        self.lists = {}
+
+    def _forget(self, locid):
+        "Drop the indexed contents of location locid"
+        for objid in self.contents.pop(locid, {}):
+            if self.locations.get(objid) == locid:
+                del self.locations[objid]
+        self.lists.pop(locid, None)
+
+    def _load(self, location):
+        "Load the contents of location from the database"
+        locid = _GA(location, "id")
+        self._forget(locid)
+        contents = self.contents[locid] = {}
+        for dbobj in ObjectDB.objects.filter(db_location=location):
+            objid = _GA(dbobj, "id")
+            contents[objid] = dbobj
+            self.locations[objid] = locid
+        # their Attributes are usually looked at next (like when
+        # showing the location), so load them all in one query
+        ObjectDB.objects.prefetch_attributes(contents.values())
+        return contents
+
+    def _is_current(self, contents):
+        """
+        Check that no object in contents has been evicted or
+        re-loaded from the database (like after an idmapper flush)
+        since we indexed it.
+        """
+        get_cached = ObjectDB.get_cached_instance
+        return all(get_cached(objid) is dbobj for objid, dbobj in contents.iteritems())
+
+    def get(self, location):
+        """
+        Get the (contents, exits, characters) of location, as lists
+        of dbobjs. Characters are all objects inheriting from
+        settings.BASE_CHARACTER_TYPECLASS.
+        """
+        locid = _GA(location, "id")
+        contents = self.contents.get(locid)
+        if contents is None or not self._is_current(contents):
+            contents = self._load(location)
+        else:
+            lists = self.lists.get(locid)
+            if lists is not None:
+                return lists
+        dbobjs = [contents[objid] for objid in sorted(contents)]
+        exits = [dbobj for dbobj in dbobjs if _GA(dbobj, "db_destination_id")]
+        characters = [dbobj for dbobj in dbobjs
+                      if _GA(dbobj, "is_typeclass")(_BASE_CHARACTER_TYPECLASS, exact=False)]
+        lists = self.lists[locid] = (dbobjs, exits, characters)
+        return lists
+
+    def prune(self):
+        """
+        Forget all locations that are no longer in the idmapper
+        cache or whose contents are not all cached anymore, so
+        the index doesn't keep evicted objects alive. Such
+        locations are re-indexed when next asked for. This is
+        called whenever the ObjectDB cache is evicted or flushed.
+        """
+        get_cached = ObjectDB.get_cached_instance
+        for locid, contents in self.contents.items():
+            if get_cached(locid) is None or not self._is_current(contents):
+                self._forget(locid)
+
+    def moved(self, obj):
+        """
+        Update the index after obj changed its location (or had
+        its location saved).
+        """
+        objid = _GA(obj, "id")
+        new_locid = _GA(obj, "db_location_id")
+        old_locid = self.locations.get(objid)
+        if old_locid == new_locid:
+            return
+        if old_locid is not None:
+            self.contents.get(old_locid, {}).pop(objid, None)
+            self.lists.pop(old_locid, None)
+            del self.locations[objid]
+        contents = self.contents.get(new_locid)
+        if contents is not None:
+            contents[objid] = obj
+            self.locations[objid] = new_locid
+            self.lists.pop(new_locid, None)
+
+    def changed(self, obj):
+        """
+        Called when obj changed in a way that may affect if it
+        is an exit or character, like a changed destination.
+        """
+        self.lists.pop(self.locations.get(_GA(obj, "id")), None)
+
+    def removed(self, obj):
+        """
+        Remove obj from the index, both as content and as location
+        (this is called when obj is deleted).
+        """
+        objid = _GA(obj, "id")
+        old_locid = self.locations.pop(objid, None)
+        if old_locid is not None:
+            self.contents.get(old_locid, {}).pop(objid, None)
+            self.lists.pop(old_locid, None)
+        self._forget(objid)
+
+    def clear(self):
+        "Empty the index"
+        self.contents = {}
+        self.locations = {}
+        self.lists = {}
+
+_CONTENTS_INDEX = ContentsIndex()
+
 
 #------------------------------------------------------------
 #
@@ -129,6 +273,9 @@ class ObjectDB(TypedObject):
     # caches for quick lookups of typeclass loading.
     _typeclass_paths = settings.OBJECT_TYPECLASS_PATHS
     _default_typeclass_path = settings.BASE_OBJECT_TYPECLASS or "src.objects.objects.Object"
+    # cache of the objects inside this one having cmdsets (see
+    # get_cmdset_providers). None means it must be rebuilt.
+    _cmdset_providers = None
 
     # Add the object-specific handlers
     def __init__(self, *args, **kwargs):
@@ -144,6 +291,45 @@ class ObjectDB(TypedObject):
         # make sure to sync the contents cache when initializing
         #_GA(self, "contents_update")()
 
+    def get_idmapper_pinned(cls):
+        """
+        Objects puppeted by a session, their locations and objects
+        with running scripts are never evicted from the idmapper
+        cache (see src.utils.idmapper.base).
+        """
+        global _SESSIONS, _ScriptDB
+        if not _SESSIONS:
+            from src.server.sessionhandler import SESSIONS as _SESSIONS
+        if not _ScriptDB:
+            from src.scripts.models import ScriptDB as _ScriptDB
+        pinned = set(_SESSIONS.puid_index)
+        for puid in list(pinned):
+            dbobj = cls.get_cached_instance(puid)
+            if dbobj:
+                pinned.add(_GA(dbobj, "db_location_id"))
+        pinned.update(_GA(script, "db_obj_id") for script in _ScriptDB.get_all_cached_instances()
+                      if _GA(script, "db_is_active"))
+        return pinned
+    get_idmapper_pinned = classmethod(get_idmapper_pinned)
+
+    def evict_cached_instances(cls, num):
+        """
+        Also drops evicted objects from the contents index.
+        """
+        evicted = super(ObjectDB, cls).evict_cached_instances(num)
+        if evicted:
+            _CONTENTS_INDEX.prune()
+        return evicted
+    evict_cached_instances = classmethod(evict_cached_instances)
+
+    def flush_instance_cache(cls, force=False):
+        """
+        Also drops flushed objects from the contents index.
+        """
+        super(ObjectDB, cls).flush_instance_cache(force=force)
+        _CONTENTS_INDEX.prune()
+    flush_instance_cache = classmethod(flush_instance_cache)
+
     def _at_db_player_postsave(self):
         """
         This hook is called automatically after the player field is saved.
@@ -151,6 +337,31 @@ class ObjectDB(TypedObject):
         # we need to re-cache this for superusers to bypass.
         self.locks.cache_lock_bypass(self)
 
+    def _at_db_location_postsave(self):
+        """
+        This hook is called automatically after the location field
+        is saved. The new location must re-check which of its contents
+        offer cmdsets.
+        """
+        location = _GA(self, "db_location")
+        if location:
+            _GA(location, "clear_cmdset_providers")()
+        _CONTENTS_INDEX.moved(self)
+
+    def _at_db_destination_postsave(self):
+        """
+        This hook is called automatically after the destination field
+        is saved. This may turn us into an exit (or the opposite).
+        """
+        _CONTENTS_INDEX.changed(self)
+
+    def _at_db_typeclass_path_postsave(self):
+        """
+        This hook is called automatically after the typeclass path
+        is saved. This may turn us into a character (or the opposite).
+        """
+        _CONTENTS_INDEX.changed(self)
+
     # cmdset_storage property. We use a custom wrapper to manage this. This also
     # seems very sensitive to caching, so leaving it be for now. /Griatch
     #@property
@@ -208,6 +419,10 @@ class ObjectDB(TypedObject):
                 is_loc_loop(location)
             except RuntimeWarning:
                 pass
+            # the old location loses us from its contents
+            old_location = _GA(_GA(self, "dbobj"), "db_location")
+            if old_location:
+                _GA(old_location, "clear_cmdset_providers")()
             # actually set the field
             _SA(_GA(self, "dbobj"), "db_location", _GA(location, "dbobj") if location else location)
             _GA(_GA(self, "dbobj"), "save")(update_fields=["db_location"])
@@ -222,8 +437,11 @@ class ObjectDB(TypedObject):
 
     def __location_del(self):
         "Cleanly delete the location reference"
+        old_location = _GA(_GA(self, "dbobj"), "db_location")
+        if old_location:
+            _GA(old_location, "clear_cmdset_providers")()
         _SA(_GA(self, "dbobj"), "db_location", None)
-        _GA(_GA(self, "dbobj"), "save")(upate_fields=["db_location"])
+        _GA(_GA(self, "dbobj"), "save")(update_fields=["db_location"])
     location = property(__location_get, __location_set, __location_del)
 
 
@@ -273,22 +491,78 @@ class ObjectDB(TypedObject):
         This should be publically available.
 
         exclude is one or more objects to not return
+
+        The contents are looked up in the contents index, so only
+        the first lookup of a location queries the database. That
+        lookup also loads the Attributes of all the contents, in
+        one query.
         """
+        contents = _CONTENTS_INDEX.get(_GA(self, "dbobj"))[0]
         if exclude:
-            return ObjectDB.objects.get_contents(self, excludeobj=exclude)
-        return ObjectDB.objects.get_contents(self)
+            exclude = set(obj.id for obj in make_iter(exclude))
+            contents = [dbobj for dbobj in contents if _GA(dbobj, "id") not in exclude]
+        return [_GA(dbobj, "typeclass") for dbobj in contents]
     contents = property(contents_get)
 
+    def get_cmdset_providers(self):
+        """
+        Returns the objects inside this object that currently
+        offer a cmdset, as used by the cmdhandler when gathering
+        the cmdsets available to a caller. This is cached and
+        only rebuilt when the contents of this object change or
+        when the cmdset of one of its contents change, so
+        finding the local cmdsets don't need to look at every
+        object in a crowded room for every command.
+
+        Building the cache calls at_cmdset_get() on all contents,
+        to give objects creating their cmdsets on the fly (like
+        Exits) a chance to do so.
+        """
+        providers = _GA(self, "_cmdset_providers")
+        if providers is not None:
+            # make sure no provider has been deleted or re-loaded
+            # from the database since we cached it
+            get_cached = ObjectDB.get_cached_instance
+            if all(get_cached(_GA(dbobj, "id")) is dbobj for dbobj in providers):
+                return [_GA(dbobj, "typeclass") for dbobj in providers]
+        providers = []
+        for obj in _GA(self, "contents"):
+            try:
+                # call hook in case the cmdset is created dynamically
+                _GA(obj, "at_cmdset_get")()
+            except Exception:
+                logger.log_trace()
+            current = obj.cmdset.current
+            if current and current.key != "_EMPTY_CMDSET":
+                providers.append(_GA(obj, "dbobj"))
+        _SA(self, "_cmdset_providers", providers)
+        return [_GA(dbobj, "typeclass") for dbobj in providers]
+
+    def clear_cmdset_providers(self):
+        """
+        Clear the cache of get_cmdset_providers, forcing it to
+        be rebuilt next time it is used.
+        """
+        _SA(self, "_cmdset_providers", None)
+
     #@property
     def __exits_get(self):
         """
         Returns all exits from this object, i.e. all objects
         at this location having the property destination != None.
         """
-        return [exi for exi in _GA(self, "contents")
-                if exi.destination]
+        return [_GA(dbobj, "typeclass") for dbobj in _CONTENTS_INDEX.get(_GA(self, "dbobj"))[1]]
     exits = property(__exits_get)
 
+    #@property
+    def __characters_get(self):
+        """
+        Returns all characters at this location, i.e. all objects
+        inheriting from settings.BASE_CHARACTER_TYPECLASS.
+        """
+        return [_GA(dbobj, "typeclass") for dbobj in _CONTENTS_INDEX.get(_GA(self, "dbobj"))[2]]
+    characters = property(__characters_get)
+
     #
     # Main Search method
     #
@@ -489,6 +763,15 @@ class ObjectDB(TypedObject):
             if isinstance(data, dict):
                 kwargs.update(data)
 
+        session = _GA(self, "_msg_session")(text, from_obj=from_obj, sessid=sessid, **kwargs)
+        if session:
+            session.msg(text=text, **kwargs)
+
+    def _msg_session(self, text, from_obj=None, sessid=0, **kwargs):
+        """
+        Calls the hooks of msg() and returns the session to send
+        the message to, or None if it should not be sent.
+        """
         if from_obj:
             # call hook
             try:
@@ -498,13 +781,10 @@ class ObjectDB(TypedObject):
         try:
             if not _GA(_GA(self, "typeclass"), "at_msg_receive")(text=text, **kwargs):
                 # if at_msg_receive returns false, we abort message to this object
-                return
+                return None
         except Exception:
             logger.log_trace()
-
-        session = _SESSIONS.session_from_sessid(sessid if sessid else _GA(self, "sessid"))
-        if session:
-            session.msg(text=text, **kwargs)
+        return _SESSIONS.session_from_sessid(sessid if sessid else _GA(self, "sessid"))
 
     def msg_contents(self, message, exclude=None, from_obj=None, **kwargs):
         """
@@ -512,13 +792,39 @@ class ObjectDB(TypedObject):
 
         exclude is a list of objects not to send to. See self.msg() for
                 more info.
+
+        The message is sent to the sessions of all receivers in one
+        go (see ServerSessionHandler.data_out_multicast), except to
+        those with a custom msg() method, which is called as normal.
         """
+        global _SESSIONS, _DEFAULT_MSG
+        if not _SESSIONS:
+            from src.server.sessionhandler import SESSIONS as _SESSIONS
+        if not _DEFAULT_MSG:
+            from src.objects.objects import Object
+            _DEFAULT_MSG = (Object.msg.im_func, ObjectDB.msg.im_func)
+
         contents = _GA(self, "contents")
         if exclude:
             exclude = make_iter(exclude)
             contents = [obj for obj in contents if obj not in exclude]
+        if "data" in kwargs:
+            # deprecation warning
+            logger.log_depmsg("ObjectDB.msg_contents(): 'data'-dict keyword is deprecated. Use **kwargs instead.")
+            data = kwargs.pop("data")
+            if isinstance(data, dict):
+                kwargs.update(data)
+        text = to_str(message, force_string=True) if message else ""
+
+        sessions = []
         for obj in contents:
-            obj.msg(message, from_obj=from_obj, **kwargs)
+            if getattr(_GA(obj, "__class__").msg, "im_func", None) in _DEFAULT_MSG:
+                session = _GA(_GA(obj, "dbobj"), "_msg_session")(text, from_obj=from_obj, **kwargs)
+                if session:
+                    sessions.append(session)
+            else:
+                obj.msg(message, from_obj=from_obj, **kwargs)
+        _SESSIONS.data_out_multicast(sessions, text=text, **kwargs)
 
     def move_to(self, destination, quiet=False,
                 emit_to_obj=None, use_destination=True, to_none=False):
@@ -661,7 +967,7 @@ class ObjectDB(TypedObject):
         Destroys all of the exits and any exits pointing to this
         object as a destination.
         """
-        for out_exit in [exi for exi in ObjectDB.objects.get_contents(self) if exi.db_destination]:
+        for out_exit in _GA(self, "exits"):
             out_exit.delete()
         for in_exit in ObjectDB.objects.filter(db_destination=self):
             in_exit.delete()
@@ -784,6 +1090,11 @@ class ObjectDB(TypedObject):
         #     self.player.user.is_active = False
         #     self.player.user.save(
 
+        # our location should no longer offer our cmdsets
+        location = _GA(self, "db_location")
+        if location:
+            _GA(location, "clear_cmdset_providers")()
+
         # Destroy any exits to and from this room, if any
         _GA(self, "clear_exits")()
         # Clear out any non-exit objects located within the object
@@ -793,5 +1104,6 @@ class ObjectDB(TypedObject):
         _GA(self, "aliases").clear()
 
         # Perform the deletion of the object
+        _CONTENTS_INDEX.removed(self)
         super(ObjectDB, self).delete()
         return True
@@ -80,6 +80,8 @@ class Object(TypeClass):
                          this object (including exits)
          exits (list of Objects, read-only) - returns all exits from this
                      object, if any
+         characters (list of Objects, read-only) - returns all characters inside
+                     this object, if any
          destination (Object) - only set if this object is an exit.
          is_superuser (bool, read-only) - True/False if this user is a superuser
 
@@ -578,6 +580,12 @@ class Object(TypeClass):
         command handler. If changes need to be done on the fly to the cmdset
         before passing them on to the cmdhandler, this is the place to do it.
         This is called also if the object currently have no cmdsets.
+
+        Note that for objects lying around in a location, this is called
+        for every command only as long as the object has a cmdset.
+        Otherwise it is only called when the location re-checks its
+        contents for cmdsets (see ObjectDB.get_cmdset_providers), which
+        happens whenever an object enters or leaves it.
         """
         pass
 
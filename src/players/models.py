@@ -121,6 +121,21 @@ class PlayerDB(TypedObject, AbstractUser):
         #_SA(self, "tags", LazyLoadHandler(self, "tags", TagHandler))
         #_SA(self, "aliases", LazyLoadHandler(self, "aliases", AliasHandler))
 
+    def get_idmapper_pinned(cls):
+        """
+        Players with sessions and players with running scripts are
+        never evicted from the idmapper cache (see
+        src.utils.idmapper.base).
+        """
+        global _SESSIONS
+        if not _SESSIONS:
+            from src.server.sessionhandler import SESSIONS as _SESSIONS
+        pinned = set(_SESSIONS.uid_index)
+        pinned.update(_GA(script, "db_player_id") for script in ScriptDB.get_all_cached_instances()
+                      if _GA(script, "db_is_active"))
+        return pinned
+    get_idmapper_pinned = classmethod(get_idmapper_pinned)
+
     # alias to the objs property
     def __characters_get(self):
         return self.objs
@@ -238,6 +253,14 @@ class PlayerDB(TypedObject, AbstractUser):
                 kwargs.update(data)
 
         text = to_str(text, force_string=True) if text else ""
+        for session in _GA(self, "_msg_sessions")(text, from_obj=from_obj, sessid=sessid, **kwargs):
+            session.msg(text=text, **kwargs)
+
+    def _msg_sessions(self, text, from_obj=None, sessid=None, **kwargs):
+        """
+        Calls the hooks of msg() and returns the sessions to send
+        the message to.
+        """
         if from_obj:
             # call hook
             try:
@@ -249,12 +272,10 @@ class PlayerDB(TypedObject, AbstractUser):
             obj = session.puppet
             if obj and not obj.at_msg_receive(text=text, **kwargs):
                 # if hook returns false, cancel send
-                return
-            session.msg(text=text, **kwargs)
-        else:
-            # if no session was specified, send to them all
-            for sess in _GA(self, 'get_all_sessions')():
-                sess.msg(text=text, **kwargs)
+                return []
+            return [session]
+        # if no session was specified, send to them all
+        return _GA(self, 'get_all_sessions')()
 
     # session-related methods
 
@@ -324,6 +345,7 @@ class PlayerDB(TypedObject, AbstractUser):
         obj.player = self
         session.puid = obj.id
         session.puppet = obj
+        _SESSIONS.index_session(session)
         # validate/start persistent scripts on object
         ScriptDB.objects.validate(obj=obj)
         if normal_mode:
@@ -350,6 +372,7 @@ class PlayerDB(TypedObject, AbstractUser):
         del obj.dbobj.player
         session.puppet = None
         session.puid = None
+        _SESSIONS.index_session(session)
         _GA(obj.typeclass, "at_post_unpuppet")(_GA(self, "typeclass"), sessid=sessid)
         return True
 
@@ -115,6 +115,15 @@ class ScriptDB(TypedObject):
         #_SA(self, "aliases", AliasHandler(self))
 
 
+    def get_idmapper_pinned(cls):
+        """
+        Running scripts are never evicted from the idmapper cache
+        (see src.utils.idmapper.base), their timers refer to them.
+        """
+        return set(_GA(script, "id") for script in cls.get_all_cached_instances()
+                   if _GA(script, "db_is_active"))
+    get_idmapper_pinned = classmethod(get_idmapper_pinned)
+
     #
     #
     # ScriptDB class properties
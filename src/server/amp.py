@@ -18,15 +18,18 @@ Server - (AMP server) Handles all mud operations. The server holds its own list
 
 # imports needed on both server and portal side
 import os
-from collections import defaultdict
+import marshal
+from itertools import count
 try:
     import cPickle as pickle
 except ImportError:
     import pickle
+from django.conf import settings
 from twisted.protocols import amp
-from twisted.internet import protocol
+from twisted.internet import protocol, reactor
 from twisted.internet.defer import Deferred
 from src.utils.utils import to_str, variable_from_module
+from src.server.ampstream import pack_frame, iter_chunks, StreamAssembler
 
 # communication bits
 
@@ -41,7 +44,11 @@ SSYNC = chr(8)        # server session sync
 SCONN = chr(9)        # server creating new connectiong (for irc/imc2 bots etc)
 
 MAXLEN = 65535  # max allowed data length in AMP protocol
-_MSGBUFFER = defaultdict(list)
+BATCH_MAXLEN = MAXLEN # send a message batch early if its text grows beyond this
+
+# Server->Portal messages are sent in batches; this counts the number
+# of AMP frames sent and the number of messages they carried.
+AMP_STATS = {"frames": 0, "messages": 0}
 
 def get_restart_mode(restart_file):
     """
@@ -161,6 +168,22 @@ class MsgServer2Portal(amp.Command):
     response = []
 
 
+class MsgServer2PortalBatch(amp.Command):
+    """
+    Messages server -> portal, many sessions in one go. The
+    data is a list of (sessid, msg, data) tuples, where sessid
+    may also be a tuple of sessids to send the same message to.
+    """
+    key = "MsgServer2PortalBatch"
+    arguments = [('sessid', amp.Integer()),
+                 ('ipart', amp.Integer()),
+                 ('nparts', amp.Integer()),
+                 ('msg', amp.String()),
+                 ('data', amp.String())]
+    errors = [(Exception, 'EXCEPTION')]
+    response = []
+
+
 class ServerAdmin(amp.Command):
     """
     Portal -> Server
@@ -196,6 +219,25 @@ class PortalAdmin(amp.Command):
     response = []
 
 
+class MsgStream(amp.Command):
+    """
+    Bidirectional
+
+    Sent instead of another command if that command's data is too
+    long for one AMP command. Carries one chunk of the command's
+    data, see src.server.ampstream.
+    """
+    key = "MsgStream"
+    arguments = [('msgid', amp.Integer()),
+                 ('command', amp.String()),
+                 ('sessid', amp.Integer()),
+                 ('offset', amp.Integer()),
+                 ('size', amp.Integer()),
+                 ('chunk', amp.String())]
+    errors = [(Exception, 'EXCEPTION')]
+    response = []
+
+
 class FunctionCall(amp.Command):
     """
     Bidirectional
@@ -212,13 +254,91 @@ class FunctionCall(amp.Command):
     response = [('result', amp.String())]
 
 
-# Helper functions
+# Serializers for the data sent between Server and Portal. Which one
+# is used is set by settings.AMP_SERIALIZER.
+
+class PickleSerializer(object):
+    """
+    Pickles all data.
+    """
+    def dumps(self, data):
+        return to_str(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+
+    def loads(self, data):
+        return pickle.loads(to_str(data))
+
+
+# the exact types marshal can handle without losing information
+_MARSHAL_TYPES = frozenset((str, unicode, int, long, float, bool, type(None)))
+_MARSHAL_CONTAINERS = frozenset((tuple, list, set))
+
+
+def _marshallable(data):
+    """
+    Check if data is made up only of exact builtin types. Marshal
+    accepts subclasses (like ANSIString) too, but silently garbles
+    them, so those must be pickled instead.
+    """
+    stack = [data]
+    while stack:
+        item = stack.pop()
+        itype = type(item)
+        if itype in _MARSHAL_TYPES:
+            continue
+        elif itype in _MARSHAL_CONTAINERS:
+            stack.extend(item)
+        elif itype is dict:
+            stack.extend(item.iterkeys())
+            stack.extend(item.itervalues())
+        else:
+            return False
+    return True
+
+
+class CompactSerializer(PickleSerializer):
+    """
+    Skips serialization of empty kwargs and strings, and marshals
+    data made up only of builtin types (such as most OOB payloads),
+    which is faster and more compact than pickle. Everything else,
+    including subclasses of builtin types like ANSIString, is
+    pickled. The first character of the serialized data tells how it
+    was serialized, an empty string is an empty dict.
+    """
+    def dumps(self, data):
+        dtype = type(data)
+        if dtype is dict and not data:
+            return ""
+        elif dtype is str:
+            return "s" + data
+        elif _marshallable(data):
+            return "m" + marshal.dumps(data)
+        return "p" + PickleSerializer.dumps(self, data)
+
+    def loads(self, data):
+        if not data:
+            return {}
+        tag = data[0]
+        if tag == "s":
+            return data[1:]
+        elif tag == "m":
+            return marshal.loads(data[1:])
+        return PickleSerializer.loads(self, data[1:])
+
 
-dumps = lambda data: to_str(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
-loads = lambda data: pickle.loads(to_str(data))
+# Helper functions
 
-# multipart message store
+_SERIALIZER = variable_from_module(*settings.AMP_SERIALIZER.rsplit('.', 1))()
+dumps = _SERIALIZER.dumps
+loads = _SERIALIZER.loads
+# function calls may take and return any objects
+_PICKLE = PickleSerializer()
 
+# the responders of commands that may be streamed with MsgStream
+_STREAM_RESPONDERS = {MsgPortal2Server.key: "amp_msg_portal2server",
+                      MsgServer2Portal.key: "amp_msg_server2portal",
+                      MsgServer2PortalBatch.key: "amp_msg_server2portal_batch",
+                      ServerAdmin.key: "amp_server_admin",
+                      PortalAdmin.key: "amp_portal_admin"}
 
 
 #------------------------------------------------------------
@@ -235,6 +355,16 @@ class AMPProtocol(amp.AMP):
     subclasses that specify the datatypes of the input/output of these methods.
     """
 
+    def __init__(self, *args, **kwargs):
+        amp.AMP.__init__(self, *args, **kwargs)
+        # outgoing Server->Portal messages waiting to be sent
+        self._msgbatch = []
+        self._msgbatch_len = 0
+        self._msgbatch_call = None
+        # streams of too long messages, see safe_send
+        self._stream_msgids = count(1)
+        self._streams = StreamAssembler()
+
     # helper methods
 
     def connectionMade(self):
@@ -255,6 +385,13 @@ class AMPProtocol(amp.AMP):
             if hasattr(self.factory, "server_restart_mode"):
                 del self.factory.server_restart_mode
 
+    def connectionLost(self, reason):
+        """
+        Drop streams which will never be completed.
+        """
+        self._streams.clear()
+        amp.AMP.connectionLost(self, reason)
+
     # Error handling
 
     def errback(self, e, info):
@@ -265,75 +402,55 @@ class AMPProtocol(amp.AMP):
 
     def safe_send(self, command, sessid, **kwargs):
         """
-        This helper method splits the sending of a message into
-        multiple parts with a maxlength of MAXLEN. This is to avoid
-        repetition in two sending commands. when calling this the
-        maximum length has already been exceeded.  The max-length will
-        be checked for all kwargs and these will be used as argument
-        to the command. The command type must have keywords ipart and
-        nparts to track the parts and put them back together on the
-        other side.
+        This helper method sends a command, streaming it if any of
+        its kwargs (all strings) is longer than MAXLEN.
+
+        A streamed command is packed into one frame which is sent in
+        chunks of MAXLEN with MsgStream commands, all tagged with a
+        new message id. The other side puts the frame back together
+        in amp_msg_stream and calls the command's responder.
 
         Returns a deferred or a list of such
         """
-        to_send = [(key, [string[i:i+MAXLEN] for i in range(0, len(string), MAXLEN)])
-                          for key, string in kwargs.items()]
-        nparts_max = max(len(part[1]) for part in to_send)
-        if nparts_max == 1:
-            # first try to send directly
+        for value in kwargs.itervalues():
+            if len(value) > MAXLEN:
+                break
+        else:
+            # the most common case
             return self.callRemote(command,
                                    sessid=sessid,
                                    ipart=0,
                                    nparts=1,
                                    **kwargs).addErrback(self.errback, command.key)
-        else:
-            # one or more parts were too long for MAXLEN.
-            #print "TooLong triggered!"
-            deferreds = []
-            for ipart in range(nparts_max):
-                part_kwargs = {}
-                for key, str_part in to_send:
-                    try:
-                        part_kwargs[key] = str_part[ipart]
-                    except IndexError:
-                        # means this kwarg needed fewer splits
-                        part_kwargs[key] = ""
-                # send this part
-                #print "amp safe sending:", ipart, nparts_max, str_part
-                deferreds.append(self.callRemote(
-                                 command,
-                                 sessid=sessid,
-                                 ipart=ipart,
-                                 nparts=nparts_max,
-                                 **part_kwargs).addErrback(self.errback, command.key))
-            return deferreds
+        frame = pack_frame(**kwargs)
+        msgid, size = self._stream_msgids.next(), len(frame)
+        return [self.callRemote(MsgStream,
+                                msgid=msgid,
+                                command=command.key,
+                                sessid=sessid,
+                                offset=offset,
+                                size=size,
+                                chunk=chunk).addErrback(self.errback, command.key)
+                for offset, chunk in iter_chunks(frame, MAXLEN)]
 
     def safe_recv(self, command, sessid, ipart, nparts, **kwargs):
         """
-        Safely decode potentially split data coming over the wire. No
-        decoding or parsing is done here, only merging of data split
-        with safe_send().
-        If the data stream is not yet complete, this method will return
-        None, otherwise it will return a dictionary of the (possibly
-        merged) properties.
+        Returns the received command's kwargs. Commands too long to
+        send in one go are streamed (see safe_send), so they always
+        arrive here in one part.
         """
-        global _MSGBUFFER
-        if nparts == 1:
-            # the most common case
-            return kwargs
-        else:
-            # part of a multi-part send
-            hashid = "%s_%s" % (command.key, sessid)
-            #print "amp safe receive:", ipart, nparts-1, kwargs
-            if ipart < nparts-1:
-                # not yet complete
-                _MSGBUFFER[hashid].append(kwargs)
-                return
-            else:
-                # all parts in place, put them back together
-                buf = _MSGBUFFER.pop(hashid) + [kwargs]
-                recv_kwargs = dict((key, "".join(kw[key] for kw in buf)) for key in kwargs)
-                return recv_kwargs
+        return kwargs
+
+    def amp_msg_stream(self, msgid, command, sessid, offset, size, chunk):
+        """
+        Receives a chunk of a streamed command, and calls the responder
+        of the command when all its chunks have arrived.
+        """
+        kwargs = self._streams.add(msgid, offset, size, chunk)
+        if kwargs is not None:
+            getattr(self, _STREAM_RESPONDERS[command])(sessid=sessid, ipart=0, nparts=1, **kwargs)
+        return {}
+    MsgStream.responder(amp_msg_stream)
 
     # Message definition + helper methods to call/create each message type
 
@@ -343,9 +460,8 @@ class AMPProtocol(amp.AMP):
         """
         Relays message to server. This method is executed on the Server.
 
-        Since AMP has a limit of 65355 bytes per message, it's possible the
-        data comes in multiple chunks; if so (nparts>1) we buffer the data
-        and wait for the remaining parts to arrive before continuing.
+        Since AMP has a limit of 65355 bytes per message, longer
+        messages are streamed and end up here via amp_msg_stream.
         """
         #print "msg portal -> server (server side):", sessid, msg, data
         ret = self.safe_recv(MsgPortal2Server, sessid, ipart, nparts,
@@ -385,11 +501,74 @@ class AMPProtocol(amp.AMP):
     def call_remote_MsgServer2Portal(self, sessid, msg, data=""):
         """
         Access method called by the Server and executed on the Server.
+
+        The message is not sent right away but added to a batch which
+        is sent at the end of the current reactor tick (or as soon as
+        it grows too big), so that many messages (like to everyone in
+        a room) travel to the Portal in one AMP frame.
         """
         #print "msg server->portal (server side):", sessid, msg, data
-        return self.safe_send(MsgServer2Portal, sessid,
-                              msg=to_str(msg) if msg is not None else "",
-                              data=dumps(data))
+        self._batch_msg(sessid, msg, data)
+
+    def call_remote_MsgServer2PortalMulticast(self, sessids, msg, data=""):
+        """
+        Access method called by the Server and executed on the Server.
+
+        Sends the same message to many sessions. The message is only
+        serialized once for all of them and the Portal renders it
+        once per type of client. It is batched like other messages.
+        """
+        self._batch_msg(tuple(sessids), msg, data)
+
+    def _batch_msg(self, key, msg, data):
+        """
+        Adds a message to the Server->Portal batch. key is a sessid
+        or a tuple of sessids for a multicast. The batch is sent at
+        the end of the reactor tick or as soon as it grows too big.
+        """
+        msg = to_str(msg) if msg is not None else ""
+        self._msgbatch.append((key, msg, data))
+        self._msgbatch_len += len(msg)
+        if self._msgbatch_len >= BATCH_MAXLEN:
+            self.send_MsgServer2Portal_batch()
+        elif not self._msgbatch_call:
+            self._msgbatch_call = reactor.callLater(0, self.send_MsgServer2Portal_batch)
+
+    def send_MsgServer2Portal_batch(self):
+        """
+        Send all batched Server->Portal messages. A batch of only one
+        message is sent as a normal MsgServer2Portal.
+        """
+        if self._msgbatch_call and self._msgbatch_call.active():
+            self._msgbatch_call.cancel()
+        self._msgbatch_call = None
+        if not self._msgbatch:
+            return
+        batch = self._msgbatch
+        self._msgbatch, self._msgbatch_len = [], 0
+        AMP_STATS["frames"] += 1
+        AMP_STATS["messages"] += len(batch)
+        if len(batch) == 1 and not isinstance(batch[0][0], tuple):
+            sessid, msg, data = batch[0]
+            return self.safe_send(MsgServer2Portal, sessid, msg=msg, data=dumps(data))
+        return self.safe_send(MsgServer2PortalBatch, 0, msg="", data=dumps(batch))
+
+    def amp_msg_server2portal_batch(self, sessid, ipart, nparts, msg, data):
+        """
+        Relays a batch of messages to the Portal. This method is executed
+        on the Portal.
+        """
+        ret = self.safe_recv(MsgServer2PortalBatch, sessid,
+                             ipart, nparts, text=msg, data=data)
+        if ret is not None:
+            portal_sessionhandler = self.factory.portal.sessions
+            for sessid, text, kwargs in loads(ret["data"]):
+                if isinstance(sessid, tuple):
+                    portal_sessionhandler.data_out_multicast(sessid, text=text, **kwargs)
+                else:
+                    portal_sessionhandler.data_out(sessid, text=text, **kwargs)
+        return {}
+    MsgServer2PortalBatch.responder(amp_msg_server2portal_batch)
 
     # Server administration from the Portal side
     def amp_server_admin(self, sessid, ipart, nparts, operation, data):
@@ -485,6 +664,9 @@ class AMPProtocol(amp.AMP):
         """
         Access method called by the server side.
         """
+        # messages sent before this must arrive first (like the
+        # last text to a session before it is disconnected)
+        self.send_MsgServer2Portal_batch()
         self.safe_send(PortalAdmin, sessid, operation=operation, data=dumps(data))
 
     # Extra functions
@@ -494,8 +676,8 @@ class AMPProtocol(amp.AMP):
         This allows Portal- and Server-process to call an arbitrary function
         in the other process. It is intended for use by plugin modules.
         """
-        args = loads(args)
-        kwargs = loads(kwargs)
+        args = _PICKLE.loads(args)
+        kwargs = _PICKLE.loads(kwargs)
 
         # call the function (don't catch tracebacks here)
         result = variable_from_module(module, function)(*args, **kwargs)
@@ -503,10 +685,10 @@ class AMPProtocol(amp.AMP):
         if isinstance(result, Deferred):
             # if result is a deferred, attach handler to properly
             # wrap the return value
-            result.addCallback(lambda r: {"result": dumps(r)})
+            result.addCallback(lambda r: {"result": _PICKLE.dumps(r)})
             return result
         else:
-            return {'result': dumps(result)}
+            return {'result': _PICKLE.dumps(result)}
     FunctionCall.responder(amp_function_call)
 
     def call_remote_FunctionCall(self, modulepath, functionname, *args, **kwargs):
@@ -527,5 +709,5 @@ class AMPProtocol(amp.AMP):
         return self.callRemote(FunctionCall,
                                module=modulepath,
                                function=functionname,
-                               args=dumps(args),
-                               kwargs=dumps(kwargs)).addCallback(lambda r: loads(r["result"])).addErrback(self.errback, "FunctionCall")
+                               args=_PICKLE.dumps(args),
+                               kwargs=_PICKLE.dumps(kwargs)).addCallback(lambda r: _PICKLE.loads(r["result"])).addErrback(self.errback, "FunctionCall")
@@ -0,0 +1,92 @@
+"""
+Streaming of large messages between Server and Portal.
+
+AMP limits every argument of a command to MAXLEN (65535) bytes. Messages
+larger than that are sent as a stream instead: the keyword arguments of
+the command are packed into one length-prefixed frame which is cut into
+chunks and sent with the MsgStream command (see src.server.amp). Every
+stream has its own message id, so streams to the same session can be
+interleaved without mixing up. The receiving side writes the chunks
+directly into a preallocated buffer and unpacks the frame once it is
+complete.
+
+A frame looks like this (all integers in network byte order):
+
+    <nfields:uint16> (<keylen:uint16> <valuelen:uint32> <key> <value>)*
+
+"""
+from struct import Struct
+
+_HEADER = Struct("!H")
+_FIELD = Struct("!HI")
+
+
+def pack_frame(**kwargs):
+    """
+    Pack the keyword arguments (all strings) into one frame.
+    """
+    parts = [_HEADER.pack(len(kwargs))]
+    for key, value in kwargs.iteritems():
+        parts.append(_FIELD.pack(len(key), len(value)))
+        parts.append(key)
+        parts.append(value)
+    return "".join(parts)
+
+
+def unpack_frame(frame):
+    """
+    Unpack a frame (a string or bytearray) back into a dictionary
+    of strings.
+    """
+    view = memoryview(frame)
+    nfields = _HEADER.unpack_from(frame, 0)[0]
+    offset = _HEADER.size
+    kwargs = {}
+    for _ in xrange(nfields):
+        keylen, valuelen = _FIELD.unpack_from(frame, offset)
+        offset += _FIELD.size
+        key = view[offset:offset + keylen].tobytes()
+        offset += keylen
+        kwargs[key] = view[offset:offset + valuelen].tobytes()
+        offset += valuelen
+    return kwargs
+
+
+def iter_chunks(frame, chunksize):
+    """
+    Yield (offset, chunk) for all chunks of at most chunksize
+    bytes in frame.
+    """
+    for offset in xrange(0, len(frame), chunksize):
+        yield offset, frame[offset:offset + chunksize]
+
+
+class StreamAssembler(object):
+    """
+    Puts streamed frames back together on the receiving side. One
+    assembler is used per connection.
+    """
+    def __init__(self):
+        # msgid: [buffer, bytes received]
+        self.streams = {}
+
+    def add(self, msgid, offset, size, chunk):
+        """
+        Add a chunk of stream msgid, of total length size. Returns
+        the unpacked frame when the stream is complete, None otherwise.
+        """
+        stream = self.streams.get(msgid)
+        if stream is None:
+            stream = self.streams[msgid] = [bytearray(size), 0]
+        stream[0][offset:offset + len(chunk)] = chunk
+        stream[1] += len(chunk)
+        if stream[1] >= size:
+            del self.streams[msgid]
+            return unpack_frame(stream[0])
+        return None
+
+    def clear(self):
+        """
+        Drop all incomplete streams (like when the connection is lost).
+        """
+        self.streams = {}
@@ -7,7 +7,9 @@ from sys import getsizeof
 import os
 import threading
 from collections import defaultdict
+from weakref import WeakValueDictionary
 
+from django.conf import settings
 from src.server.models import ServerConfig
 from src.utils.utils import uses_database, to_str, get_evennia_pids
 
@@ -24,6 +26,8 @@ _IS_MAIN_THREAD = threading.currentThread().getName() == "MainThread"
 
 _ATTR_CACHE = {}
 _PROP_CACHE = defaultdict(dict)
+_CMDSET_MERGE_CACHE = WeakValueDictionary()
+_CMDSET_MERGE_CACHE_STATS = {"hits": 0, "misses": 0}
 
 #------------------------------------------------------------
 # Cache key hash generation
@@ -179,6 +183,50 @@ def flush_prop_cache():
     _PROP_CACHE = defaultdict(dict)
 
 
+#------------------------------------------------------------
+# Merged-cmdset cache - this caches the result of merging a given
+# sequence of cmdsets in the cmdhandler. The key is a tuple of the
+# cmdsets' (uid, version) pairs. The uid is unique for every cmdset
+# instance ever created (unlike id() it is never re-used) and the
+# version is bumped whenever the cmdset changes, so a cached merge
+# can never be stale. Merges are only referenced weakly; they stay
+# cached as long as they are in use (the last executed command holds
+# on to its merged cmdset), so the cache doesn't keep the merged
+# commands and the objects they sit on alive after they are unloaded.
+#------------------------------------------------------------
+
+def get_cmdset_merge_cache(mergehash):
+    "Retrieve a merged cmdset from cache, or None"
+    cmdset = _CMDSET_MERGE_CACHE.get(mergehash)
+    if cmdset is None:
+        _CMDSET_MERGE_CACHE_STATS["misses"] += 1
+    else:
+        _CMDSET_MERGE_CACHE_STATS["hits"] += 1
+    return cmdset
+
+
+def set_cmdset_merge_cache(mergehash, cmdset):
+    "Store a merged cmdset"
+    _CMDSET_MERGE_CACHE[mergehash] = cmdset
+
+
+def flush_cmdset_merge_cache():
+    "Clear the merged-cmdset cache. Returns the number of flushed merges."
+    num = len(_CMDSET_MERGE_CACHE)
+    _CMDSET_MERGE_CACHE.clear()
+    return num
+
+
+def get_cmdset_merge_cache_stats():
+    """
+    Returns a dict with the keys size, hits and misses for the
+    merged-cmdset cache.
+    """
+    stats = dict(_CMDSET_MERGE_CACHE_STATS)
+    stats["size"] = len(_CMDSET_MERGE_CACHE)
+    return stats
+
+
 def get_cache_sizes():
     """
     Get cache sizes, expressed in number of objects and memory size in MB
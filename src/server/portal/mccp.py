@@ -11,14 +11,27 @@ as normal.  Note: On modern hardware you are not likely to notice the
 effect of MCCP unless you have extremely heavy traffic or sits on a
 terribly slow connection.
 
-This protocol is implemented by the telnet protocol importing
-mccp_compress and calling it from its write methods.
+This protocol is implemented by the telnet protocol sending all its
+output through Mccp.write once compression is active. Game text is
+already collected per reactor tick by the session's OutputQueue (see
+outputqueue.py), which hands it over as one block that is flushed
+at once. Other output, like out-of-band data, is buffered here
+instead: everything written during one reactor tick is compressed
+and flushed as one block, which compresses much better than
+flushing every line.
 """
 import zlib
+from django.conf import settings
+from twisted.internet import reactor
 
 # negotiations for v1 and v2 of the protocol
 MCCP = chr(86)
 FLUSH = zlib.Z_SYNC_FLUSH
+_COMPRESSION_LEVEL = settings.MCCP_COMPRESSION_LEVEL
+
+# bytes before (in) and after (out) compression, for all connections
+# to this portal
+MCCP_STATS = {"bytes_in": 0, "bytes_out": 0}
 
 
 def mccp_compress(protocol, data):
@@ -28,6 +41,14 @@ def mccp_compress(protocol, data):
     return data
 
 
+def mccp_stats():
+    """
+    Returns the MCCP totals of this portal. Meant to be called from
+    the Server with AMP's FunctionCall.
+    """
+    return dict(MCCP_STATS)
+
+
 class Mccp(object):
     """
     Implements the MCCP protocol. Add this to a
@@ -44,6 +65,10 @@ class Mccp(object):
 
         self.protocol = protocol
         self.protocol.protocol_flags['MCCP'] = False
+        # bytes before and after compression for this connection
+        self.stats = {"bytes_in": 0, "bytes_out": 0}
+        self._buffer = []
+        self._flush_call = None
         # ask if client will mccp, connect callbacks to handle answer
         self.protocol.will(MCCP).addCallbacks(self.do_mccp, self.no_mccp)
 
@@ -52,6 +77,7 @@ class Mccp(object):
         Called if client doesn't support mccp or chooses to turn it off
         """
         if hasattr(self.protocol, 'zlib'):
+            self.flush()
             del self.protocol.zlib
         self.protocol.protocol_flags['MCCP'] = False
 
@@ -62,4 +88,31 @@ class Mccp(object):
         """
         self.protocol.protocol_flags['MCCP'] = True
         self.protocol.requestNegotiation(MCCP, '')
-        self.protocol.zlib = zlib.compressobj(9)
+        self.protocol.zlib = zlib.compressobj(_COMPRESSION_LEVEL)
+
+    def write(self, data):
+        """
+        Queue data to be sent compressed. All data written during the
+        same reactor tick is compressed and sent in one go.
+        """
+        self._buffer.append(data)
+        if not self._flush_call:
+            self._flush_call = reactor.callLater(0, self.flush)
+
+    def flush(self):
+        """
+        Compress and send all queued data.
+        """
+        if self._flush_call and self._flush_call.active():
+            self._flush_call.cancel()
+        self._flush_call = None
+        if not self._buffer:
+            return
+        data = "".join(self._buffer)
+        self._buffer = []
+        compressed = self.protocol.zlib.compress(data) + self.protocol.zlib.flush(FLUSH)
+        self.stats["bytes_in"] += len(data)
+        self.stats["bytes_out"] += len(compressed)
+        MCCP_STATS["bytes_in"] += len(data)
+        MCCP_STATS["bytes_out"] += len(compressed)
+        self.protocol.transport.write(compressed)
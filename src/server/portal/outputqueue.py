@@ -0,0 +1,181 @@
+"""
+Output queues with backpressure for Portal sessions.
+
+A protocol sends all its game text through an OutputQueue. The queue
+registers itself as a streaming producer with the protocol's transport,
+so Twisted pauses it when the client can't keep up with reading (the
+transport's write buffer is full) and resumes it when the buffer has
+been drained. While paused, text is kept in the queue instead of
+growing the transport buffer without limit.
+
+The queue is bounded by settings.PORTAL_OUTPUT_HIGH_WATERMARK (bytes).
+When that is exceeded, settings.PORTAL_OUTPUT_POLICY decides what
+happens with further text until the queue is back below
+settings.PORTAL_OUTPUT_LOW_WATERMARK:
+
+  "drop"        - new text is dropped.
+  "drop_oldest" - the oldest queued text is dropped to make room.
+  "merge"       - like "drop_oldest", but in addition, while the
+                  client is lagging, text identical to the text
+                  queued just before it is merged with it (sent once,
+                  marked with the number of repeats). This handles
+                  spammy combat output well.
+
+All text written during the same reactor tick is handed to the
+protocol in one go. The client is told how many lines were dropped
+once sending resumes.
+"""
+from collections import deque
+from weakref import WeakSet
+from django.conf import settings
+from twisted.internet import reactor
+from twisted.internet.interfaces import IPushProducer
+from zope.interface import implements
+
+_HIGH_WATERMARK = settings.PORTAL_OUTPUT_HIGH_WATERMARK
+_LOW_WATERMARK = settings.PORTAL_OUTPUT_LOW_WATERMARK
+_POLICY = settings.PORTAL_OUTPUT_POLICY
+
+_MERGE_FORMAT = "%s (x%i)"
+_DROP_NOTICE = "[... %i lines of output dropped ...]"
+
+# totals for all queues of this portal
+OUTPUT_STATS = {"pauses": 0, "dropped": 0, "merged": 0}
+# all current queues, for reporting queued bytes per session
+_QUEUES = WeakSet()
+
+
+def output_stats():
+    """
+    Returns the output queue totals of this portal and the bytes
+    currently queued per session (only sessions with queued
+    output are listed). Meant to be called from the Server with
+    AMP's FunctionCall.
+    """
+    stats = dict(OUTPUT_STATS)
+    stats["queued"] = dict((queue.protocol.sessid, queue.queued_bytes)
+                           for queue in _QUEUES if queue.queued_bytes)
+    return stats
+
+
+class OutputQueue(object):
+    """
+    Bounded output queue for one protocol instance. Text is added
+    with write() and handed in batches to the sink callable, which
+    takes a list of strings and sends them over the connection.
+    """
+    implements(IPushProducer)
+
+    def __init__(self, protocol, sink, policy=_POLICY,
+                 high_watermark=_HIGH_WATERMARK, low_watermark=_LOW_WATERMARK):
+        """
+        protocol - the protocol owning the queue. Its transport is
+                   used for the producer registration.
+        sink - callable(list_of_strings) doing the actual sending.
+        """
+        if policy not in ("drop", "drop_oldest", "merge"):
+            raise ValueError("OutputQueue: unknown policy '%s'." % policy)
+        self.protocol = protocol
+        self.sink = sink
+        self.policy = policy
+        self.high_watermark = high_watermark
+        self.low_watermark = min(low_watermark, high_watermark)
+        # [text, repeats]
+        self.queue = deque()
+        self.queued_bytes = 0
+        self.paused = False
+        self.overflowing = False
+        self.dropped = 0
+        # statistics for this queue
+        self.stats = {"pauses": 0, "dropped": 0, "merged": 0, "max_queued": 0}
+        self._flush_call = None
+        try:
+            protocol.transport.registerProducer(self, True)
+        except (AttributeError, RuntimeError):
+            # the transport doesn't support (or already has) a
+            # producer; we will then never be paused.
+            pass
+        _QUEUES.add(self)
+
+    def _drop(self, entry):
+        "Account for a dropped entry"
+        self.dropped += entry[1]
+        self.stats["dropped"] += entry[1]
+        OUTPUT_STATS["dropped"] += entry[1]
+
+    def write(self, text):
+        """
+        Queue text to be sent at the end of this reactor tick (or
+        when the client has caught up, if it is lagging).
+        """
+        queue = self.queue
+        if self.paused and self.policy == "merge" and queue and queue[-1][0] == text:
+            queue[-1][1] += 1
+            self.stats["merged"] += 1
+            OUTPUT_STATS["merged"] += 1
+        elif self.overflowing and self.policy == "drop":
+            self._drop([text, 1])
+        else:
+            queue.append([text, 1])
+            self.queued_bytes += len(text)
+            if self.queued_bytes > self.stats["max_queued"]:
+                self.stats["max_queued"] = self.queued_bytes
+            if self.queued_bytes > self.high_watermark:
+                self.overflowing = True
+            if self.overflowing and self.policy != "drop":
+                # make room by dropping the oldest text
+                while len(queue) > 1 and self.queued_bytes > self.low_watermark:
+                    entry = queue.popleft()
+                    self.queued_bytes -= len(entry[0])
+                    self._drop(entry)
+                self.overflowing = self.queued_bytes > self.low_watermark
+        if not (self.paused or self._flush_call):
+            self._flush_call = reactor.callLater(0, self.flush)
+
+    def flush(self):
+        """
+        Send all queued text, unless the client is lagging.
+        """
+        if self._flush_call and self._flush_call.active():
+            self._flush_call.cancel()
+        self._flush_call = None
+        if self.paused or not (self.queue or self.dropped):
+            return
+        texts = [_MERGE_FORMAT % (text, repeats) if repeats > 1 else text
+                 for text, repeats in self.queue]
+        if self.dropped:
+            # "drop" drops the newest text, the others the oldest
+            notice = _DROP_NOTICE % self.dropped
+            if self.policy == "drop":
+                texts.append(notice)
+            else:
+                texts.insert(0, notice)
+            self.dropped = 0
+        self.queue.clear()
+        self.queued_bytes = 0
+        self.overflowing = False
+        self.sink(texts)
+
+    # IPushProducer, called by the transport
+
+    def pauseProducing(self):
+        "The transport buffer is full, queue up text from now on."
+        if not self.paused:
+            self.paused = True
+            self.stats["pauses"] += 1
+            OUTPUT_STATS["pauses"] += 1
+
+    def resumeProducing(self):
+        "The transport buffer was drained, send what was queued."
+        self.paused = False
+        self.flush()
+
+    def stopProducing(self):
+        "The connection is closing, throw away the queue."
+        if self._flush_call and self._flush_call.active():
+            self._flush_call.cancel()
+        self._flush_call = None
+        self.queue.clear()
+        self.queued_bytes = 0
+        self.dropped = 0
+        _QUEUES.discard(self)
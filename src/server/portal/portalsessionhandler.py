@@ -27,6 +27,7 @@ class PortalSessionHandler(SessionHandler):
         """
         self.portal = None
         self.sessions = {}
+        self.reset_indexes()
         self.latest_sessid = 0
         self.uptime = time.time()
         self.connection_time = 0
@@ -48,7 +49,7 @@ class PortalSessionHandler(SessionHandler):
         sessid = self.latest_sessid
         session.sessid = sessid
         sessdata = session.get_sync_data()
-        self.sessions[sessid] = session
+        self.add_session(session)
         # sync with server-side
         if self.portal.amp_protocol:  # this is a timing issue
             self.portal.amp_protocol.call_remote_ServerAdmin(sessid,
@@ -61,8 +62,7 @@ class PortalSessionHandler(SessionHandler):
         from the portal side.
         """
         sessid = session.sessid
-        if sessid in self.sessions:
-            del self.sessions[sessid]
+        self.remove_session(sessid)
         del session
         # tell server to also delete this session
         self.portal.amp_protocol.call_remote_ServerAdmin(sessid,
@@ -102,9 +102,8 @@ class PortalSessionHandler(SessionHandler):
         session = self.sessions.get(sessid, None)
         if session:
             session.disconnect(reason)
-            if sessid in self.sessions:
-                # in case sess.disconnect doesn't delete it
-                del self.sessions[sessid]
+            # in case sess.disconnect doesn't delete it
+            self.remove_session(sessid)
             del session
 
     def server_disconnect_all(self, reason=""):
@@ -115,6 +114,7 @@ class PortalSessionHandler(SessionHandler):
             session.disconnect(reason)
             del session
         self.sessions = {}
+        self.reset_indexes()
 
     def server_logged_in(self, sessid, data):
         """
@@ -123,6 +123,7 @@ class PortalSessionHandler(SessionHandler):
         """
         sess = self.get_session(sessid)
         sess.load_sync_data(data)
+        self.index_session(sess)
 
     def server_session_sync(self, serversessions):
         """
@@ -139,9 +140,11 @@ class PortalSessionHandler(SessionHandler):
         # save protocols
         for sessid in to_save:
             self.sessions[sessid].load_sync_data(serversessions[sessid])
+            self.index_session(self.sessions[sessid])
         # disconnect out-of-sync missing protocols
         for sessid in to_delete:
             self.server_disconnect(sessid)
+        self.check_indexes()
 
     def count_loggedin(self, include_unloggedin=False):
         """
@@ -154,8 +157,7 @@ class PortalSessionHandler(SessionHandler):
         Given a session id, retrieve the session (this is primarily
         intended to be called by web clients)
         """
-        return [sess for sess in self.get_sessions(include_unloggedin=True)
-                if hasattr(sess, 'suid') and sess.suid == suid]
+        return self._from_index(self.suid_index, suid)
 
     def data_in(self, session, text="", **kwargs):
         """
@@ -183,4 +185,29 @@ class PortalSessionHandler(SessionHandler):
         if session:
             session.data_out(text=text, **kwargs)
 
+    def data_out_multicast(self, sessids, text=None, **kwargs):
+        """
+        Called by server for relaying the same message to many
+        sessions. The text is only rendered once for every group of
+        sessions with the same render profile (that is, the same
+        client capabilities, see Session.render_profile).
+        """
+        rendered = {}
+        for sessid in sessids:
+            session = self.sessions.get(sessid, None)
+            if not session:
+                continue
+            profile = session.render_profile(**kwargs)
+            if profile is None:
+                session.data_out(text=text, **kwargs)
+                continue
+            if profile not in rendered:
+                try:
+                    rendered[profile] = session.render(text, **kwargs)
+                except Exception:
+                    # let the session report the problem its own way
+                    session.data_out(text=text, **kwargs)
+                    continue
+            session.send_rendered(rendered[profile])
+
 PORTAL_SESSIONS = PortalSessionHandler()
@@ -184,12 +184,23 @@ class SshProtocol(Manhole, session.Session):
         except Exception, e:
             self.lineSend(str(e))
             return
-        raw = kwargs.get("raw", False)
-        nomarkup = kwargs.get("nomarkup", False)
-        if raw:
-            self.lineSend(text)
-        else:
-            self.lineSend(ansi.parse_ansi(text.strip("{r") + "{r", strip_ansi=nomarkup))
+        self.lineSend(self.render(text, **kwargs))
+
+    def render_profile(self, **kwargs):
+        "Key for how text is rendered for this client"
+        return (self.__class__, self.encoding,
+                bool(kwargs.get("raw", False)), bool(kwargs.get("nomarkup", False)))
+
+    def render(self, text, **kwargs):
+        "Convert text to the string sent over the ssh connection"
+        text = utils.to_str(text if text else "", encoding=self.encoding)
+        if kwargs.get("raw", False):
+            return text
+        return ansi.parse_ansi(text.strip("{r") + "{r", strip_ansi=kwargs.get("nomarkup", False))
+
+    def send_rendered(self, string):
+        "Send a string converted with render()"
+        self.lineSend(string)
 
 
 class ExtraInfoAuthServer(SSHUserAuthServer):
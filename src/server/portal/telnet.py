@@ -11,7 +11,8 @@ import re
 from twisted.conch.telnet import Telnet, StatefulTelnetProtocol, IAC, LINEMODE
 from src.server.session import Session
 from src.server.portal import ttype, mssp, msdp
-from src.server.portal.mccp import Mccp, mccp_compress, MCCP
+from src.server.portal.mccp import Mccp, MCCP
+from src.server.portal.outputqueue import OutputQueue
 from src.utils import utils, ansi, logger
 
 _RE_N = re.compile(r"\{n$")
@@ -37,6 +38,9 @@ class TelnetProtocol(Telnet, StatefulTelnetProtocol, Session):
         self.ttype = ttype.Ttype(self)
         # negotiate mccp (data compression) - turn this off for wireshark analysis
         self.mccp = Mccp(self)
+        # game text is queued, so a lagging client can't make us buffer
+        # output without limit
+        self.outqueue = OutputQueue(self, self._send_lines)
         # negotiate mssp (crawler communication)
         self.mssp = mssp.Mssp(self)
         # msdp
@@ -89,6 +93,10 @@ class TelnetProtocol(Telnet, StatefulTelnetProtocol, Session):
         whatever reason. it can also be called directly, from
         the disconnect method
         """
+        self.outqueue.flush()
+        if hasattr(self, "zlib"):
+            # send what is left of the compressed output
+            self.mccp.flush()
         self.sessionhandler.disconnect(self)
         self.transport.loseConnection()
 
@@ -135,15 +143,31 @@ class TelnetProtocol(Telnet, StatefulTelnetProtocol, Session):
         # print "_write (%s): %s" % (self.state,  " ".join(str(ord(c)) for c in data))
         data = data.replace('\n', '\r\n').replace('\r\r\n', '\r\n')
         #data = data.replace('\n', '\r\n')
-        super(TelnetProtocol, self)._write(mccp_compress(self, data))
+        if hasattr(self, "zlib"):
+            # compressed and sent at the end of the reactor tick
+            self.mccp.write(data)
+        else:
+            super(TelnetProtocol, self)._write(data)
 
     def sendLine(self, line):
-        "hook overloading the one used by linereceiver"
+        """
+        hook overloading the one used by linereceiver. The line is
+        queued and sent at the end of the reactor tick (or when the
+        client has caught up, if it is lagging).
+        """
         #print "sendLine (%s):\n%s" % (self.state, line)
+        self.outqueue.write(line)
+
+    def _send_lines(self, lines):
+        "Send lines from the output queue"
         #escape IAC in line mode, and correctly add \r\n
-        line += self.delimiter
-        line = line.replace(IAC, IAC + IAC).replace('\n', '\r\n')
-        return self.transport.write(mccp_compress(self, line))
+        data = self.delimiter.join(lines) + self.delimiter
+        data = data.replace(IAC, IAC + IAC).replace('\n', '\r\n')
+        if hasattr(self, "zlib"):
+            self.mccp.write(data)
+            self.mccp.flush()
+        else:
+            self.transport.write(data)
 
     def lineReceived(self, string):
         """
@@ -206,20 +230,44 @@ class TelnetProtocol(Telnet, StatefulTelnetProtocol, Session):
                     #print "msdp_string:", msdp_string
                     self.msdp.data_out(msdp_string)
 
-        # parse **kwargs, falling back to ttype if nothing is given explicitly
+        self.sendLine(self.render(text, **kwargs))
+
+    def _render_flags(self, kwargs):
+        """
+        Parse the data_out kwargs, falling back to ttype if nothing
+        is given explicitly. Returns (xterm256, raw, nomarkup).
+        """
         ttype = self.protocol_flags.get('TTYPE', {})
         xterm256 = kwargs.get("xterm256", ttype and ttype.get('256 COLORS', False))
         useansi = kwargs.get("ansi", ttype and ttype.get('ANSI', False))
         raw = kwargs.get("raw", False)
         nomarkup = kwargs.get("nomarkup", not (xterm256 or useansi) or not ttype.get("init_done"))
+        return bool(xterm256), bool(raw), bool(nomarkup)
 
+    def render_profile(self, **kwargs):
+        """
+        Key for how text is rendered for this client (see
+        Session.render_profile). OOB instructions are handled per
+        session, so those messages can't share rendering.
+        """
+        if "oob" in kwargs:
+            return None
+        return (self.__class__, self.encoding) + self._render_flags(kwargs)
+
+    def render(self, text, **kwargs):
+        """
+        Convert text to the string sent over the telnet connection.
+        """
+        text = utils.to_str(text if text else "", encoding=self.encoding)
+        xterm256, raw, nomarkup = self._render_flags(kwargs)
         #print "telnet kwargs=%s, message=%s" % (kwargs, text)
-        #print "xterm256=%s, useansi=%s, raw=%s, nomarkup=%s, init_done=%s" % (xterm256, useansi, raw, nomarkup, ttype.get("init_done"))
         if raw:
             # no processing whatsoever
-            self.sendLine(text)
-        else:
-            # we need to make sure to kill the color at the end in order
-            # to match the webclient output.
-            # print "telnet data out:", self.protocol_flags, id(self.protocol_flags), id(self)
-            self.sendLine(ansi.parse_ansi(_RE_N.sub("", text) + "{n", strip_ansi=nomarkup, xterm256=xterm256))
+            return text
+        # we need to make sure to kill the color at the end in order
+        # to match the webclient output.
+        return ansi.parse_ansi(_RE_N.sub("", text) + "{n", strip_ansi=nomarkup, xterm256=xterm256)
+
+    def send_rendered(self, string):
+        "Send a string converted with render()"
+        self.sendLine(string)
@@ -15,13 +15,17 @@ found on http://localhost:8000/webclient.)
                  The WebClient resource in this module will
                  handle these requests and act as a gateway
                  to sessions connected over the webclient.
+                 Every poll returns a list of all messages
+                 buffered since the last one.
 """
 import time
 import json
 
 from hashlib import md5
+from collections import deque
 
 from twisted.web import server, resource
+from twisted.internet import reactor
 
 from django.utils.functional import Promise
 from django.utils.encoding import force_unicode
@@ -32,6 +36,7 @@ from src.server import session
 
 SERVERNAME = settings.SERVERNAME
 ENCODINGS = settings.ENCODINGS
+BUFFER_MAXLEN = settings.WEBCLIENT_BUFFER_MAXLEN
 
 # defining a simple json encoder for returning
 # django data to the client. Might need to
@@ -64,6 +69,10 @@ class WebClient(resource.Resource):
     def __init__(self):
         self.requests = {}
         self.databuffer = {}
+        # number of messages dropped from full buffers
+        self.dropped = {}
+        # scheduled sends to waiting requests
+        self.flushcalls = {}
 
     #def getChild(self, path, request):
     #    """
@@ -80,30 +89,56 @@ class WebClient(resource.Resource):
 
     def lineSend(self, suid, string, data=None):
         """
-        This adds the data to the buffer and/or sends it to
-        the client as soon as possible.
+        This adds the data to the buffer. If we have a request
+        waiting, everything buffered during this reactor tick is
+        sent to it in one go at the end of the tick.
         """
-        request = self.requests.get(suid)
+        dataentries = self.databuffer.get(suid)
+        if dataentries is None:
+            dataentries = self.databuffer[suid] = deque(maxlen=BUFFER_MAXLEN)
+        if len(dataentries) == BUFFER_MAXLEN:
+            # the client is not keeping up, the oldest entry is dropped
+            self.dropped[suid] = self.dropped.get(suid, 0) + 1
+        dataentries.append({'msg': string, 'data': data})
+        if suid in self.requests and suid not in self.flushcalls:
+            self.flushcalls[suid] = reactor.callLater(0, self.flush, suid)
+
+    def drain(self, suid):
+        """
+        Empty the buffer of the given suid, returning all its
+        entries as one json list.
+        """
+        dataentries = self.databuffer.get(suid)
+        entries = list(dataentries) if dataentries else []
+        if dataentries:
+            dataentries.clear()
+        dropped = self.dropped.pop(suid, 0)
+        if dropped:
+            entries.insert(0, {'msg': "... %i messages were dropped since the client "
+                                      "could not keep up ..." % dropped, 'data': None})
+        return jsonify(entries)
+
+    def flush(self, suid):
+        """
+        Send all buffered data to the waiting request, if any.
+        """
+        flushcall = self.flushcalls.pop(suid, None)
+        if flushcall and flushcall.active():
+            flushcall.cancel()
+        request = self.requests.pop(suid, None)
         if request:
-            # we have a request waiting. Return immediately.
-            request.write(jsonify({'msg': string, 'data': data}))
+            request.write(self.drain(suid))
             request.finish()
-            del self.requests[suid]
-        else:
-            # no waiting request. Store data in buffer
-            dataentries = self.databuffer.get(suid, [])
-            dataentries.append(jsonify({'msg': string, 'data': data}))
-            self.databuffer[suid] = dataentries
 
     def client_disconnect(self, suid):
         """
         Disconnect session with given suid.
         """
-        if suid in self.requests:
-            self.requests[suid].finish()
-            del self.requests[suid]
+        # make sure a waiting request gets the last messages
+        self.flush(suid)
         if suid in self.databuffer:
             del self.databuffer[suid]
+        self.dropped.pop(suid, None)
 
     def mode_init(self, request):
         """
@@ -120,7 +155,7 @@ class WebClient(resource.Resource):
         if suid == '0':
             # creating a unique id hash string
             suid = md5(str(time.time())).hexdigest()
-            self.databuffer[suid] = []
+            self.databuffer[suid] = deque(maxlen=BUFFER_MAXLEN)
 
             sess = WebClientSession()
             sess.client = self
@@ -151,15 +186,14 @@ class WebClient(resource.Resource):
         that it is ready to receive data as soon as it is
         available. This is the basis of a long-polling (comet)
         mechanism: the server will wait to reply until data is
-        available.
+        available. All data buffered is returned at once.
         """
         suid = request.args.get('suid', ['0'])[0]
         if suid == '0':
             return ''
 
-        dataentries = self.databuffer.get(suid, [])
-        if dataentries:
-            return dataentries.pop(0)
+        if self.databuffer.get(suid) or suid in self.dropped:
+            return self.drain(suid)
         request.notifyFinish().addErrback(self._responseFailed, suid, request)
         if suid in self.requests:
             self.requests[suid].finish()  # Clear any stale request.
@@ -239,14 +273,23 @@ class WebClientSession(session.Session):
         """
         # string handling is similar to telnet
         try:
-            text = utils.to_str(text if text else "", encoding=self.encoding)
-            raw = kwargs.get("raw", False)
-            nomarkup = kwargs.get("nomarkup", False)
-            if raw:
-                self.client.lineSend(self.suid, text)
-            else:
-                self.client.lineSend(self.suid,
-                                     parse_html(text, strip_ansi=nomarkup))
+            self.client.lineSend(self.suid, self.render(text, **kwargs))
             return
         except Exception:
             logger.log_trace()
+
+    def render_profile(self, **kwargs):
+        "Key for how text is rendered for this client"
+        return (self.__class__, self.encoding,
+                bool(kwargs.get("raw", False)), bool(kwargs.get("nomarkup", False)))
+
+    def render(self, text, **kwargs):
+        "Convert text to the html sent to the webclient"
+        text = utils.to_str(text if text else "", encoding=self.encoding)
+        if kwargs.get("raw", False):
+            return text
+        return parse_html(text, strip_ansi=kwargs.get("nomarkup", False))
+
+    def send_rendered(self, string):
+        "Send a string converted with render()"
+        self.client.lineSend(self.suid, string)
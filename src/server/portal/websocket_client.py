@@ -17,6 +17,11 @@ where the dict is JSON encoded. The initial OOB-prefix
 is used to identify this type of communication, all other data
 is considered plain text (command input).
 
+Text sent to the client during the same reactor tick is pushed in one
+frame, as "MSGS" followed by a JSON list of the texts (a single text
+is sent as-is). Text is queued while the client is lagging behind (see
+src.server.portal.outputqueue).
+
 Example of call from a javascript client:
 
     websocket = new WeSocket("ws://localhost:8021")
@@ -30,6 +35,7 @@ Example of call from a javascript client:
 import json
 from twisted.internet.protocol import Protocol
 from src.server.session import Session
+from src.server.portal.outputqueue import OutputQueue
 from src.utils.logger import log_trace
 from src.utils.utils import to_str, make_iter
 from src.utils.text2html import parse_html
@@ -45,6 +51,7 @@ class WebSocketClient(Protocol, Session):
         This is called when the connection is first established.
         """
         client_address = self.transport.client
+        self.outqueue = OutputQueue(self, self._send_texts)
         self.init_session("websocket", client_address, self.factory.sessionhandler)
         self.sessionhandler.connect(self)
 
@@ -63,6 +70,7 @@ class WebSocketClient(Protocol, Session):
         whatever reason. it can also be called directly, from
         the disconnect method
         """
+        self.flush()
         self.sessionhandler.disconnect(self)
         self.transport.close()
 
@@ -121,11 +129,47 @@ class WebSocketClient(Protocol, Session):
         if "oob" in kwargs:
             oobstruct = self.sessionhandler.oobstruct_parser(kwargs.pop("oob"))
             #print "oob data_out:", "OOB" + json.dumps(oobstruct)
+            # text sent before must arrive first (OOB data is never
+            # queued though, so it may overtake text to a lagging client)
+            self.flush()
             self.sendLine("OOB" + json.dumps(oobstruct))
-        raw = kwargs.get("raw", False)
-        nomarkup = kwargs.get("nomarkup", False)
-        if raw:
-            self.sendLine(text)
+        self.send_rendered(self.render(text, **kwargs))
+
+    def render_profile(self, **kwargs):
+        """
+        Key for how text is rendered for this client. OOB
+        instructions are handled per session, so those messages
+        can't share rendering.
+        """
+        if "oob" in kwargs:
+            return None
+        return (self.__class__, self.encoding,
+                bool(kwargs.get("raw", False)), bool(kwargs.get("nomarkup", False)))
+
+    def render(self, text, **kwargs):
+        "Convert text to the html sent over the websocket"
+        text = to_str(text if text else "", encoding=self.encoding)
+        if kwargs.get("raw", False):
+            return text
+        return parse_html(text, strip_ansi=kwargs.get("nomarkup", False))
+
+    def send_rendered(self, string):
+        """
+        Send a string converted with render(). It is queued and
+        sent together with all other text of this reactor tick.
+        """
+        self.outqueue.write(string)
+
+    def flush(self):
+        """
+        Send all queued text to the client (unless it is lagging).
+        """
+        self.outqueue.flush()
+
+    def _send_texts(self, texts):
+        "Send texts from the output queue in one frame"
+        if len(texts) == 1:
+            self.sendLine(texts[0])
         else:
-            self.sendLine(parse_html(text, strip_ansi=nomarkup))
+            self.sendLine("MSGS" + json.dumps(texts, encoding=self.encoding or "utf-8"))
 
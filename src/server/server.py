@@ -227,9 +227,14 @@ class Evennia(object):
         #update eventual changed defaults
         self.update_defaults()
 
+        # load the game world into the caches
+        self.warm_caches()
+
         #print "run_init_hooks:", ObjectDB.get_all_cached_instances()
-        [(o.typeclass, o.at_init()) for o in ObjectDB.get_all_cached_instances()]
-        [(p.typeclass, p.at_init()) for p in PlayerDB.get_all_cached_instances()]
+        # loading the typeclass calls its at_init(), so this only
+        # initializes entities whose typeclass was not loaded yet
+        [o.typeclass for o in ObjectDB.get_all_cached_instances()]
+        [p.typeclass for p in PlayerDB.get_all_cached_instances()]
 
         with open(SERVER_RESTART, 'r') as f:
             mode = f.read()
@@ -252,6 +257,47 @@ class Evennia(object):
             # always call this regardless of start type
             SERVER_STARTSTOP_MODULE.at_server_start()
 
+    def warm_caches(self):
+        """
+        Load rooms, exits, characters and their players as well as
+        all persistent scripts and the objects they sit on in a few
+        bulk queries. This fills the idmapper cache, loads their
+        typeclasses and fills their Attribute and Tag caches, so
+        validating scripts and logging players back in after a
+        reload doesn't query the database entity by entity.
+        """
+        if not settings.SERVER_CACHE_WARMUP:
+            return
+        from django.db.models import Q
+        from src.objects.models import ObjectDB
+
+        t0 = time.time()
+        maxnum = settings.IDMAPPER_CACHE_MAXNUM
+        scripts = list(ScriptDB.objects.filter(db_persistent=True))
+        script_objs = ScriptDB.objects.filter(db_persistent=True,
+                                              db_obj__isnull=False).values("db_obj")
+        # rooms have no location, exits a destination, characters a player
+        objs = ObjectDB.objects.filter(Q(db_location__isnull=True) |
+                                       Q(db_destination__isnull=False) |
+                                       Q(db_player__isnull=False) |
+                                       Q(id__in=script_objs))
+        objs = list(objs[:maxnum] if maxnum else objs)
+        player_ids = set(obj.db_player_id for obj in objs if obj.db_player_id)
+        player_ids.update(script.db_player_id for script in scripts if script.db_player_id)
+        players = list(PlayerDB.objects.filter(id__in=player_ids)) if player_ids else []
+
+        for manager, entities in ((ObjectDB.objects, objs),
+                                  (PlayerDB.objects, players),
+                                  (ScriptDB.objects, scripts)):
+            if entities:
+                manager.prefetch_attributes(entities)
+                manager.prefetch_tags(entities)
+                for entity in entities:
+                    # loading the typeclass also calls its at_init()
+                    entity.typeclass
+        print " Cache warm-up: loaded %i objects, %i players and %i scripts in %.2f seconds." % \
+                (len(objs), len(players), len(scripts), time.time() - t0)
+
     def set_restart_mode(self, mode=None):
         """
         This manages the flag file that tells the runner if the server is
@@ -342,6 +388,12 @@ class Evennia(object):
             if SERVER_STARTSTOP_MODULE:
                 SERVER_STARTSTOP_MODULE.at_server_cold_stop()
 
+        # save changes to nested Attribute values not yet stored
+        from src.utils import dbserialize
+        dbserialize.flush()
+        from src.utils.idmapper.base import flush_write_queue
+        flush_write_queue()
+
         # stopping time
         from src.utils import gametime
         gametime.save()
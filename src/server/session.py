@@ -122,6 +122,31 @@ class Session(object):
         """
         pass
 
+    def render_profile(self, **kwargs):
+        """
+        Portal sessions can overload this to return a hashable key
+        describing how text sent with the given kwargs is rendered
+        for this client. A message sent to many sessions is then
+        only rendered once for all sessions sharing the same key,
+        using render() and send_rendered(). Returning None (default)
+        means data_out() is always used.
+        """
+        return None
+
+    def render(self, text, **kwargs):
+        """
+        Convert text to the form sent to the client. Used together
+        with render_profile().
+        """
+        return text
+
+    def send_rendered(self, string):
+        """
+        Send a string already converted with render(). Used together
+        with render_profile().
+        """
+        pass
+
     def data_in(self, text=None, **kwargs):
         """
         hook for protocols to send incoming data to the engine.
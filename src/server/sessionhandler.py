@@ -15,7 +15,8 @@ There are two similar but separate stores of sessions:
 import time
 from django.conf import settings
 from src.commands.cmdhandler import CMD_LOGINSTART
-from src.utils.utils import variable_from_module
+from src.utils import logger
+from src.utils.utils import variable_from_module, make_iter
 try:
     import cPickle as pickle
 except ImportError:
@@ -77,6 +78,106 @@ class SessionHandler(object):
         Init the handler.
         """
         self.sessions = {}
+        self.reset_indexes()
+
+    def reset_indexes(self):
+        """
+        Empty the lookup indexes. The indexes map player id (uid),
+        puppet id (puid) and webclient id (suid) to the sessids
+        having that value, so sessions can be found without
+        looping over all of them.
+        """
+        self.uid_index = {}
+        self.puid_index = {}
+        self.suid_index = {}
+        # sessid: (uid, puid, suid) the session is indexed under
+        self._indexed = {}
+
+    def _index_keys(self, session):
+        "Get the (uid, puid, suid) to index session under."
+        return (getattr(session, "uid", None),
+                getattr(session, "puid", None),
+                getattr(session, "suid", None))
+
+    def _unindex(self, sessid):
+        "Remove sessid from all indexes"
+        keys = self._indexed.pop(sessid, None)
+        if not keys:
+            return
+        for index, key in zip((self.uid_index, self.puid_index, self.suid_index), keys):
+            if key is None:
+                continue
+            sessids = index.get(key)
+            if sessids:
+                sessids.discard(sessid)
+                if not sessids:
+                    del index[key]
+
+    def index_session(self, session):
+        """
+        (Re-)index a session. This must be called whenever the
+        uid, puid or suid of a stored session changes, such as
+        on login or when puppeting/unpuppeting an object.
+        Sessions not (yet) stored in the handler are ignored, they
+        are indexed when being added.
+        """
+        sessid = session.sessid
+        if self.sessions.get(sessid) is not session:
+            return
+        keys = self._index_keys(session)
+        if self._indexed.get(sessid) == keys:
+            return
+        self._unindex(sessid)
+        self._indexed[sessid] = keys
+        for index, key in zip((self.uid_index, self.puid_index, self.suid_index), keys):
+            if key is not None:
+                index.setdefault(key, set()).add(sessid)
+
+    def add_session(self, session):
+        """
+        Store a session in the handler and index it.
+        """
+        self._unindex(session.sessid)
+        self.sessions[session.sessid] = session
+        self.index_session(session)
+
+    def remove_session(self, sessid):
+        """
+        Remove a session from the handler and its indexes. Returns
+        the removed session or None.
+        """
+        self._unindex(sessid)
+        return self.sessions.pop(sessid, None)
+
+    def _from_index(self, index, key):
+        "Get all stored sessions indexed under key"
+        sessions = self.sessions
+        return [sessions[sessid] for sessid in index.get(key, ()) if sessid in sessions]
+
+    def check_indexes(self):
+        """
+        Verify that the indexes match the stored sessions. Any
+        mismatch (such as from a session changing its uid/puid/suid
+        without being re-indexed) is logged and the indexes are
+        rebuilt. Returns True if the indexes were consistent.
+        """
+        consistent = set(self._indexed) == set(self.sessions)
+        if consistent:
+            for sessid, session in self.sessions.iteritems():
+                if self._indexed[sessid] != self._index_keys(session):
+                    consistent = False
+                    break
+        if consistent:
+            # also catch lingering sessids in the indexes themselves
+            consistent = all(sessid in self.sessions
+                             for index in (self.uid_index, self.puid_index, self.suid_index)
+                             for sessids in index.itervalues() for sessid in sessids)
+        if not consistent:
+            logger.log_warn("%s: session indexes out of sync, rebuilding." % self.__class__.__name__)
+            self.reset_indexes()
+            for session in self.sessions.values():
+                self.index_session(session)
+        return consistent
 
     def get_sessions(self, include_unloggedin=False):
         """
@@ -182,6 +283,7 @@ class ServerSessionHandler(SessionHandler):
         Init the handler.
         """
         self.sessions = {}
+        self.reset_indexes()
         self.server = None
         self.server_data = {"servername": SERVERNAME}
 
@@ -207,7 +309,7 @@ class ServerSessionHandler(SessionHandler):
         sess.at_sync()
         # validate all scripts
         _ScriptDB.objects.validate()
-        self.sessions[sess.sessid] = sess
+        self.add_session(sess)
         sess.data_in(CMD_LOGINSTART)
 
     def portal_disconnect(self, sessid):
@@ -225,7 +327,7 @@ class ServerSessionHandler(SessionHandler):
             session.log(_('Connection dropped: %s %s (%s)' % (session.player, session.address, remaintext)))
         session.at_disconnect()
         session.disconnect()
-        del self.sessions[session.sessid]
+        self.remove_session(session.sessid)
 
     def portal_session_sync(self, portalsessions):
         """
@@ -250,7 +352,7 @@ class ServerSessionHandler(SessionHandler):
             sess.load_sync_data(sessdict)
             if sess.uid:
                 sess.player = _PlayerDB.objects.get_player_from_uid(sess.uid)
-            self.sessions[sessid] = sess
+            self.add_session(sess)
             sess.at_sync()
 
         # after sync is complete we force-validate all scripts
@@ -306,6 +408,7 @@ class ServerSessionHandler(SessionHandler):
 
         # sets up and assigns all properties on the session
         session.at_login(player)
+        self.index_session(session)
 
         # player init
         player.at_init()
@@ -351,7 +454,7 @@ class ServerSessionHandler(SessionHandler):
 
         session.at_disconnect()
         sessid = session.sessid
-        del self.sessions[sessid]
+        self.remove_session(sessid)
         # inform portal that session should be closed.
         self.server.amp_protocol.call_remote_PortalAdmin(sessid,
                                                          operation=SDISCONN,
@@ -384,10 +487,8 @@ class ServerSessionHandler(SessionHandler):
         """
         Disconnects any existing sessions with the same user.
         """
-        uid = curr_session.uid
-        doublet_sessions = [sess for sess in self.sessions.values()
+        doublet_sessions = [sess for sess in self._from_index(self.uid_index, curr_session.uid)
                             if sess.logged_in
-                            and sess.uid == uid
                             and sess != curr_session]
         for session in doublet_sessions:
             self.disconnect(session, reason)
@@ -395,8 +496,10 @@ class ServerSessionHandler(SessionHandler):
     def validate_sessions(self):
         """
         Check all currently connected sessions (logged in and not)
-        and see if any are dead.
+        and see if any are dead. Also verifies the session lookup
+        indexes.
         """
+        self.check_indexes()
         tcurr = time.time()
         reason = _("Idle timeout exceeded, disconnecting.")
         for session in (session for session in self.sessions.values()
@@ -410,7 +513,9 @@ class ServerSessionHandler(SessionHandler):
         player may have more than one session depending on settings).
         Only logged-in players are counted here.
         """
-        return len(set(session.uid for session in self.sessions.values() if session.logged_in))
+        sessions = self.sessions
+        return len([uid for uid, sessids in self.uid_index.iteritems()
+                    if any(sessions[sessid].logged_in for sessid in sessids if sessid in sessions)])
 
     def session_from_sessid(self, sessid):
         """
@@ -429,17 +534,16 @@ class ServerSessionHandler(SessionHandler):
         """
         Given a player, return all matching sessions.
         """
-        uid = player.uid
-        return [session for session in self.sessions.values() if session.logged_in and session.uid == uid]
+        return [session for session in self._from_index(self.uid_index, player.uid)
+                if session.logged_in]
 
     def sessions_from_character(self, character):
         """
-        Given a game character, return any matching sessions.
+        Given a game character, return any matching sessions (that is,
+        the sessions puppeting it).
         """
-        sessid = character.sessid
-        if sessid:
-            return self.sessions.get(sessid)
-        return None
+        return [session for session in self._from_index(self.puid_index, character.id)
+                if session.logged_in]
 
     def announce_all(self, message):
         """
@@ -456,6 +560,20 @@ class ServerSessionHandler(SessionHandler):
                                                               msg=text,
                                                               data=kwargs)
 
+    def data_out_multicast(self, sessions, text="", **kwargs):
+        """
+        Sending the same data Server -> Portal to many sessions. The
+        data is only serialized once, and the Portal renders it once
+        per type of client instead of once per session.
+        """
+        sessions = [session for session in make_iter(sessions) if session]
+        if len(sessions) == 1:
+            self.data_out(sessions[0], text=text, **kwargs)
+        elif sessions:
+            self.server.amp_protocol.call_remote_MsgServer2PortalMulticast(
+                              [session.sessid for session in sessions],
+                              msg=text, data=kwargs)
+
     def data_in(self, sessid, text="", **kwargs):
         """
         Data Portal -> Server
@@ -27,6 +27,9 @@ TELNET_ENABLED = True
 TELNET_PORTS = [4000]
 # Interface addresses to listen to. If 0.0.0.0, listen to all. Use :: for IPv6.
 TELNET_INTERFACES = ['0.0.0.0']
+# The zlib compression level (1-9) used for telnet clients supporting MCCP
+# (data compression). Lower levels use less CPU but compress less.
+MCCP_COMPRESSION_LEVEL = 9
 # OOB (out-of-band) telnet communication allows Evennia to communicate
 # special commands and data with enabled Telnet clients. This is used
 # to create custom client interfaces over a telnet connection. To make
@@ -62,6 +65,9 @@ WEBSERVER_THREADPOOL_LIMITS = (1, 20)
 # offers the fallback ajax-based webclient backbone for browsers not supporting
 # the websocket one.
 WEBCLIENT_ENABLED = True
+# The max number of messages buffered for an ajax webclient between its
+# polls. If a browser can't keep up, the oldest messages are dropped.
+WEBCLIENT_BUFFER_MAXLEN = 500
 # Activate Websocket support for modern browsers. If this is on, the
 # default webclient will use this and only use the ajax version of the browser
 # is too old to support websockets. Requires WEBCLIENT_ENABLED.
@@ -91,6 +97,16 @@ WEBSOCKET_ENABLED = False
 WEBSOCKET_PORTS = [8021]
 # Interface addresses to listen to. If 0.0.0.0, listen to all. Use :: for IPv6.
 WEBSOCKET_INTERFACES = ['0.0.0.0']
+# Output to telnet/ssl and websocket clients is queued by the Portal when
+# a client can't keep up with reading it. When more than the high
+# watermark (in bytes) is queued for a client, output is thrown away
+# according to the policy until the queue is below the low watermark.
+# The policy is one of "drop" (drop new output), "drop_oldest" (drop the
+# oldest queued output) or "merge" (like "drop_oldest" but also merges
+# repeated identical lines, like spammy combat messages).
+PORTAL_OUTPUT_HIGH_WATERMARK = 256 * 1024
+PORTAL_OUTPUT_LOW_WATERMARK = 64 * 1024
+PORTAL_OUTPUT_POLICY = "merge"
 # This determine's whether Evennia's custom admin page is used, or if the
 # standard Django admin is used.
 EVENNIA_ADMIN = True
@@ -141,6 +157,11 @@ ENCODINGS = ["utf-8", "latin-1", "ISO-8859-1"]
 AMP_HOST = 'localhost'
 AMP_PORT = 5000
 AMP_INTERFACE = '127.0.0.1'
+# The serializer for data sent between Server and Portal. The default
+# sends strings and empty data as-is, marshals data made up only of
+# builtin types and pickles the rest (including subclasses of builtin
+# types, like ANSIString). Use 'src.server.amp.PickleSerializer' to always pickle.
+AMP_SERIALIZER = 'src.server.amp.CompactSerializer'
 # Database objects are cached in what is known as the idmapper. The idmapper
 # caching results in a massive speedup of the server (since it dramatically
 # limits the number of database accesses needed) and also allows for
@@ -165,6 +186,37 @@ AMP_INTERFACE = '127.0.0.1'
 # be necessary (use @server to see how many objects are in the idmapper
 # cache at any time). Setting this to None disables the cache cap.
 IDMAPPER_CACHE_MAXSIZE = 200      # (MB)
+# The max number of database entities of each type (objects, players,
+# scripts etc) kept in the idmapper cache. When this is exceeded, the
+# least recently used entities are evicted from the cache (entities in
+# active use, like puppeted characters, their locations and anything
+# with running scripts, non-persistent attributes or unsaved changes,
+# are never evicted, nor are Attributes). Evicted entities are
+# reloaded from the database when next needed. When the
+# IDMAPPER_CACHE_MAXSIZE memory cap is reached, the least recently
+# used quarter of each cache is evicted. None (default) for no limit.
+IDMAPPER_CACHE_MAXNUM = None
+# At server start/reload, load all rooms, exits, characters (with their
+# players) and objects with persistent scripts into memory in a few
+# bulk queries, together with their Attributes and Tags. This avoids a
+# storm of single-row queries when scripts are validated and players
+# log back in. At most IDMAPPER_CACHE_MAXNUM objects (if set) are
+# loaded. Turn off for very large games where loading the world takes
+# too long.
+SERVER_CACHE_WARMUP = True
+# Saving a single field of a database object (like obj.db.health = 10
+# or obj.desc = "...") normally writes to the database at once. With
+# write-behind active, such saves are instead queued and written
+# together in one transaction every DATABASE_WRITE_BEHIND_INTERVAL
+# milliseconds, at the end of each command and when the server
+# reloads or shuts down. Several saves to the same object before
+# then are combined into one. Fields used for searching (keys,
+# locations etc) are always saved directly. Note that post-save hooks
+# of the queued fields (like OOB tracker updates) are then also only
+# run when the queue is written. Only activate if no other process
+# (like an external website) reads the database.
+DATABASE_WRITE_BEHIND = False
+DATABASE_WRITE_BEHIND_INTERVAL = 200  # (ms)
 
 ######################################################################
 # Evennia Database config
@@ -308,14 +360,21 @@ DEFAULT_HOME = "#2"
 #  MULTISESSION_MODE = 0, 1 - used by default unloggedin create command
 #  MULTISESSION_MODE = 2 - used by default character_create command
 START_LOCATION = "#2"
-# Lookups of Attributes, Tags, Nicks, Aliases can be aggressively
+# Lookups of Tags, Aliases and Permissions can be aggressively
 # cached to avoid repeated database hits. This often gives noticeable
 # performance gains since they are called so often. Drawback is that
 # if you are accessing the database from multiple processes (such as
 # from a website -not- running Evennia's own webserver) data may go
 # out of sync between the processes. Keep on unless you face such
-# issues.
+# issues. Attributes and Nicks are always cached; their cache is kept
+# in sync by the Attribute save/delete signals of the server process.
 TYPECLASS_AGGRESSIVE_CACHE = True
+# Changing a nested mutable stored in an Attribute (such as
+# obj.db.mylist.append(3)) re-saves the whole Attribute value. If
+# this is set, such changes are instead collected and saved once at
+# the end of the current command or server tick. Use
+# src.utils.dbserialize.flush() to force saving earlier.
+ATTRIBUTE_COALESCE_SAVES = True
 
 ######################################################################
 # Batch processors
@@ -55,6 +55,25 @@ class TestCmdSet(unittest.TestCase):
         # self.assertEqual(expected, cmd_set.get_all_cmd_keys_and_aliases(caller))
         assert True # TODO: implement your test here
 
+    def test_get_cmdname_trie(self):
+        from src.commands.cmdset import CmdSet
+        from src.commands.command import Command
+        class CmdLook(Command):
+            key = "look"
+            aliases = ["l"]
+        class CmdLock(Command):
+            key = "lock"
+        cmd_set = CmdSet()
+        cmd_set.add([CmdLook, CmdLock])
+        trie = cmd_set.get_cmdname_trie()
+        self.assertEqual(["l"], [tup[1] for tup in trie["l"][""]])
+        self.assertEqual(["look"], [tup[1] for tup in trie["l"]["o"]["o"]["k"][""]])
+        self.assertEqual(["lock"], [tup[1] for tup in trie["l"]["o"]["c"]["k"][""]])
+        # the trie is cached until the cmdset changes
+        self.assertTrue(trie is cmd_set.get_cmdname_trie())
+        cmd_set.remove("lock")
+        self.assertFalse("c" in cmd_set.get_cmdname_trie()["l"]["o"])
+
     def test_get_system_cmds(self):
         # cmd_set = CmdSet(cmdsetobj, key)
         # self.assertEqual(expected, cmd_set.get_system_cmds())
@@ -60,5 +60,170 @@ class TestObjectDB(unittest.TestCase):
         # self.assertEqual(expected, object_d_b.search_player(searchdata, quiet))
         assert True # TODO: implement your test here
 
+class _LocationTest(unittest.TestCase):
+    "Sets up a room with an object and a character in it"
+    def setUp(self):
+        from django.conf import settings
+        from django.db.models.signals import post_save
+        from src.server.caches import field_post_save
+        from src.utils import create
+        # the location hooks are called through this signal, which
+        # is normally connected by the server
+        post_save.connect(field_post_save, dispatch_uid="fieldcache")
+        self.room = create.create_object(settings.BASE_ROOM_TYPECLASS, key="TestRoom", nohome=True)
+        self.item = create.create_object(settings.BASE_OBJECT_TYPECLASS, key="TestItem",
+                                         location=self.room, home=self.room)
+        self.char = create.create_object(settings.BASE_CHARACTER_TYPECLASS, key="TestChar",
+                                         location=self.room, home=self.room)
+        self.objs = [self.item, self.char]
+
+    def create(self, typeclass, key, location, **kwargs):
+        "Create an object which is deleted again after the test"
+        from src.utils import create
+        obj = create.create_object(typeclass, key=key, location=location, home=self.room, **kwargs)
+        self.objs.append(obj)
+        return obj
+
+    def tearDown(self):
+        for obj in reversed(self.objs):
+            obj.delete()
+        self.room.delete()
+
+class TestCmdsetProviders(_LocationTest):
+    def setUp(self):
+        from src.commands.cmdset import CmdSet
+        from src.commands.command import Command
+        super(TestCmdsetProviders, self).setUp()
+        class CmdTest(Command):
+            key = "providertest"
+        class TestCmdSet(CmdSet):
+            key = "ProviderTestSet"
+            def at_cmdset_creation(self):
+                self.add(CmdTest())
+        self.cmdset = TestCmdSet
+
+    def providers(self, location):
+        return [obj.id for obj in location.get_cmdset_providers()]
+
+    def test_empty_cmdset(self):
+        # the item only has the _EMPTY_CMDSET
+        self.assertEqual([self.char.id], self.providers(self.room))
+
+    def test_enter_leave(self):
+        from django.conf import settings
+        char2 = self.create(settings.BASE_CHARACTER_TYPECLASS, "TestChar2", None)
+        self.assertEqual([self.char.id], self.providers(self.room))
+        char2.location = self.room
+        self.assertEqual([self.char.id, char2.id], self.providers(self.room))
+        del char2.location
+        self.assertEqual([self.char.id], self.providers(self.room))
+        char2.move_to(self.room, quiet=True)
+        self.assertEqual([self.char.id, char2.id], self.providers(self.room))
+        char2.location = self.char
+        self.assertEqual([self.char.id], self.providers(self.room))
+        self.objs.remove(char2)
+        char2.delete()
+        self.assertEqual([self.char.id], self.providers(self.room))
+
+    def test_cmdset_change(self):
+        self.assertEqual([self.char.id], self.providers(self.room))
+        self.item.cmdset.add(self.cmdset)
+        self.assertEqual([self.item.id, self.char.id], self.providers(self.room))
+        self.item.cmdset.delete()
+        self.assertEqual([self.char.id], self.providers(self.room))
+        # the same goes for things carried by a character
+        self.item.location = self.char
+        self.assertEqual([], self.providers(self.char))
+        self.item.cmdset.add(self.cmdset)
+        self.assertEqual([self.item.id], self.providers(self.char))
+        self.item.cmdset.delete()
+        self.assertEqual([], self.providers(self.char))
+
+    def test_reloaded_provider(self):
+        from src.objects.models import ObjectDB
+        self.assertEqual([self.char.id], self.providers(self.room))
+        cached = self.room.dbobj._cmdset_providers
+        self.providers(self.room)
+        self.assertTrue(self.room.dbobj._cmdset_providers is cached)
+        # a cached provider not in the idmapper anymore forces a rebuild
+        ObjectDB.flush_cached_instance(self.char.dbobj)
+        self.assertEqual([self.char.id], self.providers(self.room))
+        self.assertFalse(self.room.dbobj._cmdset_providers is cached)
+        self.assertTrue(self.room.dbobj._cmdset_providers[0] is
+                        ObjectDB.get_cached_instance(self.char.id))
+
+class TestContentsPrefetch(_LocationTest):
+    def test_prefetch(self):
+        from src.objects.models import _CONTENTS_INDEX
+        self.item.db.desc = "A test item."
+        attributes = self.item.dbobj.attributes
+        _CONTENTS_INDEX.clear()
+        attributes._reset_cache()
+        self.room.contents
+        # loading the location from the database loads the Attributes
+        self.assertTrue(attributes._cache_complete)
+        self.assertEqual("A test item.", attributes.get("desc"))
+        # looking up an indexed location doesn't
+        attributes._reset_cache()
+        self.room.contents
+        self.assertFalse(attributes._cache_complete)
+
+class _Obj(object):
+    "Stand-in for an ObjectDB in the ContentsIndex tests"
+    def __init__(self, id, location_id):
+        self.id, self.db_location_id = id, location_id
+
+class TestContentsIndex(unittest.TestCase):
+    def setUp(self):
+        from src.objects.models import ContentsIndex
+        self.index = ContentsIndex()
+
+    def test_moved_removed(self):
+        index = self.index
+        # only locations already indexed (here #1) are kept up to date
+        index.contents[1] = {}
+        obj = _Obj(10, 1)
+        index.moved(obj)
+        self.assertEqual({10: obj}, index.contents[1])
+        obj.db_location_id = 2
+        index.moved(obj)
+        self.assertEqual({}, index.contents[1])
+        self.assertFalse(2 in index.contents)
+        self.assertFalse(10 in index.locations)
+        obj.db_location_id = 1
+        index.moved(obj)
+        index.removed(obj)
+        self.assertEqual({}, index.contents[1])
+        index.removed(_Obj(1, None))
+        self.assertFalse(1 in index.contents)
+
+    def test_prune(self):
+        index = self.index
+        index.contents[1] = {}
+        index.moved(_Obj(10, 1))
+        # neither the location nor its contents are in the idmapper
+        # cache, so they should not be kept alive by the index
+        index.prune()
+        self.assertEqual({}, index.contents)
+        self.assertEqual({}, index.locations)
+
+class TestContentsSplit(_LocationTest):
+    def test_split(self):
+        from django.conf import settings
+        room2 = self.create(settings.BASE_ROOM_TYPECLASS, "TestRoom2", None)
+        exit_obj = self.create(settings.BASE_EXIT_TYPECLASS, "TestExit", self.room, destination=room2)
+        ids = lambda objs: [obj.id for obj in objs]
+        self.assertEqual([self.item.id, self.char.id, exit_obj.id], ids(self.room.contents))
+        self.assertEqual([exit_obj.id], ids(self.room.exits))
+        self.assertEqual([self.char.id], ids(self.room.characters))
+        self.assertEqual([self.item.id, exit_obj.id], ids(self.room.contents_get(exclude=self.char)))
+        # the sub-lists follow changes of destination and location
+        exit_obj.destination = None
+        self.assertEqual([], ids(self.room.exits))
+        self.char.location = room2
+        self.assertEqual([], ids(self.room.characters))
+        self.assertEqual([self.char.id], ids(room2.characters))
+        self.assertEqual([self.item.id, exit_obj.id], ids(self.room.contents))
+
 if __name__ == '__main__':
     unittest.main()
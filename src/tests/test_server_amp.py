@@ -87,9 +87,21 @@ class TestAMPProtocol(unittest.TestCase):
         assert True # TODO: implement your test here
 
     def test_call_remote_MsgServer2Portal(self):
-        # a_mp_protocol = AMPProtocol()
-        # self.assertEqual(expected, a_mp_protocol.call_remote_MsgServer2Portal(sessid, msg, data))
-        assert True # TODO: implement your test here
+        from src.server import amp
+        a_mp_protocol = amp.AMPProtocol()
+        sent = []
+        a_mp_protocol.safe_send = lambda command, sessid, **kwargs: sent.append((command, sessid, kwargs))
+        a_mp_protocol.call_remote_MsgServer2Portal(1, "Hello", data={})
+        a_mp_protocol.call_remote_MsgServer2Portal(2, "World", data={"raw": True})
+        self.assertEqual([], sent)
+        a_mp_protocol.send_MsgServer2Portal_batch()
+        self.assertEqual(1, len(sent))
+        self.assertEqual(amp.MsgServer2PortalBatch, sent[0][0])
+        self.assertEqual([(1, "Hello", {}), (2, "World", {"raw": True})], amp.loads(sent[0][2]["data"]))
+        # a single message is sent as a normal MsgServer2Portal
+        a_mp_protocol.call_remote_MsgServer2Portal(1, "Alone")
+        a_mp_protocol.send_MsgServer2Portal_batch()
+        self.assertEqual(amp.MsgServer2Portal, sent[1][0])
 
     def test_call_remote_PortalAdmin(self):
         # a_mp_protocol = AMPProtocol()
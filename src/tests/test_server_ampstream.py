@@ -0,0 +1,31 @@
+import unittest
+
+class TestPackFrame(unittest.TestCase):
+    def test_pack_frame(self):
+        from src.server.ampstream import pack_frame, unpack_frame
+        kwargs = {"msg": "Hello" * 20000, "data": "", "operation": chr(1)}
+        frame = pack_frame(**kwargs)
+        self.assertEqual(kwargs, unpack_frame(frame))
+        self.assertEqual(kwargs, unpack_frame(bytearray(frame)))
+
+class TestStreamAssembler(unittest.TestCase):
+    def test_add(self):
+        from src.server.ampstream import pack_frame, iter_chunks, StreamAssembler
+        frame1 = pack_frame(msg="a" * 1000, data="1")
+        frame2 = pack_frame(msg="b" * 1000, data="2")
+        chunks1 = list(iter_chunks(frame1, 300))
+        chunks2 = list(iter_chunks(frame2, 300))
+        self.assertEqual(4, len(chunks1))
+        assembler = StreamAssembler()
+        # interleaved streams don't mix
+        for (offset1, chunk1), (offset2, chunk2) in zip(chunks1[:-1], chunks2[:-1]):
+            self.assertEqual(None, assembler.add(1, offset1, len(frame1), chunk1))
+            self.assertEqual(None, assembler.add(2, offset2, len(frame2), chunk2))
+        self.assertEqual({"msg": "b" * 1000, "data": "2"},
+                         assembler.add(2, chunks2[-1][0], len(frame2), chunks2[-1][1]))
+        self.assertEqual({"msg": "a" * 1000, "data": "1"},
+                         assembler.add(1, chunks1[-1][0], len(frame1), chunks1[-1][1]))
+        self.assertEqual({}, assembler.streams)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -50,5 +50,26 @@ class TestGetCacheSizes(unittest.TestCase):
         # self.assertEqual(expected, get_cache_sizes())
         assert True # TODO: implement your test here
 
+class TestCmdsetMergeCache(unittest.TestCase):
+    def test_cmdset_merge_cache(self):
+        from src.server import caches
+        class Merge(object):
+            "Stand-in for a merged cmdset"
+            pass
+        caches.flush_cmdset_merge_cache()
+        stats = caches.get_cmdset_merge_cache_stats()
+        merge1, merge2 = Merge(), Merge()
+        caches.set_cmdset_merge_cache((1, 0), merge1)
+        caches.set_cmdset_merge_cache((2, 0), merge2)
+        self.assertEqual(merge1, caches.get_cmdset_merge_cache((1, 0)))
+        # merges no longer in use are not kept alive by the cache
+        del merge2
+        self.assertEqual(None, caches.get_cmdset_merge_cache((2, 0)))
+        newstats = caches.get_cmdset_merge_cache_stats()
+        self.assertEqual(1, newstats["size"])
+        self.assertEqual(stats["hits"] + 1, newstats["hits"])
+        self.assertEqual(stats["misses"] + 1, newstats["misses"])
+        caches.flush_cmdset_merge_cache()
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import zlib
+
+class _Transport(object):
+    def __init__(self):
+        self.written = []
+    def write(self, data):
+        self.written.append(data)
+
+class _Negotiation(object):
+    def addCallbacks(self, callback, errback):
+        pass
+
+class _Protocol(object):
+    "Stand-in for the telnet protocol"
+    def __init__(self):
+        self.protocol_flags = {}
+        self.transport = _Transport()
+    def will(self, option):
+        return _Negotiation()
+    def requestNegotiation(self, option, data):
+        pass
+
+class TestMccp(unittest.TestCase):
+    def setUp(self):
+        from src.server.portal.mccp import Mccp
+        self.protocol = _Protocol()
+        self.mccp = Mccp(self.protocol)
+        self.mccp.do_mccp(None)
+        self.decompressor = zlib.decompressobj()
+
+    def test_write(self):
+        from src.server.portal.mccp import MCCP_STATS
+        bytes_in = MCCP_STATS["bytes_in"]
+        self.mccp.write("first line\r\n")
+        self.mccp.write("second line\r\n")
+        self.mccp.write("third line\r\n")
+        # nothing is sent until the end of the reactor tick
+        self.assertEqual([], self.protocol.transport.written)
+        self.assertTrue(self.mccp._flush_call)
+        self.mccp.flush()
+        written = self.protocol.transport.written
+        self.assertEqual(1, len(written))
+        self.assertEqual("first line\r\nsecond line\r\nthird line\r\n",
+                         self.decompressor.decompress(written[0]))
+        self.assertEqual({"bytes_in": 37, "bytes_out": len(written[0])}, self.mccp.stats)
+        self.assertEqual(bytes_in + 37, MCCP_STATS["bytes_in"])
+        self.assertEqual(None, self.mccp._flush_call)
+        # an empty buffer sends nothing
+        self.mccp.flush()
+        self.assertEqual(1, len(written))
+
+    def test_no_mccp(self):
+        self.mccp.write("last line\r\n")
+        self.mccp.no_mccp(None)
+        written = self.protocol.transport.written
+        self.assertEqual(1, len(written))
+        self.assertEqual("last line\r\n", self.decompressor.decompress(written[0]))
+        self.assertFalse(hasattr(self.protocol, "zlib"))
+        self.assertEqual(False, self.protocol.protocol_flags["MCCP"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+
+class _Transport(object):
+    def registerProducer(self, producer, streaming):
+        self.producer = producer
+
+class _Protocol(object):
+    "Stand-in for a Portal protocol"
+    def __init__(self, sessid):
+        self.sessid = sessid
+        self.transport = _Transport()
+
+class TestOutputQueue(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        self.queues = []
+
+    def tearDown(self):
+        for queue in self.queues:
+            queue.stopProducing()
+
+    def queue(self, policy, sessid=1):
+        "Create a paused queue sending to self.sent"
+        from src.server.portal.outputqueue import OutputQueue
+        queue = OutputQueue(_Protocol(sessid), self.sent.append, policy=policy,
+                            high_watermark=20, low_watermark=10)
+        self.queues.append(queue)
+        queue.pauseProducing()
+        return queue
+
+    def test_policy(self):
+        from src.server.portal.outputqueue import OutputQueue
+        self.assertRaises(ValueError, OutputQueue, _Protocol(1), self.sent.append, policy="keep")
+
+    def test_flush(self):
+        queue = self.queue("drop")
+        queue.resumeProducing()
+        self.assertEqual([], self.sent)
+        queue.write("one")
+        queue.write("two")
+        # everything written in the same tick is sent in one go
+        self.assertEqual([], self.sent)
+        self.assertTrue(queue._flush_call)
+        queue.flush()
+        self.assertEqual([["one", "two"]], self.sent)
+        self.assertEqual(0, queue.queued_bytes)
+
+    def test_drop(self):
+        from src.server.portal.outputqueue import _DROP_NOTICE
+        queue = self.queue("drop")
+        for num in range(5):
+            queue.write("%iaaaa" % num)
+        self.assertEqual(25, queue.queued_bytes)
+        self.assertTrue(queue.overflowing)
+        # beyond the high watermark the newest text is dropped
+        queue.write("5aaaa")
+        self.assertEqual(25, queue.queued_bytes)
+        queue.resumeProducing()
+        self.assertEqual([["0aaaa", "1aaaa", "2aaaa", "3aaaa", "4aaaa", _DROP_NOTICE % 1]], self.sent)
+        self.assertFalse(queue.overflowing)
+        self.assertEqual(1, queue.stats["dropped"])
+
+    def test_drop_oldest(self):
+        from src.server.portal.outputqueue import _DROP_NOTICE
+        queue = self.queue("drop_oldest")
+        for num in range(5):
+            queue.write("%iaaaa" % num)
+        # the oldest text is dropped down to the low watermark
+        self.assertEqual(10, queue.queued_bytes)
+        self.assertFalse(queue.overflowing)
+        queue.resumeProducing()
+        self.assertEqual([[_DROP_NOTICE % 3, "3aaaa", "4aaaa"]], self.sent)
+        self.assertEqual(25, queue.stats["max_queued"])
+
+    def test_merge(self):
+        queue = self.queue("merge")
+        queue.resumeProducing()
+        # nothing is merged while the client keeps up
+        queue.write("hit")
+        queue.write("hit")
+        queue.flush()
+        self.assertEqual([["hit", "hit"]], self.sent)
+        queue.pauseProducing()
+        queue.write("hit")
+        queue.write("hit")
+        queue.write("hit")
+        queue.write("miss")
+        queue.write("hit")
+        self.assertEqual(10, queue.queued_bytes)
+        self.assertEqual(2, queue.stats["merged"])
+        queue.resumeProducing()
+        self.assertEqual(["hit (x3)", "miss", "hit"], self.sent[-1])
+
+    def test_merge_drop(self):
+        from src.server.portal.outputqueue import _DROP_NOTICE
+        queue = self.queue("merge")
+        for num in range(3):
+            queue.write("aaaaa")
+        for num in range(4):
+            queue.write("%ibbbb" % num)
+        # merged text counts as all the lines it stands for
+        self.assertEqual(10, queue.queued_bytes)
+        queue.resumeProducing()
+        self.assertEqual([[_DROP_NOTICE % 5, "2bbbb", "3bbbb"]], self.sent)
+
+    def test_stop_producing(self):
+        from src.server.portal.outputqueue import _QUEUES
+        queue = self.queue("drop_oldest")
+        for num in range(5):
+            queue.write("%iaaaa" % num)
+        self.assertTrue(queue in _QUEUES)
+        queue.stopProducing()
+        self.assertEqual(0, len(queue.queue))
+        self.assertEqual(0, queue.queued_bytes)
+        self.assertEqual(0, queue.dropped)
+        self.assertFalse(queue in _QUEUES)
+        queue.resumeProducing()
+        self.assertEqual([], self.sent)
+
+    def test_output_stats(self):
+        from src.server.portal.outputqueue import output_stats
+        self.queue("drop", sessid=1).write("abc")
+        self.queue("drop", sessid=2).write("defgh")
+        self.queue("drop", sessid=3)
+        stats = output_stats()
+        # only sessions with queued output are listed
+        self.assertEqual({1: 3, 2: 5}, stats["queued"])
+        self.assertTrue(stats["pauses"] >= 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import json
+
+class _Deferred(object):
+    def addErrback(self, errback, *args):
+        pass
+
+class _Request(object):
+    "Stand-in for a twisted.web request from the ajax client"
+    def __init__(self, **args):
+        self.args = dict((key, [value]) for key, value in args.items())
+        self.written = []
+        self.finished = False
+    def write(self, data):
+        self.written.append(data)
+    def finish(self):
+        self.finished = True
+    def notifyFinish(self):
+        return _Deferred()
+
+class TestWebClient(unittest.TestCase):
+    def setUp(self):
+        from src.server.portal.webclient import WebClient
+        self.client = WebClient()
+
+    def test_drain(self):
+        self.client.lineSend("suid", "one")
+        self.client.lineSend("suid", "two", data={"key": 1})
+        self.assertEqual([{"msg": "one", "data": None}, {"msg": "two", "data": {"key": 1}}],
+                         json.loads(self.client.drain("suid")))
+        self.assertEqual([], json.loads(self.client.drain("suid")))
+
+    def test_dropped(self):
+        from src.server.portal import webclient
+        maxlen = webclient.BUFFER_MAXLEN
+        webclient.BUFFER_MAXLEN = 3
+        try:
+            for num in range(5):
+                self.client.lineSend("suid", str(num))
+        finally:
+            webclient.BUFFER_MAXLEN = maxlen
+        entries = json.loads(self.client.drain("suid"))
+        # the notice comes before what is left of the buffer
+        self.assertEqual("... 2 messages were dropped since the client could not keep up ...",
+                         entries[0]["msg"])
+        self.assertEqual(["2", "3", "4"], [entry["msg"] for entry in entries[1:]])
+        self.assertEqual([], json.loads(self.client.drain("suid")))
+
+    def test_receive(self):
+        from twisted.web import server
+        self.client.lineSend("suid", "one")
+        # buffered data is returned right away
+        request = _Request(mode="receive", suid="suid")
+        self.assertEqual([{"msg": "one", "data": None}],
+                         json.loads(self.client.render_POST(request)))
+        # else the request waits for data
+        self.assertEqual(server.NOT_DONE_YET, self.client.render_POST(request))
+        self.assertTrue(self.client.requests["suid"] is request)
+
+    def test_flush(self):
+        request = _Request()
+        self.client.requests["suid"] = request
+        self.client.lineSend("suid", "one")
+        self.client.lineSend("suid", "two")
+        self.client.lineSend("suid", "three")
+        # the waiting request is answered once, at the end of the tick
+        self.assertEqual([], request.written)
+        self.assertEqual(["suid"], self.client.flushcalls.keys())
+        self.client.flush("suid")
+        self.assertEqual(1, len(request.written))
+        self.assertEqual(["one", "two", "three"],
+                         [entry["msg"] for entry in json.loads(request.written[0])])
+        self.assertTrue(request.finished)
+        self.assertEqual({}, self.client.requests)
+        self.assertEqual({}, self.client.flushcalls)
+        # without a waiting request the data is kept for the next poll
+        self.client.lineSend("suid", "four")
+        self.assertEqual({}, self.client.flushcalls)
+        self.assertEqual(1, len(self.client.databuffer["suid"]))
+
+    def test_client_disconnect(self):
+        request = _Request()
+        self.client.requests["suid"] = request
+        self.client.lineSend("suid", "bye")
+        self.client.client_disconnect("suid")
+        self.assertEqual([{"msg": "bye", "data": None}], json.loads(request.written[0]))
+        self.assertFalse("suid" in self.client.databuffer)
+        self.assertEqual({}, self.client.flushcalls)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -36,5 +36,54 @@ class TestSession(unittest.TestCase):
         # self.assertEqual(expected, session.load_sync_data(sessdata))
         assert True # TODO: implement your test here
 
+    def test_multicast_render(self):
+        from src.server.session import Session
+        from src.server.portal.portalsessionhandler import PortalSessionHandler
+        rendered = []
+        class FakeSession(Session):
+            def render_profile(self, **kwargs):
+                return self.profile
+            def render(self, text, **kwargs):
+                rendered.append(self.profile)
+                return "%s:%s" % (self.profile, text)
+            def send_rendered(self, string):
+                self.sent = string
+            def data_out(self, text=None, **kwargs):
+                self.sent = text
+        handler = PortalSessionHandler()
+        for sessid, profile in ((1, "a"), (2, "a"), (3, "b"), (4, None)):
+            session = FakeSession()
+            session.sessid, session.profile = sessid, profile
+            handler.sessions[sessid] = session
+        handler.data_out_multicast((1, 2, 3, 4, 5), text="hi")
+        self.assertEqual(["a", "b"], rendered)
+        self.assertEqual(["a:hi", "a:hi", "b:hi", "hi"],
+                         [handler.sessions[sessid].sent for sessid in (1, 2, 3, 4)])
+
+    def test_session_indexes(self):
+        from src.server.session import Session
+        from src.server.portal.portalsessionhandler import PortalSessionHandler
+        handler = PortalSessionHandler()
+        sessions = []
+        for sessid, uid, suid in ((1, 5, "a"), (2, 5, None), (3, None, "b")):
+            session = Session()
+            session.sessid, session.uid, session.puid, session.suid = sessid, uid, None, suid
+            session.logged_in = bool(uid)
+            handler.add_session(session)
+            sessions.append(session)
+        self.assertEqual([sessions[0]], handler.session_from_suid("a"))
+        self.assertEqual(set([1, 2]), handler.uid_index[5])
+        sessions[1].puid = 7
+        handler.index_session(sessions[1])
+        self.assertEqual(set([2]), handler.puid_index[7])
+        handler.remove_session(1)
+        self.assertEqual([], handler.session_from_suid("a"))
+        self.assertEqual(set([2]), handler.uid_index[5])
+        self.assertTrue(handler.check_indexes())
+        # changing a session without re-indexing is caught
+        sessions[2].suid = "c"
+        self.assertFalse(handler.check_indexes())
+        self.assertEqual([sessions[2]], handler.session_from_suid("c"))
+
 if __name__ == '__main__':
     unittest.main()
@@ -60,6 +60,36 @@ class TestAttributeHandler(unittest.TestCase):
         # self.assertEqual(expected, attribute_handler.remove(key, raise_exception, category, accessing_obj, default_access))
         assert True # TODO: implement your test here
 
+    def test_cache_sync(self):
+        from src.typeclasses.models import (Attribute, AttributeHandler,
+                                            _attribute_post_save, _attribute_post_delete)
+        handler = AttributeHandler.__new__(AttributeHandler)
+        handler._cache = {}
+        attr = Attribute(db_key="Test", db_category="Cat")
+        handler._cache_attr(attr)
+        self.assertEqual({"test-cat": attr}, handler._cache)
+        # value saves keep the cache
+        _attribute_post_save(Attribute, instance=attr, update_fields=["db_value"])
+        self.assertEqual({"test-cat": attr}, handler._cache)
+        _attribute_post_delete(Attribute, instance=attr)
+        self.assertEqual({}, handler._cache)
+        # other saves makes the handler reload
+        handler._cache_attr(attr)
+        _attribute_post_save(Attribute, instance=attr)
+        self.assertEqual(None, handler._cache)
+
+    def test_seed_cache(self):
+        from src.typeclasses.models import Attribute, AttributeHandler
+        handler = AttributeHandler.__new__(AttributeHandler)
+        handler._reset_cache()
+        attr = Attribute(db_key="desc")
+        handler._seed_cache([attr], keys=["desc", "health"])
+        self.assertTrue(handler._is_cached(["desc-None", "health-None"]))
+        self.assertFalse(handler._is_cached(["mana-None"]))
+        self.assertEqual({"desc-None": attr}, handler._cache)
+        handler._seed_cache([])
+        self.assertTrue(handler._is_cached(["mana-None"]))
+
 class TestNickHandler(unittest.TestCase):
     def test_add(self):
         # nick_handler = NickHandler()
@@ -162,6 +192,17 @@ class TestTagHandler(unittest.TestCase):
         # self.assertEqual(expected, tag_handler.remove(key, category))
         assert True # TODO: implement your test here
 
+    def test_seed_cache(self):
+        from src.typeclasses.models import Tag, TagHandler, AliasHandler
+        tag = Tag(db_key="red", db_category="color")
+        alias = Tag(db_key="bob", db_tagtype="alias")
+        tag_handler = TagHandler.__new__(TagHandler)
+        tag_handler._seed_cache([tag, alias])
+        self.assertEqual({"red-color": tag}, tag_handler._cache)
+        alias_handler = AliasHandler.__new__(AliasHandler)
+        alias_handler._seed_cache([tag, alias])
+        self.assertEqual({"bob-None": alias}, alias_handler._cache)
+
 class TestTypedObject(unittest.TestCase):
     def test___eq__(self):
         # typed_object = TypedObject(*args, **kwargs)
@@ -247,6 +288,18 @@ class TestTypedObject(unittest.TestCase):
         # self.assertEqual(expected, typed_object.nattr(attribute_name, value, delete))
         assert True # TODO: implement your test here
 
+    def test_path_import_cache(self):
+        from src.typeclasses import models
+        models.flush_typeclass_cache()
+        typed_object = models.TypedObject.__new__(models.TypedObject)
+        cls = typed_object._path_import("src.objects.objects.Object")
+        self.assertEqual(cls, models._TYPECLASS_CACHE["src.objects.objects.Object"])
+        # failed paths are cached too
+        self.assertFalse(callable(typed_object._path_import("src.objects.nonexistent.Object")))
+        self.assertTrue("src.objects.nonexistent.Object" in models._TYPECLASS_CACHE)
+        models.flush_typeclass_cache()
+        self.assertEqual({}, models._TYPECLASS_CACHE)
+
     def test_secure_attr(self):
         # typed_object = TypedObject(*args, **kwargs)
         # self.assertEqual(expected, typed_object.secure_attr(accessing_object, attribute_name, value, delete, default_access_read, default_access_edit, default_access_create))
@@ -22,9 +22,22 @@ class TestTypeClass(unittest.TestCase):
         assert True # TODO: implement your test here
 
     def test___getattribute__(self):
-        # type_class = TypeClass(dbobj)
-        # self.assertEqual(expected, type_class.__getattribute__(propname))
-        assert True # TODO: implement your test here
+        from src.typeclasses.typeclass import TypeClass
+        class DbObj(object):
+            key = "dbkey"
+        class Typeclass(TypeClass):
+            def at_test(self):
+                return "typeclass"
+        type_class = object.__new__(Typeclass)
+        object.__setattr__(type_class, "dbobj", DbObj())
+        self.assertEqual("dbkey", type_class.key)
+        self.assertEqual("typeclass", type_class.at_test())
+        self.assertEqual({"key": True, "at_test": False}, Typeclass._propname_resolution)
+        # resolved names are still looked up on the dbobj
+        DbObj.key = "newkey"
+        self.assertEqual("newkey", type_class.key)
+        # each typeclass class has its own resolution cache
+        self.assertFalse(Typeclass._propname_resolution is TypeClass._propname_resolution)
 
     def test___init__(self):
         # type_class = TypeClass(dbobj)
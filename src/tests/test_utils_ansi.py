@@ -2,9 +2,24 @@ import unittest
 
 class TestANSIParser(unittest.TestCase):
     def test_parse_ansi(self):
-        # a_nsi_parser = ANSIParser()
-        # self.assertEqual(expected, a_nsi_parser.parse_ansi(string, strip_ansi, xterm256))
-        assert True # TODO: implement your test here
+        from src.utils.ansi import ANSIParser, ANSI_HILITE, ANSI_RED, ANSI_NORMAL, ANSI_RETURN
+        a_nsi_parser = ANSIParser()
+        self.assertEqual(ANSI_HILITE + ANSI_RED + "red{r%cn" + ANSI_NORMAL + ANSI_RETURN,
+                         a_nsi_parser.sub_tokens("{rred{{r%%cn%cn{/"))
+        self.assertEqual("red{r%cn" + ANSI_RETURN,
+                         a_nsi_parser.sub_tokens("{rred{{r%%cn\033[1m%cn{/", strip_ansi=True))
+        self.assertEqual("\033[38;5;196mred", a_nsi_parser.sub_tokens("{500red", xterm256=True))
+
+    def test_parse_indexed(self):
+        from src.utils.ansi import ANSIParser, ANSI_HILITE, ANSI_RED
+        a_nsi_parser = ANSIParser()
+        raw, clean, code_indexes, char_indexes = a_nsi_parser.parse_indexed(u"{rab{{")
+        self.assertEqual(ANSI_HILITE + ANSI_RED + "ab{", raw)
+        self.assertEqual(u"ab{", clean)
+        self.assertEqual(range(9), code_indexes)
+        self.assertEqual([9, 10, 11], char_indexes)
+        self.assertEqual((raw, clean, code_indexes, char_indexes),
+                         a_nsi_parser.parse_indexed(raw, decoded=True))
 
     def test_strip_raw_codes(self):
         # a_nsi_parser = ANSIParser()
@@ -17,9 +32,41 @@ class TestANSIParser(unittest.TestCase):
         assert True # TODO: implement your test here
 
     def test_sub_xterm256(self):
-        # a_nsi_parser = ANSIParser()
-        # self.assertEqual(expected, a_nsi_parser.sub_xterm256(rgbmatch))
-        assert True # TODO: implement your test here
+        from src.utils.ansi import ANSIParser, XTERM256_ANSI_FALLBACK, ANSI_HILITE, ANSI_RED, ANSI_BACK_BLUE
+        self.assertEqual(432, len(XTERM256_ANSI_FALLBACK))
+        a_nsi_parser = ANSIParser()
+        a_nsi_parser.do_xterm256 = True
+        self.assertEqual("\033[38;5;196m", a_nsi_parser.xterm256_sub.sub(a_nsi_parser.sub_xterm256, "{500"))
+        self.assertEqual("\033[48;5;021m", a_nsi_parser.xterm256_sub.sub(a_nsi_parser.sub_xterm256, "{[005"))
+        a_nsi_parser.do_xterm256 = False
+        self.assertEqual(ANSI_HILITE + ANSI_RED, a_nsi_parser.xterm256_sub.sub(a_nsi_parser.sub_xterm256, "{500"))
+        self.assertEqual(ANSI_BACK_BLUE, a_nsi_parser.xterm256_sub.sub(a_nsi_parser.sub_xterm256, "{[005"))
+
+    def test_parse_cache(self):
+        from src.utils.ansi import ANSIParser, parse_cache_stats, ANSI_HILITE, ANSI_RED
+        a_nsi_parser = ANSIParser()
+        string = "{rtest_parse_cache"
+        hits = parse_cache_stats()["hits"]
+        self.assertEqual(ANSI_HILITE + ANSI_RED + "test_parse_cache", a_nsi_parser.parse_ansi(string))
+        self.assertEqual("test_parse_cache", a_nsi_parser.parse_ansi(string, strip_ansi=True))
+        self.assertEqual(hits, parse_cache_stats()["hits"])
+        self.assertEqual(ANSI_HILITE + ANSI_RED + "test_parse_cache", a_nsi_parser.parse_ansi(string))
+        self.assertEqual("test_parse_cache", a_nsi_parser.parse_ansi(string, strip_ansi=True))
+        self.assertEqual(hits + 2, parse_cache_stats()["hits"])
+        # parsings are cached per parser
+        ANSIParser().parse_ansi(string)
+        self.assertEqual(hits + 2, parse_cache_stats()["hits"])
+
+    def test_own_maps(self):
+        from src.utils.ansi import ANSIParser, ANSI_HILITE, ANSI_RED
+        class OwnParser(ANSIParser):
+            ansi_map = [(r'~R', "RED"), (r'\\n', "NEWLINE")]
+        own_parser, a_nsi_parser = OwnParser(), ANSIParser()
+        self.assertEqual("RED{r", own_parser.parse_ansi("~R{r"))
+        self.assertEqual("~R" + ANSI_HILITE + ANSI_RED, a_nsi_parser.parse_ansi("~R{r"))
+        # replacing a map takes effect
+        own_parser.ansi_map = {"~R": "OTHER"}
+        self.assertEqual("OTHER{r", own_parser.parse_ansi("~R{r"))
 
     def test_parse_rgb(self):
         # a_nsi_parser = ANSIParser()
@@ -120,5 +120,47 @@ class TestDbunserialize(unittest.TestCase):
         # self.assertEqual(expected, dbunserialize(data, db_obj))
         assert True # TODO: implement your test here
 
+class TestIsFlat(unittest.TestCase):
+    def test_is_flat(self):
+        from src.utils.dbserialize import is_flat
+        for value in (1, 2.5, "str", u"uni", None, True, (1, "a"), [1, 2], set([1]), {"a": 1}):
+            self.assertTrue(is_flat(value))
+        for value in ([1, [2]], {"a": {"b": 1}}, (1, (2,)), object()):
+            self.assertFalse(is_flat(value))
+
+    def test_fast_path(self):
+        from src.utils import dbserialize
+        for value in (1, "str", (1, 2), [1, 2], {"a": 1}, set([1])):
+            self.assertEqual(dbserialize._to_pickle(value), dbserialize.to_pickle(value))
+            self.assertEqual(dbserialize._from_pickle(value), dbserialize.from_pickle(value))
+        data = [1, 2]
+        self.assertFalse(dbserialize.to_pickle(data) is data)
+
+class TestFlush(unittest.TestCase):
+    def test_flush(self):
+        from src.utils import dbserialize
+
+        class FakeAttribute(object):
+            "Counts saves"
+            def __init__(self):
+                self.saves = []
+            def _set_value(self, value):
+                self.saves.append(dbserialize.to_pickle(value))
+            value = property(lambda self: None, _set_value)
+
+        attr1, attr2 = FakeAttribute(), FakeAttribute()
+        root1 = dbserialize._SaverList(db_obj=attr1)
+        root2 = dbserialize._SaverDict(db_obj=attr2)
+        root1._data.extend([1, 2])
+        dbserialize._DIRTY_ROOTS[id(attr1)] = root1
+        dbserialize._DIRTY_ROOTS[id(attr2)] = root2
+        dbserialize.flush(attr1)
+        self.assertEqual([[1, 2]], attr1.saves)
+        dbserialize.discard(attr2)
+        dbserialize.flush()
+        self.assertEqual([[1, 2]], attr1.saves)
+        self.assertEqual([], attr2.saves)
+        self.assertEqual({}, dbserialize._DIRTY_ROOTS)
+
 if __name__ == '__main__':
     unittest.main()
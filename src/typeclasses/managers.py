@@ -322,3 +322,87 @@ class TypedObjectManager(idmapper.manager.SharedMemoryManager):
                     query = query | Q(db_typeclass_path__exact=parent.path)
         # actually query the database
         return self.filter(query)
+
+    def prefetch_attributes(self, objs, keys=None, category=None, handlername="attributes"):
+        """
+        Load the Attributes of many objects using a single database
+        query and store them in the Attribute cache of each object.
+        This avoids one query per object when later looking up
+        Attributes on all of them, like when showing the contents
+        of a room. Objects which already have all their Attributes
+        cached are skipped.
+
+        objs - objects (or typeclasses) handled by this manager
+        keys - optional key or list of keys to load. If not given,
+               all Attributes on the objects are loaded.
+        category - category of the keys to load (only used with keys)
+        handlername - name of the AttributeHandler on the objects to
+               fill, like "attributes" or "nicks"
+        """
+        handlers = {}
+        for obj in make_iter(objs):
+            dbobj = _GA(obj, "dbobj")
+            # the first access also loads a lazy handler
+            if getattr(dbobj, handlername)._cache_complete:
+                continue
+            handlers[_GA(dbobj, "id")] = getattr(dbobj, handlername)
+        if not handlers:
+            return
+
+        handler = handlers.values()[0]
+        field = self.model._meta.get_field(handler._m2m_fieldname)
+        objfield, attrfield = field.m2m_field_name(), field.m2m_reverse_field_name()
+        query = Q(**{"%s__in" % objfield: handlers.keys(),
+                     "%s__db_model" % attrfield: handler._model})
+        if handler._attrtype:
+            query &= Q(**{"%s__db_attrtype" % attrfield: handler._attrtype})
+        else:
+            query &= (Q(**{"%s__db_attrtype" % attrfield: None}) |
+                      Q(**{"%s__db_attrtype" % attrfield: ""}))
+        if keys is not None:
+            query &= Q(**{"%s__db_key__in" % attrfield: [key.strip().lower()
+                                                        for key in make_iter(keys) if key]})
+            if category is None:
+                query &= Q(**{"%s__db_category__isnull" % attrfield: True})
+            else:
+                query &= Q(**{"%s__db_category" % attrfield: category.strip().lower()})
+
+        attrs = dict((objid, []) for objid in handlers)
+        for row in field.rel.through.objects.filter(query).select_related(attrfield):
+            attrs[getattr(row, "%s_id" % objfield)].append(getattr(row, attrfield))
+        for objid, handler in handlers.items():
+            handler._seed_cache(attrs[objid], keys=keys, category=category)
+
+    def prefetch_tags(self, objs, handlernames=("tags", "aliases", "permissions")):
+        """
+        Load the Tags (including aliases and permissions) of many
+        objects using a single database query and store them in
+        the Tag cache of each object's tag handlers. Handlers which
+        already have a cache are skipped.
+
+        objs - objects (or typeclasses) handled by this manager
+        handlernames - names of the TagHandlers on the objects to fill
+        """
+        handlers = {}
+        for obj in make_iter(objs):
+            dbobj = _GA(obj, "dbobj")
+            # the first access also loads a lazy handler
+            objhandlers = [getattr(dbobj, name) for name in handlernames]
+            objhandlers = [handler for handler in objhandlers if handler._cache is None]
+            if objhandlers:
+                handlers[_GA(dbobj, "id")] = objhandlers
+        if not handlers:
+            return
+
+        handler = handlers.values()[0][0]
+        field = self.model._meta.get_field(handler._m2m_fieldname)
+        objfield, tagfield = field.m2m_field_name(), field.m2m_reverse_field_name()
+        query = Q(**{"%s__in" % objfield: handlers.keys(),
+                     "%s__db_model" % tagfield: handler._model})
+
+        tags = dict((objid, []) for objid in handlers)
+        for row in field.rel.through.objects.filter(query).select_related(tagfield):
+            tags[getattr(row, "%s_id" % objfield)].append(getattr(row, tagfield))
+        for objid, objhandlers in handlers.items():
+            for handler in objhandlers:
+                handler._seed_cache(tags[objid])
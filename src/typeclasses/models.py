@@ -32,6 +32,7 @@ import traceback
 import weakref
 
 from django.db import models
+from django.db.models.signals import post_save, post_delete
 from django.core.exceptions import ObjectDoesNotExist
 from django.conf import settings
 from django.db.models import Q
@@ -50,6 +51,7 @@ from src.utils import logger
 from src.utils.utils import (
     make_iter, is_iter, to_str, inherits_from, LazyLoadHandler)
 from src.utils.dbserialize import to_pickle, from_pickle
+from src.utils import dbserialize
 from src.utils.picklefield import PickledObjectField
 
 __all__ = ("Attribute", "TypeNick", "TypedObject")
@@ -64,6 +66,20 @@ _GA = object.__getattribute__
 _SA = object.__setattr__
 _DA = object.__delattr__
 
+# Results of importing typeclass paths, {path: result}, shared by all
+# typed entities. The result is the class, or whatever else
+# TypedObject._path_import returned for the path (like an error string
+# or None for a module that doesn't exist), so failing paths are not
+# tried again either. @reload restarts the Server process, which starts
+# with an empty cache; use flush_typeclass_cache() if typeclass modules
+# are changed or added without a reload.
+_TYPECLASS_CACHE = {}
+
+
+def flush_typeclass_cache():
+    "Forget all imported typeclass paths"
+    _TYPECLASS_CACHE.clear()
+
 
 #------------------------------------------------------------
 #
@@ -139,6 +155,10 @@ class Attribute(SharedMemoryModel):
         super(Attribute, self).__init__(*args, **kwargs)
         self.locks = LazyLoadHandler(self, "locks", LockHandler)
 
+    # Attributes are held on to by the AttributeHandler caches of their
+    # objects, so they must stay in the idmapper cache as long as those do
+    _idmapper_evictable = False
+
     class Meta:
         "Define Django meta options"
         verbose_name = "Evennia Attribute"
@@ -170,23 +190,42 @@ class Attribute(SharedMemoryModel):
     # is the object in question).
 
     # value property (wraps db_value)
+    _value_cache = None  # on the form (value,) when set
+
     #@property
     def __value_get(self):
         """
         Getter. Allows for value = self.value.
-        We cannot cache here since it makes certain cases (such
-        as storing a dbobj which is then deleted elsewhere) out-of-sync.
-        The overhead of unpickling seems hard to avoid.
+        Only values without database objects in them (see
+        dbserialize.is_flat) are cached, since caching others
+        makes certain cases (such as storing a dbobj which is then
+        deleted elsewhere) out-of-sync.
         """
-        return from_pickle(self.db_value, db_obj=self)
+        # store any pending changes to a nested mutable first
+        dbserialize.flush(self)
+        if self._value_cache:
+            return self._value_cache[0]
+        value = from_pickle(self.db_value, db_obj=self)
+        if dbserialize.is_flat(value):
+            self._value_cache = (value,)
+        return value
 
     #@value.setter
     def __value_set(self, new_value):
         """
-        Setter. Allows for self.value = value. We cannot cache here,
-        see self.__value_get.
+        Setter. Allows for self.value = value. See self.__value_get
+        for caching.
         """
+        dbserialize.discard(self)
         self.db_value = to_pickle(new_value)
+        # primitives and our own mutable handed back to us (see
+        # dbserialize.flush) can be cached, the rest is converted
+        # on next read
+        self._value_cache = None
+        if type(new_value) in dbserialize._SIMPLE_TYPES or (
+                isinstance(new_value, dbserialize._SaverMutable) and
+                new_value._db_obj is self and dbserialize.is_flat(new_value)):
+            self._value_cache = (new_value,)
         self.save(update_fields=["db_value"])
 
     #@value.deleter
@@ -239,18 +278,79 @@ class AttributeHandler(object):
         self.obj = obj
         self._model = "%s.%s" % ContentType.objects.get_for_model(obj).natural_key()
         self._cache = None
+        # set when all Attributes are cached, otherwise only the
+        # cachekeys in _cache_keys are known to be up-to-date.
+        self._cache_complete = False
+        self._cache_keys = set()
 
     def _recache(self):
+        """
+        Load all Attributes of this handler from the database. After
+        this the cache is kept up to date by the handler's methods
+        and by the Attribute post_save/post_delete signals, so this
+        should normally only be needed once.
+        """
         if not self._attrtype:
             attrtype = Q(db_attrtype=None) | Q(db_attrtype='')
         else:
             attrtype = Q(db_attrtype=self._attrtype)
-        self._cache = dict(("%s-%s" % (to_str(attr.db_key).lower(),
-                                       attr.db_category.lower() if attr.db_category else None), attr)
-                        for attr in getattr(self.obj, self._m2m_fieldname).filter(
-                            db_model=self._model).filter(attrtype))
+        self._cache = {}
+        for attr in getattr(self.obj, self._m2m_fieldname).filter(
+                            db_model=self._model).filter(attrtype):
+            self._cache_attr(attr)
+        self._cache_complete = True
+        self._cache_keys = set()
         #set_attr_cache(self.obj, self._cache) # currently only for testing
 
+    def _cache_attr(self, attr):
+        """
+        Add an Attribute to the cache. The Attribute remembers
+        this handler so signals can keep the cache in sync.
+        """
+        cachekey = "%s-%s" % (to_str(attr.db_key).lower(),
+                              attr.db_category.lower() if attr.db_category else None)
+        self._cache[cachekey] = attr
+        attr._attrhandler = weakref.ref(self)
+
+    def _reset_cache(self):
+        "Forget the cache; it will be reloaded on next access"
+        self._cache = None
+        self._cache_complete = False
+        self._cache_keys = set()
+
+    def _seed_cache(self, attrs, keys=None, category=None):
+        """
+        Fill the cache with Attributes loaded elsewhere, like by
+        TypedObjectManager.prefetch_attributes. If keys are given,
+        only those keys (with the given category) are considered
+        loaded, other lookups will still query the database.
+        """
+        if self._cache_complete:
+            return
+        if self._cache is None:
+            self._cache = {}
+        for attr in attrs:
+            self._cache_attr(attr)
+        if keys is None:
+            self._cache_complete = True
+            self._cache_keys = set()
+        else:
+            category = category.strip().lower() if category is not None else None
+            self._cache_keys.update("%s-%s" % (k.strip().lower(), category)
+                                    for k in make_iter(keys) if k)
+
+    def _is_cached(self, searchkeys):
+        "Check if the given cachekeys can be looked up in the cache"
+        return self._cache_complete or bool(searchkeys and
+                                            self._cache_keys.issuperset(searchkeys))
+
+    def _uncache_attr(self, attr):
+        "Remove an Attribute from the cache"
+        if self._cache:
+            for cachekey in [cachekey for cachekey, cattr in self._cache.items()
+                             if cattr is attr]:
+                del self._cache[cachekey]
+
     def has(self, key, category=None):
         """
         Checks if the given Attribute (or list of Attributes) exists on
@@ -258,11 +358,11 @@ class AttributeHandler(object):
 
         If an iterable is given, returns list of booleans.
         """
-        if self._cache is None or not _TYPECLASS_AGGRESSIVE_CACHE:
-            self._recache()
         key = [k.strip().lower() for k in make_iter(key) if k]
         category = category.strip().lower() if category is not None else None
         searchkeys = ["%s-%s" % (k, category) for k in make_iter(key)]
+        if not self._is_cached(searchkeys):
+            self._recache()
         ret = [self._cache.get(skey) for skey in searchkeys if skey in self._cache]
         return ret[0] if len(ret) == 1 else ret
 
@@ -290,11 +390,11 @@ class AttributeHandler(object):
                 self.value = default
                 self.strvalue = str(default) if default is not None else None
 
-        if self._cache is None or not _TYPECLASS_AGGRESSIVE_CACHE:
-            self._recache()
         ret = []
         key = [k.strip().lower() for k in make_iter(key) if k]
         category = category.strip().lower() if category is not None else None
+        if not self._is_cached(["%s-%s" % (k, category) for k in key]):
+            self._recache()
         #print "cache:", self._cache.keys(), key
         if not key:
             # return all with matching category (or no category)
@@ -338,7 +438,7 @@ class AttributeHandler(object):
                                       self._attrcreate, default=default_access):
             # check create access
             return
-        if self._cache is None:
+        if not self._cache_complete:
             self._recache()
         if not key:
             return
@@ -366,7 +466,7 @@ class AttributeHandler(object):
             new_attr = Attribute(**kwargs)
             new_attr.save()
             getattr(self.obj, self._m2m_fieldname).add(new_attr)
-            self._cache[cachekey] = new_attr
+            self._cache_attr(new_attr)
 
 
     def batch_add(self, key, value, category=None, lockstring="",
@@ -383,7 +483,7 @@ class AttributeHandler(object):
                                       self._attrcreate, default=default_access):
             # check create access
             return
-        if self._cache is None:
+        if not self._cache_complete:
             self._recache()
         if not key:
             return
@@ -421,7 +521,8 @@ class AttributeHandler(object):
         if new_attrobjs:
             # Add new objects to m2m field all at once
             getattr(self.obj, self._m2m_fieldname).add(*new_attrobjs)
-            self._recache()
+            for new_attr in new_attrobjs:
+                self._cache_attr(new_attr)
 
 
     def remove(self, key, raise_exception=False, category=None,
@@ -431,7 +532,7 @@ class AttributeHandler(object):
         If accessing_obj is given, will check against the 'attredit' lock.
         If not given, this check is skipped.
         """
-        if self._cache is None or not _TYPECLASS_AGGRESSIVE_CACHE:
+        if not self._cache_complete:
             self._recache()
         key = [k.strip().lower() for k in make_iter(key) if k]
         category = category.strip().lower() if category is not None else None
@@ -441,9 +542,9 @@ class AttributeHandler(object):
                 if not (accessing_obj and not attr_obj.access(accessing_obj,
                         self._attredit, default=default_access)):
                     attr_obj.delete()
+                    self._uncache_attr(attr_obj)
             elif not attr_obj and raise_exception:
                 raise AttributeError
-        self._recache()
 
     def clear(self, category=None, accessing_obj=None, default_access=True):
         """
@@ -451,14 +552,13 @@ class AttributeHandler(object):
         given, check the 'attredit' lock on each Attribute before
         continuing. If not given, skip check.
         """
-        if self._cache is None or not _TYPECLASS_AGGRESSIVE_CACHE:
+        if not self._cache_complete:
             self._recache()
-        if accessing_obj:
-            [attr.delete() for attr in self._cache.values()
-             if attr.access(accessing_obj, self._attredit, default=default_access)]
-        else:
-            [attr.delete() for attr in self._cache.values()]
-        self._recache()
+        for attr in self._cache.values():
+            if not accessing_obj or attr.access(accessing_obj, self._attredit,
+                                                default=default_access):
+                attr.delete()
+                self._uncache_attr(attr)
 
     def all(self, accessing_obj=None, default_access=True):
         """
@@ -468,7 +568,7 @@ class AttributeHandler(object):
         each attribute before returning them. If not given, this
         check is skipped.
         """
-        if self._cache is None or not _TYPECLASS_AGGRESSIVE_CACHE:
+        if not self._cache_complete:
             self._recache()
         if accessing_obj:
             return [attr for attr in self._cache.values()
@@ -477,6 +577,40 @@ class AttributeHandler(object):
             return self._cache.values()
 
 
+def _attribute_post_save(sender, instance=None, created=False, update_fields=None, raw=False, **kwargs):
+    """
+    Called when an Attribute is saved. Attribute instances are shared
+    through the idmapper, so value changes are seen by the
+    AttributeHandler directly. Other changes (like from the admin
+    interface, which may change the key) makes the handler reload.
+    """
+    if raw or created:
+        return
+    if not update_fields:
+        # db_value may have been changed directly
+        instance._value_cache = None
+    if update_fields and set(update_fields).issubset(("db_value", "db_strvalue", "db_lock_storage")):
+        return
+    handler = getattr(instance, "_attrhandler", None)
+    handler = handler() if handler else None
+    if handler:
+        handler._reset_cache()
+post_save.connect(_attribute_post_save, sender=Attribute, dispatch_uid="attributecache")
+
+
+def _attribute_post_delete(sender, instance=None, **kwargs):
+    """
+    Called when an Attribute is deleted, making sure the
+    AttributeHandler forgets about it.
+    """
+    dbserialize.discard(instance)
+    handler = getattr(instance, "_attrhandler", None)
+    handler = handler() if handler else None
+    if handler:
+        handler._uncache_attr(instance)
+post_delete.connect(_attribute_post_delete, sender=Attribute, dispatch_uid="attributecache")
+
+
 class NickHandler(AttributeHandler):
     """
     Handles the addition and removal of Nicks
@@ -642,6 +776,16 @@ class TagHandler(object):
                                self.obj, self._m2m_fieldname).filter(
                                    db_model=self._model).filter(tagtype))
 
+    def _seed_cache(self, tags):
+        """
+        Fill the cache with Tags loaded elsewhere, like by
+        TypedObjectManager.prefetch_tags. The tags may be of
+        any tagtype, only those of this handler are used.
+        """
+        tagtype = self._tagtype or None
+        self._cache = dict(("%s-%s" % (tag.db_key, tag.db_category), tag)
+                           for tag in tags if (tag.db_tagtype or None) == tagtype)
+
     def add(self, tag=None, category=None, data=None):
         "Add a new tag to the handler. Tag is a string or a list of strings."
         if not tag:
@@ -799,6 +943,10 @@ class TypedObject(SharedMemoryModel):
 
     # quick on-object typeclass cache for speed
     _cached_typeclass = None
+    # names found to live on the typeclass rather than on this model
+    # (see __getattribute__). Each model class gets its own set the
+    # first time a name is added.
+    _typeclass_propnames = frozenset()
 
     # lock handler self.locks
     def __init__(self, *args, **kwargs):
@@ -867,6 +1015,14 @@ class TypedObject(SharedMemoryModel):
         the typeclass refers back to the databaseobject as well, we
         have to be very careful to avoid loops.
         """
+        if propname in _GA(self, '_typeclass_propnames') and propname not in _GA(self, '__dict__'):
+            # we have seen this name before and it is not defined on
+            # the model, so go straight to the typeclass.
+            try:
+                return _GA(_GA(self, 'typeclass'), propname)
+            except AttributeError:
+                # let the full lookup below report the error
+                pass
         try:
             return _GA(self, propname)
         except AttributeError:
@@ -877,7 +1033,13 @@ class TypedObject(SharedMemoryModel):
             # (we make sure to not incur a loop by not triggering the
             # typeclass' __getattribute__, since that one would
             # try to look back to this very database object.)
-            return _GA(_GA(self, 'typeclass'), propname)
+            value = _GA(_GA(self, 'typeclass'), propname)
+            cls = _GA(self, '__class__')
+            if not hasattr(cls, propname):
+                if '_typeclass_propnames' not in cls.__dict__:
+                    cls._typeclass_propnames = set()
+                cls._typeclass_propnames.add(propname)
+            return value
 
     def _hasattr(self, obj, attrname):
         """
@@ -1006,13 +1168,31 @@ class TypedObject(SharedMemoryModel):
     def _path_import(self, path):
         """
         Import a class from a python path of the
-        form src.objects.object.Object
+        form src.objects.object.Object. The result is
+        cached, so every path is only imported once.
         """
-        errstring = ""
         if not path:
             # this needs not be bad, it just means
             # we should use defaults.
             return None
+        try:
+            return _TYPECLASS_CACHE[path]
+        except (KeyError, TypeError):
+            pass
+        result = _GA(self, "_path_import_uncached")(path)
+        try:
+            _TYPECLASS_CACHE[path] = result
+        except TypeError:
+            # unhashable path; it is reported as malformed
+            pass
+        return result
+
+    def _path_import_uncached(self, path):
+        """
+        Does the actual import for _path_import. Returns the class
+        or an error string.
+        """
+        errstring = ""
         try:
             modpath, class_name = path.rsplit('.', 1)
             module = __import__(modpath, fromlist=["none"])
@@ -46,6 +46,10 @@ class MetaTypeClass(type):
         super(MetaTypeClass, mcs).__init__(*args, **kwargs)
         mcs.typename = mcs.__name__
         mcs.path = "%s.%s" % (mcs.__module__, mcs.__name__)
+        # attribute resolution cache {propname: on_dbobj} used by
+        # TypeClass.__getattribute__. Every class gets its own, since
+        # subclasses may define more names.
+        mcs._propname_resolution = {}
 
     def __str__(cls):
         return "%s" % cls.__name__
@@ -97,25 +101,49 @@ class TypeClass(object):
         priority, so if you define a same-named
         property on the class, it will NOT be
         accessible through getattr.
+
+        Where a name was found is remembered per typeclass class,
+        so names living on the dbobj (like key, location or db)
+        are looked up there directly on later accesses.
         """
-        if propname.startswith('__') and propname.endswith('__'):
+        on_dbobj = _GA(self, '_propname_resolution').get(propname)
+        if on_dbobj and propname not in _GA(self, '__dict__'):
+            # a name we know is not defined on the typeclass, so go
+            # straight to the dbobj instead of failing a lookup here first.
+            try:
+                return _GA(_GA(self, 'dbobj'), propname)
+            except AttributeError:
+                # let the full lookup below report the error
+                pass
+        elif on_dbobj is None and propname.startswith('__') and propname.endswith('__'):
             # python specials are parsed as-is (otherwise things like
             # isinstance() fail to identify the typeclass)
+            _GA(self, '_propname_resolution')[propname] = False
             return _GA(self, propname)
-        #print "get %s (dbobj:%s)" % (propname, type(dbobj))
         try:
-            return _GA(self, propname)
+            value = _GA(self, propname)
         except AttributeError:
+            if propname.startswith('__') and propname.endswith('__'):
+                raise
             try:
                 dbobj = _GA(self, 'dbobj')
             except AttributeError:
                 log_trace("Typeclass CRITICAL ERROR! dbobj not found for Typeclass %s!" % self)
                 raise
             try:
-                return _GA(dbobj, propname)
+                value = _GA(dbobj, propname)
             except AttributeError:
                 string = "Object: '%s' not found on %s(#%s), nor on its typeclass %s."
                 raise AttributeError(string % (propname, dbobj, _GA(dbobj, "dbid"), _GA(dbobj, "typeclass_path")))
+            if not hasattr(_GA(self, '__class__'), propname):
+                # only names the typeclass class doesn't define at all are
+                # sent directly to the dbobj; a property raising
+                # AttributeError must still be tried every time.
+                _GA(self, '_propname_resolution')[propname] = True
+            return value
+        if on_dbobj is None:
+            _GA(self, '_propname_resolution')[propname] = False
+        return value
 
     def __setattr__(self, propname, value):
         """
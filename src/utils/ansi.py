@@ -61,8 +61,141 @@ ANSI_SPACE = " "
 ANSI_ESCAPES = ("{{", "%%", "\\\\")
 
 from collections import OrderedDict
+# parsed strings, keyed on (parser, string, strip_ansi, xterm256), least
+# recently used first
 _PARSE_CACHE = OrderedDict()
 _PARSE_CACHE_SIZE = 10000
+_PARSE_CACHE_STATS = {"hits": 0, "misses": 0}
+
+
+def _xterm256_to_ansi(red, green, blue, background):
+    """
+    Convert an xterm256 rgb value (0-5 each) to the closest
+    normal ANSI colour, for clients not supporting xterm256.
+    """
+    if red == green and red == blue and red < 2:
+        if background:
+            return ANSI_BACK_BLACK
+        elif red >= 1:
+            return ANSI_HILITE + ANSI_BLACK
+        else:
+            return ANSI_NORMAL + ANSI_BLACK
+    elif red == green and red == blue:
+        if background:
+            return ANSI_BACK_WHITE
+        elif red >= 4:
+            return ANSI_HILITE + ANSI_WHITE
+        else:
+            return ANSI_NORMAL + ANSI_WHITE
+    elif red > green and red > blue:
+        if background:
+            return ANSI_BACK_RED
+        elif red >= 3:
+            return ANSI_HILITE + ANSI_RED
+        else:
+            return ANSI_NORMAL + ANSI_RED
+    elif red == green and red > blue:
+        if background:
+            return ANSI_BACK_YELLOW
+        elif red >= 3:
+            return ANSI_HILITE + ANSI_YELLOW
+        else:
+            return ANSI_NORMAL + ANSI_YELLOW
+    elif red == blue and red > green:
+        if background:
+            return ANSI_BACK_MAGENTA
+        elif red >= 3:
+            return ANSI_HILITE + ANSI_MAGENTA
+        else:
+            return ANSI_NORMAL + ANSI_MAGENTA
+    elif green > blue:
+        if background:
+            return ANSI_BACK_GREEN
+        elif green >= 3:
+            return ANSI_HILITE + ANSI_GREEN
+        else:
+            return ANSI_NORMAL + ANSI_GREEN
+    elif green == blue:
+        if background:
+            return ANSI_BACK_CYAN
+        elif green >= 3:
+            return ANSI_HILITE + ANSI_CYAN
+        else:
+            return ANSI_NORMAL + ANSI_CYAN
+    else:    # mostly blue
+        if background:
+            return ANSI_BACK_BLUE
+        elif blue >= 3:
+            return ANSI_HILITE + ANSI_BLUE
+        else:
+            return ANSI_NORMAL + ANSI_BLUE
+
+
+def _xterm256_code(red, green, blue, background):
+    """
+    The xterm256 escape sequence for an rgb value (0-5 each).
+    """
+    colval = 16 + (red * 36) + (green * 6) + blue
+    return "\033[%s8;5;%s%s%sm" % (3 + int(background), colval/100, (colval % 100)/10, colval%10)
+
+
+# The 216 xterm256 colours as tags ("123" for foreground, "[123" for
+# background) mapped to their xterm256 sequence and their ANSI fallback.
+XTERM256_CODES = {}
+XTERM256_ANSI_FALLBACK = {}
+for _red in range(6):
+    for _green in range(6):
+        for _blue in range(6):
+            for _background in (False, True):
+                _tag = "%s%i%i%i" % ("[" if _background else "", _red, _green, _blue)
+                XTERM256_CODES[_tag] = _xterm256_code(_red, _green, _blue, _background)
+                XTERM256_ANSI_FALLBACK[_tag] = _xterm256_to_ansi(_red, _green, _blue, _background)
+
+
+def _token_tables(ansi_map, ansi_regex):
+    """
+    Build the lookup tables of the single-pass parser: every markup
+    token mapped to its replacement when rendering with xterm256,
+    when rendering with normal ANSI only and when stripping markup,
+    as well as the set of tokens replaced by ANSI codes.
+    """
+    # ANSI_ESCAPES are regex patterns, the one for backslash matches
+    # a single backslash; an escape is replaced by its first character
+    token_ansi = dict((escape.replace("\\\\", "\\"), escape[0]) for escape in ANSI_ESCAPES)
+    token_ansi.update(ansi_map)
+    token_codes = set(token for token, code in token_ansi.items() if not ansi_regex.sub("", code))
+    token_xterm256 = dict(token_ansi)
+    for tag in XTERM256_CODES:
+        for marker in ("{", "%"):
+            token_xterm256[marker + tag] = XTERM256_CODES[tag]
+            token_ansi[marker + tag] = XTERM256_ANSI_FALLBACK[tag]
+            token_codes.add(marker + tag)
+    token_strip = dict((token, "" if token in token_codes else replacement)
+                       for token, replacement in token_ansi.items())
+    return token_xterm256, token_ansi, token_strip, frozenset(token_codes)
+
+
+def _build_tokens(ansi_map, xterm256_map, ansi_regex):
+    """
+    Build the regex and lookup tables of the single-pass parser from
+    the maps of a parser. A dict ansi_map maps literal markup to ansi
+    codes. A list of (pattern, code) tuples, like the one of the IMC2
+    parser, holds regex patterns of literal markup in which characters
+    may be escaped. Returns (token_regex, token_xterm256, token_ansi,
+    token_strip, token_codes).
+    """
+    if isinstance(ansi_map, dict):
+        ansi_map = dict(ansi_map)
+    else:
+        ansi_map = dict((re.sub(r"\\(.)", r"\1", pattern), code) for pattern, code in ansi_map)
+    # match escapes, xterm256 and ansi markup and already inserted ansi
+    # codes, in that order of priority (longer markup first)
+    markup = sorted(ansi_map, key=len, reverse=True)
+    token_regex = re.compile(r"(%s)" % "|".join(list(ANSI_ESCAPES) +
+                                              [tup[0] for tup in xterm256_map] +
+                                              [re.escape(token) for token in markup] +
+                                              [ansi_regex.pattern]), re.DOTALL)
+    return (token_regex,) + _token_tables(ansi_map, ansi_regex)
 
 
 class ANSIParser(object):
@@ -96,75 +229,11 @@ class ANSIParser(object):
         # get tag, stripping the initial marker
         rgbtag = rgbmatch.group()[1:]
 
-        background = rgbtag[0] == '['
-        if background:
-            red, green, blue = int(rgbtag[1]), int(rgbtag[2]), int(rgbtag[3])
-        else:
-            red, green, blue = int(rgbtag[0]), int(rgbtag[1]), int(rgbtag[2])
-
         if self.do_xterm256:
-            colval = 16 + (red * 36) + (green * 6) + blue
-            #print "RGB colours:", red, green, blue
-            return "\033[%s8;5;%s%s%sm" % (3 + int(background), colval/100, (colval % 100)/10, colval%10)
+            return XTERM256_CODES[rgbtag]
         else:
-            #print "ANSI convert:", red, green, blue
             # xterm256 not supported, convert the rgb value to ansi instead
-            if red == green and red == blue and red < 2:
-                if background:
-                    return ANSI_BACK_BLACK
-                elif red >= 1:
-                    return ANSI_HILITE + ANSI_BLACK
-                else:
-                    return ANSI_NORMAL + ANSI_BLACK
-            elif red == green and red == blue:
-                if background:
-                    return ANSI_BACK_WHITE
-                elif red >= 4:
-                    return ANSI_HILITE + ANSI_WHITE
-                else:
-                    return ANSI_NORMAL + ANSI_WHITE
-            elif red > green and red > blue:
-                if background:
-                    return ANSI_BACK_RED
-                elif red >= 3:
-                    return ANSI_HILITE + ANSI_RED
-                else:
-                    return ANSI_NORMAL + ANSI_RED
-            elif red == green and red > blue:
-                if background:
-                    return ANSI_BACK_YELLOW
-                elif red >= 3:
-                    return ANSI_HILITE + ANSI_YELLOW
-                else:
-                    return ANSI_NORMAL + ANSI_YELLOW
-            elif red == blue and red > green:
-                if background:
-                    return ANSI_BACK_MAGENTA
-                elif red >= 3:
-                    return ANSI_HILITE + ANSI_MAGENTA
-                else:
-                    return ANSI_NORMAL + ANSI_MAGENTA
-            elif green > blue:
-                if background:
-                    return ANSI_BACK_GREEN
-                elif green >= 3:
-                    return ANSI_HILITE + ANSI_GREEN
-                else:
-                    return ANSI_NORMAL + ANSI_GREEN
-            elif green == blue:
-                if background:
-                    return ANSI_BACK_CYAN
-                elif green >= 3:
-                    return ANSI_HILITE + ANSI_CYAN
-                else:
-                    return ANSI_NORMAL + ANSI_CYAN
-            else:    # mostly blue
-                if background:
-                    return ANSI_BACK_BLUE
-                elif blue >= 3:
-                    return ANSI_HILITE + ANSI_BLUE
-                else:
-                    return ANSI_NORMAL + ANSI_BLUE
+            return XTERM256_ANSI_FALLBACK[rgbtag]
 
     def strip_raw_codes(self, string):
         """
@@ -172,6 +241,26 @@ class ANSIParser(object):
         """
         return self.ansi_regex.sub("", string)
 
+    def _get_tokens(self):
+        """
+        Returns the (token_regex, token_xterm256, token_ansi,
+        token_strip, token_codes) used for single-pass parsing. They
+        are built from the maps of this parser when first needed (so
+        subclasses and instances may use maps of their own) and
+        rebuilt if one of the maps is replaced.
+        """
+        maps = (self.ansi_map, self.xterm256_map, self.ansi_regex)
+        cached = self.__dict__.get("_token_cache")
+        if cached and all(old is new for old, new in zip(cached[0], maps)):
+            return cached[1]
+        if cached:
+            # forget parsings done with the old maps
+            for cachekey in [cachekey for cachekey in _PARSE_CACHE if cachekey[0] is self]:
+                del _PARSE_CACHE[cachekey]
+        tokens = _build_tokens(*maps)
+        self._token_cache = (maps, tokens)
+        return tokens
+
     def parse_ansi(self, string, strip_ansi=False, xterm256=False):
         """
         Parses a string, subbing color codes according to
@@ -189,34 +278,87 @@ class ANSIParser(object):
         if not string:
             return ''
 
-        # check cached parsings
-        global _PARSE_CACHE
-        cachekey = "%s-%s-%s" % (string, strip_ansi, xterm256)
-        if cachekey in _PARSE_CACHE:
-            return _PARSE_CACHE[cachekey]
+        # check cached parsings (after making sure those done with
+        # replaced maps are forgotten)
+        self._get_tokens()
+        cachekey = (self, string, bool(strip_ansi), bool(xterm256))
+        parsed_string = _PARSE_CACHE.pop(cachekey, None)
+        if parsed_string is not None:
+            # move it last, as the most recently used
+            _PARSE_CACHE[cachekey] = parsed_string
+            _PARSE_CACHE_STATS["hits"] += 1
+            return parsed_string
+        _PARSE_CACHE_STATS["misses"] += 1
+
+        parsed_string = self.sub_tokens(utils.to_str(string), strip_ansi=strip_ansi, xterm256=xterm256)
+
+        # cache and drop the least recently used parsing
+        _PARSE_CACHE[cachekey] = parsed_string
+        if len(_PARSE_CACHE) > _PARSE_CACHE_SIZE:
+            _PARSE_CACHE.popitem(last=False)
 
-        self.do_xterm256 = xterm256
-        in_string = utils.to_str(string)
+        return parsed_string
 
-        # do string replacement
-        parsed_string =  ""
-        parts = self.ansi_escapes.split(in_string) + [" "]
-        for part, sep in zip(parts[::2], parts[1::2]):
-            pstring = self.xterm256_sub.sub(self.sub_xterm256, part)
-            pstring = self.ansi_sub.sub(self.sub_ansi, pstring)
-            parsed_string += "%s%s" % (pstring, sep[0].strip())
+    def sub_tokens(self, string, strip_ansi=False, xterm256=False):
+        """
+        Replaces all markup in string in one pass over it. This does
+        the work of parse_ansi, without caching.
 
+        strip_ansi flag instead removes all ansi markup, as well as
+        all ansi codes manually inserted in string.
+        """
+        token_regex, token_xterm256, token_ansi, token_strip, _ = self._get_tokens()
+        # every second part is a token
+        parts = token_regex.split(string)
         if strip_ansi:
-            # remove all ansi codes (including those manually
-            # inserted in string)
-            return self.strip_raw_codes(parsed_string)
-
-         # cache and crop old cache
-        _PARSE_CACHE[cachekey] = parsed_string
-        if len(_PARSE_CACHE) > _PARSE_CACHE_SIZE:
-           _PARSE_CACHE.popitem(last=False)
+            get = token_strip.get
+            parts[1::2] = [get(token, "") for token in parts[1::2]]
+        else:
+            get = (token_xterm256 if xterm256 else token_ansi).get
+            parts[1::2] = [get(token, token) for token in parts[1::2]]
+        return "".join(parts)
+
+    def parse_indexed(self, string, decoded=False):
+        """
+        Parses string in one pass, for ANSIString. Returns the parsed
+        string, the clean string (without ansi codes) and the lists of
+        indexes of the ansi code characters and of the readable
+        characters in the parsed string.
+
+        decoded flag means the string is already parsed; its ansi
+        codes are then only located, not parsed again.
+        """
+        token_regex, _, table, _, codes = self._get_tokens()
+        regex = self.ansi_regex if decoded else token_regex
+        parsed, clean, code_indexes, char_indexes = [], [], [], []
+        pos = last = 0
+        for match in regex.finditer(string):
+            start = match.start()
+            if start > last:
+                text = string[last:start]
+                parsed.append(text)
+                clean.append(text)
+                char_indexes.extend(range(pos, pos + len(text)))
+                pos += len(text)
+            token = match.group()
+            replacement = table.get(token, token)
+            if token in codes or token not in table:
+                # ansi codes (markup or already in the string)
+                code_indexes.extend(range(pos, pos + len(replacement)))
+            else:
+                clean.append(replacement)
+                char_indexes.extend(range(pos, pos + len(replacement)))
+            parsed.append(replacement)
+            pos += len(replacement)
+            last = match.end()
+        if last < len(string):
+            text = string[last:]
+            parsed.append(text)
+            clean.append(text)
+            char_indexes.extend(range(pos, pos + len(text)))
+        empty = string[:0]
+        return empty.join(parsed), empty.join(clean), code_indexes, char_indexes
 
-        return parsed_string
     # MUX-style mappings %cr %cn etc
 
     mux_ansi_map = [
@@ -319,6 +461,9 @@ class ANSIParser(object):
     # instance of each
     ansi_escapes = re.compile(r"(%s)" % "|".join(ANSI_ESCAPES), re.DOTALL)
 
+    # single-pass parsing uses one regex matching all markup, with the
+    # replacement of each token looked up in tables; see _get_tokens
+
 ANSI_PARSER = ANSIParser()
 
 
@@ -334,6 +479,16 @@ def parse_ansi(string, strip_ansi=False, parser=ANSI_PARSER, xterm256=False):
     return parser.parse_ansi(string, strip_ansi=strip_ansi, xterm256=xterm256)
 
 
+def parse_cache_stats():
+    """
+    Returns a dict with the size and the number of hits and misses
+    of the cache of parsed strings. In the Portal, these are the
+    texts rendered for the connected clients.
+    """
+    return {"size": len(_PARSE_CACHE), "maxsize": _PARSE_CACHE_SIZE,
+            "hits": _PARSE_CACHE_STATS["hits"], "misses": _PARSE_CACHE_STATS["misses"]}
+
+
 def raw(string):
     """
     Escapes a string into a form which won't be colorized by the ansi parser.
@@ -470,17 +625,16 @@ class ANSIString(unicode):
             string = to_str(string, force_string=True)
         parser = kwargs.get('parser', ANSI_PARSER)
         decoded = kwargs.get('decoded', False) or hasattr(string, '_raw_string')
-        if not decoded:
-            # Completely new ANSI String
-            clean_string = to_unicode(parser.parse_ansi(string, strip_ansi=True))
-            string = parser.parse_ansi(string)
-        elif hasattr(string, '_clean_string'):
+        if hasattr(string, '_clean_string'):
             # It's already an ANSIString
             clean_string = string._clean_string
+            code_indexes, char_indexes = string._code_indexes, string._char_indexes
             string = string._raw_string
         else:
-            # It's a string that has been pre-ansi decoded.
-            clean_string = parser.strip_raw_codes(string)
+            # A completely new ANSI String is parsed, for a string that
+            # has been pre-ansi decoded the codes are only located.
+            string, clean_string, code_indexes, char_indexes = parser.parse_indexed(
+                                                    to_unicode(string), decoded=decoded)
 
         if not isinstance(string, unicode):
             string = string.decode('utf-8')
@@ -490,6 +644,8 @@ class ANSIString(unicode):
         ansi_string = super(ANSIString, cls).__new__(ANSIString, to_str(clean_string), "utf-8")
         ansi_string._raw_string = string
         ansi_string._clean_string = clean_string
+        ansi_string._code_indexes = code_indexes
+        ansi_string._char_indexes = char_indexes
         return ansi_string
 
     def __str__(self):
@@ -534,11 +690,11 @@ class ANSIString(unicode):
 
         Finally, _code_indexes and _char_indexes are defined. These are lookup
         tables for which characters in the raw string are related to ANSI
-        escapes, and which are for the readable text.
+        escapes, and which are for the readable text. They are made by
+        the parser together with the raw and clean strings, in __new__.
         """
         self.parser = kwargs.pop('parser', ANSI_PARSER)
         super(ANSIString, self).__init__()
-        self._code_indexes, self._char_indexes = self._get_indexes()
 
     def __add__(self, other):
         """
@@ -682,31 +838,15 @@ class ANSIString(unicode):
         than one character, since the unicode base class abstracts that away
         from us. However, several readable characters can be placed in a row.
 
-        We must use regexes here to figure out where all the escape sequences
-        are hiding in the string. Then we use the ranges of their starts and
-        ends to create a final, comprehensive list of all indexes which are
-        dedicated to code, and all dedicated to text.
+        The parser finds all the escape sequences in one pass over the
+        string (see ANSIParser.parse_indexed), and makes the final,
+        comprehensive lists of all indexes which are dedicated to code,
+        and all dedicated to text.
 
         It's possible that only one of these tables is actually needed, the
         other assumed to be what isn't in the first.
         """
-        # These are all the indexes which hold code characters.
-        #matches = [(match.start(), match.end())
-        #            for match in self.parser.ansi_regex.finditer(self._raw_string)]
-        #code_indexes = []
-        #         # These are all the indexes which hold code characters.
-        #for start, end in matches:
-        #    code_indexes.extend(range(start, end))
-
-        code_indexes = []
-        for match in self.parser.ansi_regex.finditer(self._raw_string):
-            code_indexes.extend(range(match.start(), match.end()))
-        if not code_indexes:
-            # Plain string, no ANSI codes.
-            return code_indexes, range(0, len(self._raw_string))
-        # all indexes not occupied by ansi codes are normal characters
-        char_indexes = [i for i in range(len(self._raw_string)) if i not in code_indexes]
-        return code_indexes, char_indexes
+        return self.parser.parse_indexed(self._raw_string, decoded=True)[2:]
 
     def _get_interleving(self, index):
         """
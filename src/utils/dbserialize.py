@@ -26,13 +26,14 @@ try:
 except ImportError:
     from pickle import dumps, loads
 from django.db import transaction
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.contenttypes.models import ContentType
 from src.server.models import ServerConfig
 from src.utils.utils import to_str, uses_database
 from src.utils import logger
 
-__all__ = ("to_pickle", "from_pickle", "do_pickle", "do_unpickle")
+__all__ = ("to_pickle", "from_pickle", "do_pickle", "do_unpickle", "flush")
 
 PICKLE_PROTOCOL = 2
 
@@ -44,6 +45,11 @@ _FROM_MODEL_MAP = None
 _TO_MODEL_MAP = None
 _TO_TYPECLASS = lambda o: hasattr(o, 'typeclass') and o.typeclass or o
 _IS_PACKED_DBOBJ = lambda o: type(o) == tuple and len(o) == 4 and o[0] == '__packed_dbobj__'
+_COALESCE_SAVES = settings.ATTRIBUTE_COALESCE_SAVES
+# changed root mutables waiting to be saved, keyed on id(db_obj)
+_DIRTY_ROOTS = {}
+_FLUSH_CALL = None
+_REACTOR = None
 if uses_database("mysql") and ServerConfig.objects.get_mysql_db_version() < '5.6.4':
     # mysql <5.6.4 don't support millisecond precision
     _DATESTRING = "%Y:%m:%d-%H:%M:%S:000000"
@@ -107,6 +113,8 @@ class _SaverMutable(object):
         if self._parent:
             self._parent._save_tree()
         elif self._db_obj:
+            if _COALESCE_SAVES and _mark_dirty(self):
+                return
             self._db_obj.value = self
         else:
             logger.log_errmsg("_SaverMutable %s has no root Attribute to save to." % self)
@@ -203,6 +211,61 @@ class _SaverSet(_SaverMutable, MutableSet):
     def discard(self, value):
         self._data.discard(value)
 
+
+def _mark_dirty(root):
+    """
+    Remember that the root mutable has changed, instead of saving
+    it right away. All changes made during the same reactor tick
+    (such as while running one command) are then saved together by
+    flush(). Returns False if the reactor is not running (like when
+    running outside the server), in which case the caller should
+    save directly.
+    """
+    global _FLUSH_CALL, _REACTOR
+    if not _REACTOR:
+        from twisted.internet import reactor as _REACTOR
+    if not _REACTOR.running:
+        return False
+    _DIRTY_ROOTS[id(root._db_obj)] = root
+    if not _FLUSH_CALL:
+        _FLUSH_CALL = _REACTOR.callLater(0, flush)
+    return True
+
+
+def discard(db_obj):
+    """
+    Forget unsaved changes to nested mutables stored on db_obj.
+    This is used when db_obj gets a new value or is deleted.
+    """
+    _DIRTY_ROOTS.pop(id(db_obj), None)
+
+
+def flush(db_obj=None):
+    """
+    Save all changes to nested mutables (obj.db.mylist.append(2)
+    etc) which are not yet stored to the database. This happens
+    automatically at the end of each command and reactor tick, so
+    this only needs to be called if the database must be up-to-date
+    immediately (like before accessing it from another process).
+
+    db_obj - only save changes to this object (normally an Attribute)
+    """
+    global _FLUSH_CALL
+    if db_obj is not None:
+        root = _DIRTY_ROOTS.pop(id(db_obj), None)
+        if root is not None:
+            root._db_obj.value = root
+        return
+    if _FLUSH_CALL and _FLUSH_CALL.active():
+        _FLUSH_CALL.cancel()
+    _FLUSH_CALL = None
+    while _DIRTY_ROOTS:
+        root = _DIRTY_ROOTS.popitem()[1]
+        try:
+            root._db_obj.value = root
+        except Exception:
+            logger.log_trace("Could not save %s to %s." % (root, root._db_obj))
+
 #
 # serialization helpers
 #
@@ -247,6 +310,35 @@ def unpack_dbobj(item):
 # Access methods
 #
 
+# types that are stored as-is, and flat containers of them
+_SIMPLE_TYPES = frozenset((str, unicode, int, long, float, bool, type(None)))
+_FLAT_SEQUENCES = {tuple: tuple, list: list, set: set,
+                   _SaverList: list, _SaverSet: set}
+_FLAT_MAPPINGS = {dict: dict, _SaverDict: dict}
+
+
+def is_flat(data):
+    """
+    Check if data is a primitive (string, number, bool or None) or
+    a list, tuple, set or dict containing only primitives. Such
+    data holds no database objects nor nested mutables, so it needs
+    no processing to be pickled or unpickled.
+    """
+    dtype = type(data)
+    if dtype in _SIMPLE_TYPES:
+        return True
+    elif dtype in _FLAT_SEQUENCES:
+        if dtype in (_SaverList, _SaverSet):
+            data = data._data
+        return all(type(val) in _SIMPLE_TYPES for val in data)
+    elif dtype in _FLAT_MAPPINGS:
+        if dtype == _SaverDict:
+            data = data._data
+        return all(type(key) in _SIMPLE_TYPES and type(val) in _SIMPLE_TYPES
+                   for key, val in data.iteritems())
+    return False
+
+
 def to_pickle(data):
     """
     This prepares data on arbitrary form to be pickled. It handles any nested
@@ -255,6 +347,18 @@ def to_pickle(data):
     We also convert any Saver*-type objects back to their normal
     representations, they are not pickle-safe.
     """
+    if is_flat(data):
+        # fast path - only copy mutable containers
+        dtype = type(data)
+        if dtype in _SIMPLE_TYPES or dtype == tuple:
+            return data
+        plain = _FLAT_SEQUENCES.get(dtype) or _FLAT_MAPPINGS[dtype]
+        return plain(data._data if isinstance(data, _SaverMutable) else data)
+    return _to_pickle(data)
+
+
+def _to_pickle(data):
+    "Full conversion of data to its pickle-safe form, see to_pickle"
     def process_item(item):
         "Recursive processor and identification of data"
         dtype = type(item)
@@ -278,7 +382,6 @@ def to_pickle(data):
     return process_item(data)
 
 
-@transaction.autocommit
 def from_pickle(data, db_obj=None):
     """
     This should be fed a just de-pickled data object. It will be converted back
@@ -295,6 +398,31 @@ def from_pickle(data, db_obj=None):
     to their _SaverList, _SaverDict and _SaverSet counterparts.
 
     """
+    dtype = type(data)
+    if dtype in _SIMPLE_TYPES:
+        return data
+    elif dtype in (tuple, list, dict, set) and is_flat(data):
+        # fast path - no database objects or nested mutables to handle
+        if dtype == tuple:
+            return data
+        elif not db_obj:
+            return dtype(data)
+        elif dtype == list:
+            dat = _SaverList(db_obj=db_obj)
+            dat._data.extend(data)
+        elif dtype == dict:
+            dat = _SaverDict(db_obj=db_obj)
+            dat._data.update(data)
+        else:
+            dat = _SaverSet(db_obj=db_obj)
+            dat._data.update(data)
+        return dat
+    return _from_pickle(data, db_obj=db_obj)
+
+
+@transaction.autocommit
+def _from_pickle(data, db_obj=None):
+    "Full conversion of data from its pickled form, see from_pickle"
     def process_item(item):
         "Recursive processor and identification of data"
         dtype = type(item)
@@ -0,0 +1,265 @@
+"""
+Micro-benchmarks for hot code paths in Evennia.
+
+These compare the per-call cost of optimized code paths with the
+implementations they replaced. Run this module directly from the
+game/ directory to print the results:
+
+    python ../src/utils/dummyrunner/benchmarks.py
+
+Each benchmark prints the time per call in microseconds for the
+old and new implementation.
+
+"""
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+os.environ["DJANGO_SETTINGS_MODULE"] = "game.settings"
+from timeit import repeat
+
+NUM = 10000
+
+
+def _report(name, old_func, new_func, number=NUM):
+    """
+    Time old_func and new_func (callables without arguments) and
+    print the best time per call of each.
+    """
+    old_time = min(repeat(old_func, number=number, repeat=3)) / number * 1e6
+    new_time = min(repeat(new_func, number=number, repeat=3)) / number * 1e6
+    print "%-40s old: %8.2f us  new: %8.2f us  (x%.1f)" % (name, old_time, new_time,
+                                                          old_time / new_time if new_time else 0)
+
+
+#------------------------------------------------------------
+# Lock checks
+#------------------------------------------------------------
+
+def bench_lockhandler():
+    """
+    Compare LockHandler.check() with compiled locks against the
+    old approach of calling all lock functions and eval():ing the
+    result into the lock's evalstring.
+    """
+    from src.locks.lockhandler import LockHandler
+
+    class _Obj(object):
+        "Minimal lock-carrying object"
+        def __init__(self, lock_storage):
+            self.lock_storage = lock_storage
+            self.locks = LockHandler(self)
+
+    obj = _Obj("cmd:all();call:true();edit:false() or none() or all();"
+               "get:false() and true()")
+    caller = _Obj("")
+    caller.locks.lock_bypass = False
+
+    # the (evalstring, func_tup, raw_string) of each lock, as used
+    # by the old check
+    old_locks = dict((access_type, lockdef[:3]) for access_type, lockdef in obj.locks.locks.items())
+
+    def old_check(access_type):
+        evalstring, func_tup, raw_string = old_locks[access_type]
+        true_false = tuple(bool(tup[0](caller, obj, *tup[1], **tup[2])) for tup in func_tup)
+        return eval(evalstring % true_false)
+
+    for access_type in ("cmd", "edit", "get"):
+        _report("LockHandler.check(%s)" % access_type,
+                lambda: old_check(access_type),
+                lambda: obj.locks.check(caller, access_type))
+
+
+#------------------------------------------------------------
+# Attribute serialization
+#------------------------------------------------------------
+
+def bench_dbserialize():
+    """
+    Compare the fast path of to_pickle/from_pickle for primitives
+    and flat containers with the full recursive conversion, as well
+    as cached Attribute.value reads with converting on every read.
+    """
+    from src.utils import dbserialize
+    from src.typeclasses.models import Attribute
+
+    class _DbObj(object):
+        "Stand-in for the Attribute the Saver* mutables save to"
+        value = None
+
+    db_obj = _DbObj()
+    payloads = (("int", 100),
+                ("string", "A tall, hooded figure in a dark robe."),
+                ("flat list", range(20)),
+                ("flat dict", {"str": 12, "dex": 14, "con": 10, "wis": 8}))
+    for name, payload in payloads:
+        _report("to_pickle(%s)" % name,
+                lambda: dbserialize._to_pickle(payload),
+                lambda: dbserialize.to_pickle(payload))
+        _report("from_pickle(%s)" % name,
+                lambda: dbserialize._from_pickle(payload, db_obj=db_obj),
+                lambda: dbserialize.from_pickle(payload, db_obj=db_obj))
+
+    attr = Attribute(db_key="health", db_value=100)
+    _report("Attribute.value (int)",
+            lambda: dbserialize._from_pickle(attr.db_value, db_obj=attr),
+            lambda: attr.value)
+
+
+#------------------------------------------------------------
+# Server <-> Portal transport
+#------------------------------------------------------------
+
+def bench_ampstream():
+    """
+    Compare the throughput of streaming a long message over AMP
+    (pack, chunk, reassemble and unpack) with the old way of
+    splitting every kwarg into parts and joining them again.
+    """
+    from src.server.amp import MAXLEN
+    from src.server.ampstream import pack_frame, unpack_frame, iter_chunks, StreamAssembler
+
+    def old_stream(kwargs):
+        to_send = [(key, [string[i:i+MAXLEN] for i in range(0, len(string), MAXLEN)])
+                   for key, string in kwargs.items()]
+        nparts = max(len(part[1]) for part in to_send)
+        buf = []
+        for ipart in range(nparts):
+            part_kwargs = {}
+            for key, str_part in to_send:
+                try:
+                    part_kwargs[key] = str_part[ipart]
+                except IndexError:
+                    part_kwargs[key] = ""
+            buf.append(part_kwargs)
+        return dict((key, "".join(kw[key] for kw in buf)) for key in kwargs)
+
+    def new_stream(kwargs):
+        frame = pack_frame(**kwargs)
+        size = len(frame)
+        if size <= MAXLEN:
+            return unpack_frame(frame)
+        assembler = StreamAssembler()
+        for offset, chunk in iter_chunks(frame, MAXLEN):
+            result = assembler.add(1, offset, size, chunk)
+        return result
+
+    for name, size, number in (("1 KB", 1024, 10000), ("64 KB", 65536, 1000),
+                               ("1 MB", 1024 * 1024, 50)):
+        kwargs = {"msg": "x" * size, "data": "data"}
+        old_time = min(repeat(lambda: old_stream(kwargs), number=number, repeat=3)) / number
+        new_time = min(repeat(lambda: new_stream(kwargs), number=number, repeat=3)) / number
+        print "%-40s old: %8.1f MB/s  new: %8.1f MB/s" % ("AMP stream (%s)" % name,
+                                                          size / old_time / 1e6,
+                                                          size / new_time / 1e6)
+
+
+#------------------------------------------------------------
+# ANSI parsing
+#------------------------------------------------------------
+
+def bench_ansi():
+    """
+    Compare the single-pass ANSI tokenizer with the chained regex
+    substitutions it replaced, for parsing (without the parse cache)
+    and for creating ANSIStrings, on coloured ANSI art and on plain
+    text.
+    """
+    from src.utils import ansi
+
+    parser = ansi.ANSI_PARSER
+
+    def old_parse(string, strip_ansi=False, xterm256=False):
+        parser.do_xterm256 = xterm256
+        parsed_string = ""
+        parts = parser.ansi_escapes.split(string) + [" "]
+        for part, sep in zip(parts[::2], parts[1::2]):
+            pstring = parser.xterm256_sub.sub(parser.sub_xterm256, part)
+            pstring = parser.ansi_sub.sub(parser.sub_ansi, pstring)
+            parsed_string += "%s%s" % (pstring, sep[0].strip())
+        if strip_ansi:
+            return parser.strip_raw_codes(parsed_string)
+        return parsed_string
+
+    def old_ansistring(string):
+        clean_string = old_parse(string, strip_ansi=True).decode("utf-8")
+        raw_string = old_parse(string).decode("utf-8")
+        code_indexes = []
+        for match in parser.ansi_regex.finditer(raw_string):
+            code_indexes.extend(range(match.start(), match.end()))
+        char_indexes = [i for i in range(len(raw_string)) if i not in code_indexes]
+        return raw_string, clean_string, code_indexes, char_indexes
+
+    art = "\n".join("{r  /\\{y~~{g**{c||{b..{m''{n  {[b{w%s{n  {500#{050#{005#{n" % ("*" * 20)
+                     for _ in range(20))
+    plain = "A dusty old classroom, its desks pushed against the walls. " * 20
+    for name, string in (("ANSI art", art), ("plain text", plain)):
+        _report("parse_ansi(%s)" % name,
+                lambda: old_parse(string),
+                lambda: parser.sub_tokens(string), number=1000)
+        _report("parse_ansi(%s, xterm256)" % name,
+                lambda: old_parse(string, xterm256=True),
+                lambda: parser.sub_tokens(string, xterm256=True), number=1000)
+        _report("ANSIString(%s)" % name,
+                lambda: old_ansistring(string),
+                lambda: parser.parse_indexed(string.decode("utf-8")), number=20)
+
+
+#------------------------------------------------------------
+# Typeclass attribute access
+#------------------------------------------------------------
+
+def bench_typeclass_getattr():
+    """
+    Compare attribute access on a typeclass using the attribute
+    resolution cache with the old lookup, which always tried the
+    typeclass first and caught the AttributeError before trying
+    the dbobj. Measured for a dbobj property (like obj.key), a
+    plain dbobj attribute and a method on the typeclass itself.
+    """
+    from src.typeclasses.typeclass import TypeClass
+    _GA = object.__getattribute__
+
+    class _DbObj(object):
+        "Stand-in for the database model"
+        def __init__(self):
+            self.db_key = "Benchmark"
+        def __key_get(self):
+            return _GA(self, "db_key")
+        key = property(__key_get)
+
+    class _Typeclass(TypeClass):
+        "Typeclass using the resolution cache"
+        def at_bench(self):
+            pass
+
+    class _OldTypeclass(_Typeclass):
+        "Typeclass with the old __getattribute__"
+        def __getattribute__(self, propname):
+            if propname.startswith('__') and propname.endswith('__'):
+                return _GA(self, propname)
+            try:
+                return _GA(self, propname)
+            except AttributeError:
+                return _GA(_GA(self, 'dbobj'), propname)
+
+    def make(cls):
+        # bypass __init__, the dbobj is not a real TypedObject
+        typeclass = object.__new__(cls)
+        object.__setattr__(typeclass, "dbobj", _DbObj())
+        object.__setattr__(typeclass, "typeclass", typeclass)
+        return typeclass
+
+    old, new = make(_OldTypeclass), make(_Typeclass)
+    _report("typeclass.key (dbobj property)",
+            lambda: old.key, lambda: new.key, number=100000)
+    _report("typeclass.db_key (dbobj attribute)",
+            lambda: old.db_key, lambda: new.db_key, number=100000)
+    _report("typeclass.at_bench (typeclass method)",
+            lambda: old.at_bench, lambda: new.at_bench, number=100000)
+
+
+if __name__ == "__main__":
+    bench_lockhandler()
+    bench_dbserialize()
+    bench_ampstream()
+    bench_ansi()
+    bench_typeclass_getattr()
@@ -4,14 +4,21 @@ Django ID mapper
 Modified for Evennia by making sure that no model references
 leave caching unexpectedly (no use of WeakRefs).
 
-Also adds cache_size() for monitoring the size of the cache.
+Also adds cache_size() for monitoring the size of the cache. Each
+model's cache can optionally be bounded (settings.IDMAPPER_CACHE_MAXNUM),
+evicting its least recently used instances when full; cache_stats()
+reports hits, misses and evictions per model.
 """
 
 import os, threading, gc, time
-#from twisted.internet import reactor
+from twisted.internet import reactor
 #from twisted.internet.threads import blockingCallFromThread
 from weakref import WeakValueDictionary
+from collections import OrderedDict
+from itertools import islice
 from twisted.internet.reactor import callFromThread
+from django.conf import settings
+from django.db import transaction
 from django.core.exceptions import ObjectDoesNotExist, FieldError
 from django.db.models.base import Model, ModelBase
 from django.db.models.signals import post_save, pre_delete, post_syncdb
@@ -21,6 +28,14 @@ from src.utils.utils import dbref, get_evennia_pids, to_str
 from manager import SharedMemoryManager
 
 AUTO_FLUSH_MIN_INTERVAL = 60.0 * 5 # at least 5 mins between cache flushes
+# part of the cache evicted when the memory cap is reached
+_MEMORY_EVICT_FRACTION = 0.25
+
+# Max number of instances cached per model. When exceeded, the least
+# recently used instances are evicted (plus some slack, so we don't
+# need to evict again for every new instance).
+_CACHE_MAXNUM = settings.IDMAPPER_CACHE_MAXNUM
+_CACHE_EVICT_SLACK = 0.05
 
 _GA = object.__getattribute__
 _SA = object.__setattr__
@@ -39,6 +54,17 @@ _SERVER_PID, _PORTAL_PID = get_evennia_pids()
 _IS_SUBPROCESS = (_SERVER_PID and _PORTAL_PID) and not _SELF_PID in (_SERVER_PID, _PORTAL_PID)
 _IS_MAIN_THREAD = threading.currentThread().getName() == "MainThread"
 
+# Write-behind queue. Saves of single fields are collected here and
+# written together in one transaction instead of one at a time.
+# {(class, pk): (instance, set(fieldnames))}
+_WRITE_BEHIND = settings.DATABASE_WRITE_BEHIND
+_WRITE_BEHIND_INTERVAL = settings.DATABASE_WRITE_BEHIND_INTERVAL / 1000.0
+_WRITE_QUEUE = OrderedDict()
+_WRITE_QUEUE_STATS = {"queued": 0, "coalesced": 0, "written": 0, "flushes": 0}
+_WRITE_FLUSH_CALL = None
+# fields per class that are safe to save late, {class: set(fieldnames)}
+_DEFERRABLE_FIELDS = {}
+
 class SharedMemoryModelBase(ModelBase):
     # CL: upstream had a __new__ method that skipped ModelBase's __new__ if
     # SharedMemoryModelBase was not in the model class's ancestors. It's not
@@ -60,16 +86,19 @@ class SharedMemoryModelBase(ModelBase):
         if instance_key is None:
             return new_instance()
 
-        cached_instance = cls.get_cached_instance(instance_key)
+        cached_instance = cls._lookup_cached_instance(instance_key)
         if cached_instance is None:
             cached_instance = new_instance()
+            cls._idmapper_stats["misses"] += 1
             cls.cache_instance(cached_instance)
         return cached_instance
 
 
     def _prepare(cls):
-        cls.__instance_cache__ = {}
+        # the cache is kept in least-recently-used order
+        cls.__instance_cache__ = OrderedDict()
         cls._idmapper_recache_protection = False
+        cls._idmapper_stats = {"hits": 0, "misses": 0, "evictions": 0}
         super(SharedMemoryModelBase, cls)._prepare()
 
     def __new__(cls, classname, bases, classdict, *args, **kwargs):
@@ -184,6 +213,12 @@ class SharedMemoryModel(Model):
 
     objects = SharedMemoryManager()
 
+    # if instances of this model may be evicted from the cache when it
+    # is full. Models whose instances are also held on to by other
+    # caches (like Attributes by their AttributeHandler) must not be
+    # evicted, or a second instance of the same row could be loaded.
+    _idmapper_evictable = True
+
     class Meta:
         abstract = True
 
@@ -230,15 +265,91 @@ class SharedMemoryModel(Model):
         return cls.__instance_cache__.get(id)
     get_cached_instance = classmethod(get_cached_instance)
 
-    def cache_instance(cls, instance):
+    def _lookup_cached_instance(cls, id):
         """
-        Method to store an instance in the cache.
+        Like get_cached_instance, but used when the instance is
+        actually asked for (rather than just checked for). Found
+        instances count as cache hits and become the most recently
+        used ones.
         """
-        if instance._get_pk_val() is not None:
+        cache = cls.__instance_cache__
+        instance = cache.get(id)
+        if instance is not None:
+            cls._idmapper_stats["hits"] += 1
+            del cache[id]
+            cache[id] = instance
+        return instance
+    _lookup_cached_instance = classmethod(_lookup_cached_instance)
 
-            cls.__instance_cache__[instance._get_pk_val()] = instance
+    def cache_instance(cls, instance):
+        """
+        Method to store an instance in the cache. If this makes
+        the cache grow beyond settings.IDMAPPER_CACHE_MAXNUM, the
+        least recently used instances are evicted.
+        """
+        pk = instance._get_pk_val()
+        if pk is not None:
+            cache = cls.__instance_cache__
+            if pk not in cache:
+                cache[pk] = instance
+                if _CACHE_MAXNUM and len(cache) > _CACHE_MAXNUM and cls._idmapper_evictable:
+                    cls.evict_cached_instances(len(cache) - _CACHE_MAXNUM + int(_CACHE_MAXNUM * _CACHE_EVICT_SLACK))
+            elif cache[pk] is not instance:
+                cache[pk] = instance
     cache_instance = classmethod(cache_instance)
 
+    def evict_cached_instances(cls, num):
+        """
+        Evict (at most) num of the least recently used instances
+        from the cache. Instances pinned by the model (see
+        get_idmapper_pinned), waiting in the write-behind queue or
+        refusing through their at_idmapper_flush hook are kept; they are moved to the most
+        recently used end so they are not looked at again soon.
+
+        Returns the number of evicted instances.
+        """
+        if not cls._idmapper_evictable:
+            return 0
+        cache = cls.__instance_cache__
+        pinned = cls.get_idmapper_pinned()
+        evict, keep = [], []
+        # the most recently used instance is never evicted, it
+        # is usually the one just being cached
+        for pk, instance in islice(cache.iteritems(), len(cache) - 1):
+            if len(evict) >= num:
+                break
+            if pk in pinned or (cls, pk) in _WRITE_QUEUE or not instance.at_idmapper_flush():
+                keep.append(pk)
+            else:
+                evict.append(pk)
+        for pk in evict:
+            del cache[pk]
+        for pk in keep:
+            cache[pk] = cache.pop(pk)
+        cls._idmapper_stats["evictions"] += len(evict)
+        return len(evict)
+    evict_cached_instances = classmethod(evict_cached_instances)
+
+    def get_idmapper_pinned(cls):
+        """
+        Returns a container with the pks of cached instances that
+        must not be evicted from the cache. Overload to protect
+        instances in use, like objects puppeted by a session.
+        """
+        return ()
+    get_idmapper_pinned = classmethod(get_idmapper_pinned)
+
+    def get_cache_stats(cls):
+        """
+        Returns the number of cached instances and the cache hits,
+        misses and evictions of this model.
+        """
+        stats = dict(cls._idmapper_stats)
+        stats["size"] = len(cls.__instance_cache__)
+        stats["maxsize"] = _CACHE_MAXNUM if cls._idmapper_evictable else None
+        return stats
+    get_cache_stats = classmethod(get_cache_stats)
+
     def get_all_cached_instances(cls):
         "return the objects so far cached by idmapper for this class."
         return cls.__instance_cache__.values()
@@ -273,15 +384,29 @@ class SharedMemoryModel(Model):
     def flush_instance_cache(cls, force=False):
         """
         This will clean safe objects from the cache. Use force
-        keyword to remove all objects, safe or not.
+        keyword to remove all objects, safe or not. Instances with
+        saves waiting in the write-behind queue are kept (or, with
+        force, saved first) so they are not reloaded with old data.
         """
         if force:
-            cls.__instance_cache__ = {}
+            if _WRITE_QUEUE:
+                flush_write_queue()
+            cls.__instance_cache__ = OrderedDict()
         else:
-            cls.__instance_cache__ = dict((key, obj) for key, obj in cls.__instance_cache__.items()
-                                                      if obj._idmapper_recache_protection)
+            cls.__instance_cache__ = OrderedDict((key, obj) for key, obj in cls.__instance_cache__.items()
+                                                      if obj._idmapper_recache_protection
+                                                      or (cls, key) in _WRITE_QUEUE)
     flush_instance_cache = classmethod(flush_instance_cache)
 
+    def at_idmapper_flush(cls):
+        """
+        Called when this instance is about to be evicted from the
+        cache to make room for others. Returning False keeps it
+        cached. By default instances with recache protection (like
+        those storing non-persistent attributes) are kept.
+        """
+        return not cls._idmapper_recache_protection
+
     def save(cls, *args, **kwargs):
         "save method tracking process/thread issues"
 
@@ -294,7 +419,12 @@ class SharedMemoryModel(Model):
 
         if _IS_MAIN_THREAD:
             # in main thread - normal operation
+            if _WRITE_BEHIND and not _IS_SUBPROCESS and not args and _queue_save(cls, **kwargs):
+                return
             super(SharedMemoryModel, cls).save(*args, **kwargs)
+            if _WRITE_QUEUE and not kwargs.get("update_fields"):
+                # a full save also stores any queued fields
+                _WRITE_QUEUE.pop((cls.__class__, cls._get_pk_val()), None)
         else:
             # in another thread; make sure to save in reactor thread
             def _save_callback(cls, *args, **kwargs):
@@ -303,6 +433,87 @@ class SharedMemoryModel(Model):
             callFromThread(_save_callback, cls, *args, **kwargs)
 
 
+def _queue_save(instance, update_fields=None, **kwargs):
+    """
+    Add a save of the given fields to the write-behind queue rather
+    than saving it right away. Only saves of existing instances with
+    explicit update_fields are queued, and only if none of the fields
+    are used for looking up objects (foreign keys, indexed or unique
+    fields) - those must be in the database at once for searches to
+    work. Returns False if the save must happen directly.
+
+    Queued instances are pinned in the idmapper cache until they are
+    saved (see evict_cached_instances and flush_instance_cache).
+    Note that post_save signals, and with them the field post-save
+    hooks (_at_<field>_postsave, like tracker updates), are delayed
+    until the queue is flushed.
+    """
+    if kwargs or not update_fields or not reactor.running:
+        return False
+    pk = instance._get_pk_val()
+    if pk is None:
+        return False
+    cls = instance.__class__
+    deferrable = _DEFERRABLE_FIELDS.get(cls)
+    if deferrable is None:
+        deferrable = set(field.name for field in cls._meta.fields
+                         if not (field.primary_key or field.rel or field.db_index or field.unique))
+        _DEFERRABLE_FIELDS[cls] = deferrable
+    if not deferrable.issuperset(update_fields):
+        return False
+
+    global _WRITE_FLUSH_CALL
+    key = (cls, pk)
+    if key in _WRITE_QUEUE:
+        _WRITE_QUEUE[key][1].update(update_fields)
+        _WRITE_QUEUE_STATS["coalesced"] += 1
+    else:
+        _WRITE_QUEUE[key] = (instance, set(update_fields))
+    _WRITE_QUEUE_STATS["queued"] += 1
+    if not _WRITE_FLUSH_CALL:
+        _WRITE_FLUSH_CALL = reactor.callLater(_WRITE_BEHIND_INTERVAL, flush_write_queue)
+    return True
+
+
+def flush_write_queue():
+    """
+    Save everything in the write-behind queue, using one
+    transaction. This is called regularly (as set by
+    settings.DATABASE_WRITE_BEHIND_INTERVAL), after each command
+    and when the server reloads or shuts down. Call it directly if
+    the database must be up-to-date at once.
+    """
+    global _WRITE_FLUSH_CALL
+    if _WRITE_FLUSH_CALL and _WRITE_FLUSH_CALL.active():
+        _WRITE_FLUSH_CALL.cancel()
+    _WRITE_FLUSH_CALL = None
+    if not _WRITE_QUEUE:
+        return
+    queue = _WRITE_QUEUE.values()
+    _WRITE_QUEUE.clear()
+    with transaction.commit_on_success():
+        for instance, fieldnames in queue:
+            try:
+                super(SharedMemoryModel, instance).save(update_fields=list(fieldnames))
+            except Exception:
+                logger.log_trace("Write-behind save of %s failed." % instance)
+    _WRITE_QUEUE_STATS["written"] += len(queue)
+    _WRITE_QUEUE_STATS["flushes"] += 1
+
+
+def write_queue_stats():
+    """
+    Returns statistics about the write-behind queue as a dict
+    with keys enabled, pending, queued, coalesced (saves merged
+    into an already queued save of the same instance), written
+    and flushes.
+    """
+    stats = dict(_WRITE_QUEUE_STATS)
+    stats["enabled"] = _WRITE_BEHIND
+    stats["pending"] = len(_WRITE_QUEUE)
+    return stats
+
+
 class WeakSharedMemoryModelBase(SharedMemoryModelBase):
     """
     Uses a WeakValue dictionary for caching instead of a regular one
@@ -360,6 +571,15 @@ def flush_cached_instance(sender, instance, **kwargs):
 pre_delete.connect(flush_cached_instance)
 
 
+def discard_queued_save(sender, instance, **kwargs):
+    """
+    Make sure not to save deleted instances from the write-behind queue
+    """
+    if _WRITE_QUEUE:
+        _WRITE_QUEUE.pop((instance.__class__, instance._get_pk_val()), None)
+pre_delete.connect(discard_queued_save)
+
+
 def update_cached_instance(sender, instance, **kwargs):
     """
     Re-cache the given instance in the idmapper cache
@@ -373,7 +593,8 @@ post_save.connect(update_cached_instance)
 LAST_FLUSH = None
 def conditional_flush(max_rmem, force=False):
     """
-    Flush the cache if the estimated memory usage exceeds max_rmem.
+    Shrink the cache if the estimated memory usage exceeds max_rmem
+    (this evicts the least recently used part of every model cache).
 
     The flusher has a timeout to avoid flushing over and over
     in particular situations (this means that for some setups
@@ -424,11 +645,44 @@ def conditional_flush(max_rmem, force=False):
     actual_rmem = float(os.popen('ps -p %d -o %s | tail -1' % (os.getpid(), "rss")).read()) / 1000.0  # resident memory
 
     if Ncache >= Ncache_max and actual_rmem > max_rmem * 0.9:
-        # flush cache when number of objects in cache is big enough and our
-        # actual memory use is within 10% of our set max
-        flush_cache()
+        # shrink the caches when number of objects in cache is big enough
+        # and our actual memory use is within 10% of our set max. Only
+        # the least recently used part is evicted, to avoid having to
+        # reload everything from the database at once.
+        evict_cache(_MEMORY_EVICT_FRACTION)
         LAST_FLUSH = now
 
+def _leaf_models():
+    "Yield all concrete SharedMemoryModel subclasses"
+    def get_recurse(submodels):
+        for submodel in submodels:
+            subclasses = submodel.__subclasses__()
+            if not subclasses:
+                yield submodel
+            else:
+                for subclass in get_recurse(subclasses):
+                    yield subclass
+    return get_recurse(SharedMemoryModel.__subclasses__())
+
+
+def evict_cache(fraction):
+    """
+    Evict the given fraction (0..1) of every model's cache, least
+    recently used instances first. Protected instances are kept.
+    Returns the number of evicted instances.
+    """
+    return sum(model.evict_cached_instances(int(len(model.get_all_cached_instances()) * fraction))
+               for model in _leaf_models())
+
+
+def cache_stats():
+    """
+    Returns {modelname: {"size", "maxsize", "hits", "misses",
+    "evictions"}} for all models.
+    """
+    return dict((model.__name__, model.get_cache_stats()) for model in _leaf_models())
+
+
 def cache_size(mb=True):
     """
     Calculate statistics about the cache.
@@ -34,7 +34,7 @@ class SharedMemoryManager(Manager):
             if key.endswith('__exact'):
                 key = key[:-len('__exact')]
             if key in ('pk', self.model._meta.pk.attname):
-                inst = self.model.get_cached_instance(kwargs[items[0]])
+                inst = self.model._lookup_cached_instance(kwargs[items[0]])
         if inst is None:
             inst = super(SharedMemoryManager, self).get(**kwargs)
         return inst
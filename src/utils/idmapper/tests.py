@@ -67,4 +67,58 @@ class SharedMemorysTest(TestCase):
         article.delete()
         self.assertEquals(pk not in Article.__instance_cache__, True)
         
-        
\ No newline at end of file
+        
+    def testWriteBehindFlush(self):
+        import base
+        article = Article.objects.all()[0:1].get()
+        article.name = "Queued"
+        base._WRITE_QUEUE[(Article, article.pk)] = (article, set(["name"]))
+        base.flush_write_queue()
+        self.assertEquals(len(base._WRITE_QUEUE), 0)
+        self.assertEquals(Article.objects.filter(name="Queued").count(), 1)
+
+    def testWriteBehindPinned(self):
+        import base
+        Article.flush_instance_cache(force=True)
+        article_list = list(Article.objects.all())
+        queued = article_list[0]
+        base._WRITE_QUEUE[(Article, queued.pk)] = (queued, set(["name"]))
+        try:
+            Article.evict_cached_instances(len(article_list))
+            self.assertEquals(Article.get_cached_instance(queued.pk) is queued, True)
+            Article.flush_instance_cache()
+            self.assertEquals(Article.get_cached_instance(queued.pk) is queued, True)
+        finally:
+            base._WRITE_QUEUE.clear()
+
+    def testCacheEviction(self):
+        import base
+        maxnum, base._CACHE_MAXNUM = base._CACHE_MAXNUM, 5
+        try:
+            Article.flush_instance_cache(force=True)
+            protected = Article.objects.all()[0:1].get()
+            protected.set_recache_protection()
+            article_list = list(Article.objects.all())
+            self.assertEquals(len(Article.__instance_cache__) <= 5, True)
+            self.assertEquals(protected.pk in Article.__instance_cache__, True)
+            self.assertEquals(article_list[-1].pk in Article.__instance_cache__, True)
+            stats = Article.get_cache_stats()
+            self.assertEquals(stats["evictions"] > 0, True)
+            hits = stats["hits"]
+            Article.objects.get(pk=protected.pk)
+            self.assertEquals(Article.get_cache_stats()["hits"], hits + 1)
+        finally:
+            base._CACHE_MAXNUM = maxnum
+
+    def testCacheEvictionOptOut(self):
+        import base
+        maxnum, base._CACHE_MAXNUM = base._CACHE_MAXNUM, 5
+        Article._idmapper_evictable = False
+        try:
+            Article.flush_instance_cache(force=True)
+            article_list = list(Article.objects.all())
+            self.assertEquals(len(Article.__instance_cache__), len(article_list))
+            self.assertEquals(Article.evict_cached_instances(3), 0)
+        finally:
+            base._CACHE_MAXNUM = maxnum
+            del Article._idmapper_evictable
@@ -15,10 +15,11 @@ contain the 'mode' of the request to be handled by the protocol:
  mode 'receive' - tell the server that we are ready to receive data. This is a
                   long-polling (comet-style) request since the server
                   will not reply until it actually has data available.
-                  The returned data object has two variables 'msg' and 'data'
-                  where msg should be output and 'data' is an arbitrary piece
-                  of data the server and client understands (not used in default
-                  client).
+                  The returned data is a list of all messages buffered
+                  since the last request. Each message is an object with two
+                  variables 'msg' and 'data' where msg should be output and
+                  'data' is an arbitrary piece of data the server and client
+                  understands (not used in default client).
  mode 'input' - the user has input data on some form. The POST request
                 should also contain variables 'msg' and 'data' where
                 the 'msg' is a string and 'data' is an arbitrary piece
@@ -96,7 +97,9 @@ function webclient_receive(){
         // callback methods
 
         success: function(data){       // called when request to waitreceive completes
-            msg_display("out", data.msg);  // Add response to the message area
+            for (var i = 0; i < data.length; i++) {
+                msg_display("out", data[i].msg);  // Add response to the message area
+            }
             webclient_receive();              // immediately start a new request
         },
         error: function(XMLHttpRequest, textStatus, errorThrown){
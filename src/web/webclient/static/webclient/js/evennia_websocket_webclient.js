@@ -6,10 +6,12 @@ The client is composed of two parts:
  src/server/portal/websocket_client.py - the portal-side component
  this file - the javascript component handling dynamic content
 
-messages sent to the client is one of two modes:
+messages sent to the client is one of three modes:
   OOB("func1",args, "func2",args, ...)  - OOB command executions, this will
                                         call unique javascript functions
                                         func1(args), func2(args) etc.
+  MSGS["text1", "text2", ...] - many texts sent together, each is shown
+                                like a normal text output.
   text - any other text is considered a normal text output in the main output window.
 
 */
@@ -106,6 +108,18 @@ function onMessage(evt) {
             }
         }
     }
+    else if (inmsg.length > 4 && inmsg.substr(0, 4) == "MSGS") {
+        // many normal messages sent together
+        try {
+            var msgarray = JSON.parse(inmsg.slice(4));} // everything after MSGS
+        catch(err) {
+            // not JSON packed - a normal text
+            doShow('out', inmsg);
+            return;
+        }
+        for (var ind = 0; ind < msgarray.length; ind++) {
+            doShow('out', msgarray[ind]); }
+    }
     else {
         // normal message
         doShow('out', inmsg); }